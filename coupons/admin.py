@@ -27,15 +27,83 @@
 
 from django import forms
 from django.conf.urls import url
+from django.contrib.admin.views.main import PAGE_VAR
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.forms.models import BaseInlineFormSet
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from fluo import admin
 
-from . import views
-from .models import Campaign, Coupon, CouponUser
+from . import exports, sharding, views
+from .models import ArchivedCoupon, ArchivedCouponUser, Campaign, Coupon, CouponUser, StackingRule
+from .pagination import EstimatedCountPaginator
+from .settings import INLINE_PER_PAGE
 
 
-class CouponUserInline(admin.ReadOnlyTabularInline):
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    per_page = INLINE_PER_PAGE
+    list_select_related = []
+    page_url = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        queryset = self.queryset.select_related(*self.list_select_related)
+        if not queryset.ordered:
+            queryset = queryset.order_by(self.model._meta.pk.name)
+        self.full_queryset = queryset
+        self.queryset = queryset[:self.per_page]
+
+    @cached_property
+    def has_more(self):
+        return self.full_queryset[self.per_page:self.per_page + 1].exists()
+
+    @cached_property
+    def last_pk(self):
+        objects = list(self.get_queryset())
+        return objects[-1].pk if objects else None
+
+
+class PaginatedInlineMixin:
+    """
+    Renders only the first ``per_page`` rows of a read only inline, further rows are loaded on demand from
+    ``views.InlinePageAdminView``, which the parent admin registers with ``get_page_url()``.
+    """
+    formset = PaginatedInlineFormSet
+    template = "admin/coupons/edit_inline/paginated_tabular.html"
+    ordering = ["pk"]
+    per_page = INLINE_PER_PAGE
+    list_select_related = []
+    page_path = None
+    page_url_name = None
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.list_select_related = self.list_select_related
+        if obj is not None and obj.pk is not None:
+            formset.page_url = reverse(
+                "admin:{}".format(self.page_url_name), args=[obj.pk], current_app=self.admin_site.name,
+            )
+        return formset
+
+    def get_page_url(self):
+        """ Returns the url pattern serving the next pages of this inline. """
+        view = views.InlinePageAdminView.as_view(inline=self)
+        return url(r"^(.+)/{}/$".format(self.page_path), self.admin_site.admin_view(view), name=self.page_url_name)
+
+
+class CouponUserInline(PaginatedInlineMixin, admin.ReadOnlyTabularInline):
     model = CouponUser
+    list_select_related = ["user", "source_type"]
+    page_path = "users"
+    page_url_name = "coupons_coupon_users"
 
 
 class CouponAdminForm(forms.ModelForm):
@@ -46,8 +114,10 @@ class CouponAdminForm(forms.ModelForm):
 class CouponAdmin(admin.ModelAdmin):
     form = CouponAdminForm
     generate_coupons_view = views.GenerateCouponsAdminView
+    import_coupons_view = views.ImportCouponsAdminView
     list_display = ["code", "type", "_user_count", "value", "_user_limit", "_is_redeemed", "valid_from", "valid_until", "campaign"]  # noqa: E501
     list_filter = ["type", "action", "campaign", "created_at", "valid_from", "valid_until"]
+    list_select_related = ["campaign"]
     raw_id_fields = []
     search_fields = ["code", "value"]
     inlines = [CouponUserInline]
@@ -55,49 +125,212 @@ class CouponAdmin(admin.ModelAdmin):
         "user": ("pk", "username", "first_name", "last_name", "email"),
         "campaign": ("pk", "name"),
     }
+    ordering = ["pk"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    keyset_var = "after"
+    actions = ["export_csv", "export_csv_gzip", "export_ndjson", "export_ndjson_gzip"]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).with_usage()
+        after = getattr(request, "coupons_after", None)
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        return queryset
+
+    def get_ordering(self, request):
+        if getattr(request, "coupons_after", None) is not None:
+            return ["pk"]
+        return super().get_ordering(request)
+
+    def is_keyset_ordering(self, ordering):
+        """ The keyset link walks the primary key, it only continues a changelist sorted by it. """
+        return bool(ordering) and ordering[0] in ("pk", self.model._meta.pk.name)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Searches codes by case sensitive prefix, with a range condition the code index can serve,
+        and values by equality.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        upper = search_term[:-1] + chr(ord(search_term[-1]) + 1)
+        q = Q(code__gte=search_term, code__lt=upper, code__startswith=search_term)
+        if search_term.isdigit():
+            q |= Q(value=int(search_term))
+        return queryset.filter(q), False
+
+    def changelist_view(self, request, extra_context=None):
+        if self.keyset_var in request.GET:
+            # keyset mode: walk the primary key from the last row seen instead of using OFFSET
+            request.GET = request.GET.copy()
+            try:
+                request.coupons_after = int(request.GET.pop(self.keyset_var)[-1])
+            except ValueError:
+                request.coupons_after = None
+        response = super().changelist_view(request, extra_context=extra_context)
+        cl = getattr(response, "context_data", {}).get("cl")
+        if cl is not None and self.is_keyset_ordering(cl.get_ordering(request, cl.root_queryset)):
+            results = list(cl.result_list)
+            if len(results) >= cl.list_per_page:
+                response.context_data["keyset_next_url"] = cl.get_query_string(
+                    {self.keyset_var: max(coupon.pk for coupon in results)}, [PAGE_VAR, "o"],
+                )
+        return response
+
+    def export(self, request, queryset, format, compress=False):
+        # the changelist annotations are not needed by the export
+        queryset = Coupon.objects.filter(pk__in=queryset.values("pk"))
+        content_type, chunks = exports.export_coupons(queryset, format=format, compress=compress)
+        filename = "coupons-{}.{}{}".format(timezone.now().strftime("%Y%m%d-%H%M%S"), format, ".gz" if compress else "")
+        response = StreamingHttpResponse(chunks, content_type="application/gzip" if compress else content_type)
+        response["Content-Disposition"] = "attachment; filename={}".format(filename)
+        return response
+
+    def export_csv(self, request, queryset):
+        return self.export(request, queryset, "csv")
+    export_csv.short_description = _("Export selected coupons as CSV")
+
+    def export_csv_gzip(self, request, queryset):
+        return self.export(request, queryset, "csv", compress=True)
+    export_csv_gzip.short_description = _("Export selected coupons as gzipped CSV")
+
+    def export_ndjson(self, request, queryset):
+        return self.export(request, queryset, "ndjson")
+    export_ndjson.short_description = _("Export selected coupons as NDJSON")
+
+    def export_ndjson_gzip(self, request, queryset):
+        return self.export(request, queryset, "ndjson", compress=True)
+    export_ndjson_gzip.short_description = _("Export selected coupons as gzipped NDJSON")
 
     def _user_count(self, coupon):
-        return coupon.users.count()
+        return coupon.user_count
     _user_count.short_description = _("user count")
+    _user_count.admin_order_field = "user_count"
 
     def _user_limit(self, coupon):
         return coupon.user_limit
     _user_limit.short_description = _("user limit")
 
     def _is_redeemed(self, coupon):
-        return coupon.is_redeemed
+        return coupon.user_limit != 0 and coupon.redeemed_count >= coupon.user_limit
     _is_redeemed.short_description = _("is redeemed")
 
     def get_urls(self):
         urls = super().get_urls()
         my_urls = [
             url(r"^generate-coupons$", self.admin_site.admin_view(self.generate_coupons_view.as_view()), name="generate_coupons"),  # noqa
+            url(r"^import-coupons$", self.admin_site.admin_view(self.import_coupons_view.as_view()), name="import_coupons"),  # noqa
+            CouponUserInline(self.model, self.admin_site).get_page_url(),
         ]
         return my_urls + urls
 
 
-class CouponInline(admin.ReadOnlyTabularInline):
+class CouponInline(PaginatedInlineMixin, admin.ReadOnlyTabularInline):
     model = Coupon
     exclude = ["created_at", "last_modified_at"]
+    list_select_related = ["campaign"]
+    page_path = "coupons"
+    page_url_name = "coupons_campaign_coupons"
 
 
 @admin.register(Campaign)
 class CampaignAdmin(admin.ModelAdmin):
     list_display = ["name", "num_coupons", "num_coupons_used", "num_coupons_unused", "num_coupons_expired", "created_at"]  # noqa
+    list_filter = ["disabled_at"]
     inlines = [CouponInline]
+    actions = ["disable_campaigns"]
+
+    def get_queryset(self, request):
+        coupons = Coupon.objects.filter(campaign=OuterRef("pk")).order_by()
+
+        def count(queryset):
+            queryset = queryset.values("campaign").annotate(count=Count("pk")).values("count")
+            return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
+
+        return super().get_queryset(request).annotate(
+            coupon_count=count(coupons),
+            used_count=count(coupons.used()),
+            unused_count=count(coupons.unused()),
+            expired_count=count(coupons.expired()),
+        )
 
     def num_coupons(self, obj):
-        return obj.coupons.count()
+        return obj.coupon_count
     num_coupons.short_description = _("coupons")
+    num_coupons.admin_order_field = "coupon_count"
 
     def num_coupons_used(self, obj):
-        return obj.coupons.used().count()
+        return obj.used_count
     num_coupons_used.short_description = _("used")
+    num_coupons_used.admin_order_field = "used_count"
 
     def num_coupons_unused(self, obj):
-        return obj.coupons.unused().count()
+        return obj.unused_count
     num_coupons_unused.short_description = _("unused")
+    num_coupons_unused.admin_order_field = "unused_count"
 
     def num_coupons_expired(self, obj):
-        return obj.coupons.expired().count()
+        return obj.expired_count
     num_coupons_expired.short_description = _("expired")
+    num_coupons_expired.admin_order_field = "expired_count"
+
+    def disable_campaigns(self, request, queryset):
+        count = 0
+        for campaign in queryset.filter(disabled_at__isnull=True):
+            campaign.disable()
+            count += 1
+        self.message_user(request, _(
+            "Disabled {} campaigns, their coupons expired. The purge_campaigns command deletes them."
+        ).format(count))
+    disable_campaigns.short_description = _("Disable selected campaigns")
+
+    def get_deleted_objects(self, objs, request):
+        # the cascade collector would load every coupon, the confirmation only lists the campaigns and counts them
+        campaigns = list(objs)
+        coupons = sum(sharding.fan_out(
+            lambda alias: Coupon.objects.using(alias).filter(campaign__in=campaigns).count()
+        ))
+        perms_needed = set()
+        if not request.user.has_perm("{}.delete_{}".format(Coupon._meta.app_label, Coupon._meta.model_name)):
+            perms_needed.add(Coupon._meta.verbose_name)
+        model_count = {Campaign._meta.verbose_name_plural: len(campaigns), Coupon._meta.verbose_name_plural: coupons}
+        return [str(campaign) for campaign in campaigns], model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        # expire the coupons first, an interrupted purge leaves nothing redeemable behind
+        if obj.disabled_at is None:
+            obj.disable()
+        Campaign.objects.purge(obj)
+
+    def delete_queryset(self, request, queryset):
+        for campaign in queryset:
+            self.delete_model(request, campaign)
+
+    def get_urls(self):
+        return [CouponInline(self.model, self.admin_site).get_page_url()] + super().get_urls()
+
+
+@admin.register(StackingRule)
+class StackingRuleAdmin(admin.ModelAdmin):
+    list_display = ["name", "type", "action", "campaign", "max_coupons", "is_active"]
+    list_filter = ["is_active", "type", "action"]
+    list_select_related = ["campaign"]
+    raw_id_fields = ["campaign"]
+    filter_horizontal = ["excluded_campaigns"]
+
+
+class ArchivedCouponUserInline(admin.ReadOnlyTabularInline):
+    model = ArchivedCouponUser
+    fields = ["user", "redeemed_at", "source_type", "source_id"]
+
+
+@admin.register(ArchivedCoupon)
+class ArchivedCouponAdmin(admin.ReadOnlyModelAdmin):
+    list_display = ["code", "type", "value", "user_limit", "valid_until", "campaign", "archived_at"]
+    list_filter = ["type", "action", "archived_at"]
+    list_select_related = ["campaign"]
+    search_fields = ["code", "normalized_code"]
+    inlines = [ArchivedCouponUserInline]
+    show_full_result_count = False
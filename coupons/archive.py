@@ -0,0 +1,125 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from datetime import timedelta
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from . import cache, sharding
+from .settings import ARCHIVE_RETENTION_DAYS, ROLLUP_ON_REDEEM
+
+COUPON_FIELDS = [
+    "id", "value", "code", "normalized_code", "type", "action", "user_limit", "valid_from", "valid_until",
+    "campaign_id", "created_at",
+]
+COUPON_USER_FIELDS = ["id", "coupon_id", "user_id", "redeemed_at", "source_type_id", "source_id", "created_at"]
+
+
+def get_cutoff(retention_days=None):
+    if retention_days is None:
+        retention_days = ARCHIVE_RETENTION_DAYS
+    return timezone.now() - timedelta(days=retention_days)
+
+
+def get_queryset(cutoff, using=None):
+    """ Returns the coupons of the shard ``using`` expired before ``cutoff``, in primary key order. """
+    from .models import Coupon
+
+    return Coupon.objects.using(using).filter(valid_until__lt=cutoff).order_by("pk")
+
+
+def count_expired(cutoff):
+    """ Returns the number of coupons expired before ``cutoff`` on every shard. """
+    return sum(get_queryset(cutoff, using=alias).count() for alias in sharding.get_shards())
+
+
+def archive_chunk(pks, archived_at=None, using=None):
+    """
+    Copies the coupons ``pks`` and their redemptions to the archive tables and deletes them, in one transaction on
+    the shard ``using``, which keeps the archived rows. Rows are copied with ``values()`` and removed with
+    set-based DELETEs, no instance is loaded.
+    Returns the normalized codes and the campaigns of the archived coupons.
+    """
+    from .models import ArchivedCoupon, ArchivedCouponUser, Coupon, CouponReservation, CouponUser, delete_rows
+
+    using = using or router.db_for_write(Coupon)
+    archived_at = archived_at or timezone.now()
+    with transaction.atomic(using=using):
+        # locking the rows keeps a concurrent redemption from slipping between the copy and the delete
+        coupons = list(
+            Coupon.objects.using(using).select_for_update().filter(pk__in=pks).order_by("pk").values(*COUPON_FIELDS)
+        )
+        pks = [coupon["id"] for coupon in coupons]
+        ArchivedCoupon.objects.using(using).bulk_create([
+            ArchivedCoupon(archived_at=archived_at, **coupon) for coupon in coupons
+        ])
+        redemptions = CouponUser.objects.using(using).filter(coupon__in=pks).order_by("pk").values(*COUPON_USER_FIELDS)
+        ArchivedCouponUser.objects.using(using).bulk_create([
+            ArchivedCouponUser(**redemption) for redemption in redemptions
+        ])
+        CouponUser.objects.using(using).filter(coupon__in=pks).delete()
+        CouponReservation.objects.using(using).filter(coupon__in=pks).delete()
+        # the related rows are gone, a plain DELETE skips the collector which would load every coupon
+        delete_rows(Coupon, pks, using)
+    codes = {coupon["normalized_code"] for coupon in coupons}
+    transaction.on_commit(lambda: cache.evict(codes), using=using)
+    return codes, {coupon["campaign_id"] for coupon in coupons if coupon["campaign_id"] is not None}
+
+
+def archive(cutoff=None, chunk_size=1000, progress=None):
+    """
+    Archives the coupons expired before ``cutoff`` (``COUPONS_ARCHIVE_RETENTION_DAYS`` ago by default),
+    ``chunk_size`` at a time, each chunk in its own short transaction, shard after shard. Archived coupons leave
+    ``Coupon``, so an interrupted run is resumed by running it again. ``progress`` is called with the running count
+    after each chunk. Redemptions are rolled up first, unless ``COUPONS_ROLLUP_ON_REDEEM`` did it already, and the
+    statistics of the affected campaigns are rebuilt at the end.
+    Returns the number of archived coupons.
+    """
+    from .models import CampaignStats, RedemptionRollup
+
+    cutoff = cutoff or get_cutoff()
+    if not ROLLUP_ON_REDEEM:
+        RedemptionRollup.objects.roll_up()
+    archived_at = timezone.now()
+    count, campaigns = 0, set()
+    for alias in sharding.get_shards():
+        last = 0
+        while True:
+            pks = list(get_queryset(cutoff, using=alias).filter(pk__gt=last).values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                break
+            _, chunk_campaigns = archive_chunk(pks, archived_at=archived_at, using=alias)
+            campaigns |= chunk_campaigns
+            count += len(pks)
+            last = pks[-1]
+            if progress is not None:
+                progress(count, last)
+    campaigns = sorted(campaigns)
+    for start in range(0, len(campaigns), 100):
+        CampaignStats.objects.rebuild(campaigns[start:start + 100])
+    return count
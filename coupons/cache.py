@@ -0,0 +1,87 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.cache import caches
+
+from . import metrics, routers, sharding
+from .settings import LOOKUP_CACHE, LOOKUP_CACHE_TIMEOUT
+
+
+def get_cache():
+    return caches[LOOKUP_CACHE] if LOOKUP_CACHE else None
+
+
+def make_key(normalized_code):
+    return "coupons:code:{}".format(normalized_code)
+
+
+@routers.use_primary
+def load(cache, normalized_codes):
+    """
+    Caches every coupon sharing one of ``normalized_codes``, returns them grouped by normalized code. Coupons are read
+    on the primary, a lagging replica would cache them as they were before a change already evicted.
+    """
+    from .models import Coupon
+
+    candidates = {}
+    for alias, codes in sharding.group(normalized_codes).items():
+        for coupon in Coupon.objects.using(alias).filter(normalized_code__in=codes).order_by():
+            candidates.setdefault(coupon.normalized_code, []).append(coupon)
+    # missing codes are not cached, a coupon created later must be found
+    cache.set_many({make_key(key): value for key, value in candidates.items()}, LOOKUP_CACHE_TIMEOUT)
+    return candidates
+
+
+def get_active(code):
+    """
+    Returns the active coupons whose normalized code matches ``code``, from ``COUPONS_LOOKUP_CACHE``, loading the
+    code on a miss. Validity is checked in Python, so coupons can be cached before they become active.
+    Returns ``None`` when the cache is disabled.
+    """
+    from .models import Coupon
+
+    cache = get_cache()
+    if cache is None:
+        return None
+    normalized_code = Coupon.normalize_code(code)
+    candidates = cache.get(make_key(normalized_code))
+    metrics.incr("coupons_cache_total", cache="lookup", outcome="miss" if candidates is None else "hit")
+    if candidates is None:
+        candidates = load(cache, [normalized_code]).get(normalized_code, [])
+    return [coupon for coupon in candidates if coupon.is_active]
+
+
+def warm(normalized_codes):
+    cache = get_cache()
+    if cache is not None:
+        load(cache, list(normalized_codes))
+
+
+def evict(normalized_codes):
+    cache = get_cache()
+    if cache is not None:
+        cache.delete_many([make_key(normalized_code) for normalized_code in normalized_codes])
@@ -0,0 +1,145 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import numbers
+from itertools import chain
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .settings import DISCOUNT_HANDLERS, DISCOUNT_USE_NUMPY
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class DiscountHandler:
+    """
+    Computes the discount granted by a coupon ``value`` on cart totals. Amounts are integers in minor units
+    (e.g. cents) so there is no float rounding. ``discount_array`` is the vectorized version used with NumPy,
+    the default one calls ``discount`` once per cart.
+    """
+
+    def discount(self, total, value):
+        raise NotImplementedError
+
+    def discount_array(self, totals, value):
+        return numpy.fromiter((self.discount(int(total), value) for total in totals), numpy.int64, len(totals))
+
+
+class MonetaryDiscount(DiscountHandler):
+    """ ``value`` minor units off. """
+
+    def discount(self, total, value):
+        return min(total, max(value, 0))
+
+    def discount_array(self, totals, value):
+        return numpy.minimum(totals, max(value, 0))
+
+
+class PercentageDiscount(DiscountHandler):
+    """ ``value`` percent off, rounded half up to the minor unit. """
+
+    def discount(self, total, value):
+        return (total * min(max(value, 0), 100) + 50) // 100
+
+    def discount_array(self, totals, value):
+        return (totals * min(max(value, 0), 100) + 50) // 100
+
+
+class NoDiscount(DiscountHandler):
+    """ For coupons not discounting the cart, like virtual currency credited elsewhere. """
+
+    def discount(self, total, value):
+        return 0
+
+    def discount_array(self, totals, value):
+        return numpy.zeros_like(totals)
+
+
+_handlers = None
+
+
+def get_handler(type):
+    global _handlers
+    if _handlers is None:
+        _handlers = {name: import_string(path)() for name, path in DISCOUNT_HANDLERS.items()}
+    try:
+        return _handlers[type]
+    except KeyError:
+        raise ImproperlyConfigured(
+            "No discount handler for coupon type {!r}, see COUPONS_DISCOUNT_HANDLERS.".format(type),
+        )
+
+
+def get_total(cart):
+    return int(cart) if isinstance(cart, numbers.Integral) else sum(cart)
+
+
+def get_totals_array(carts):
+    """ Sums the lines of every cart at once: one cumulative sum over all lines, read at the cart boundaries. """
+    if isinstance(carts, numpy.ndarray):
+        carts = carts.astype(numpy.int64, copy=False)
+        return carts if carts.ndim == 1 else carts.sum(axis=1)
+    carts = [[cart] if isinstance(cart, numbers.Integral) else cart for cart in carts]
+    lengths = numpy.fromiter((len(cart) for cart in carts), numpy.int64, len(carts))
+    lines = numpy.fromiter(chain.from_iterable(carts), numpy.int64, int(lengths.sum()))
+    ends = numpy.cumsum(lengths)
+    sums = numpy.concatenate(([0], numpy.cumsum(lines)))
+    return sums[ends] - sums[ends - lengths]
+
+
+def apply_discounts(carts, coupons, use_numpy=None):
+    """
+    Applies ``coupons`` in order to every cart of ``carts`` and returns the discount of each cart, in minor units.
+
+    A cart is its total or the sequence of its line amounts (a 1d or 2d NumPy array works as well). A coupon is a
+    ``Coupon`` or a ``(type, value)`` pair, handled by the ``COUPONS_DISCOUNT_HANDLERS`` entry of its type. Every
+    coupon applies to what the previous ones left, so a cart is never discounted below zero.
+    NumPy, when installed, evaluates each coupon on all the carts in one pass.
+    """
+    coupons = [
+        (get_handler(coupon[0]), coupon[1]) if isinstance(coupon, tuple) else (get_handler(coupon.type), coupon.value)
+        for coupon in coupons
+    ]
+    if use_numpy is None:
+        use_numpy = DISCOUNT_USE_NUMPY and numpy is not None
+    if use_numpy:
+        totals = get_totals_array(carts)
+        remaining = totals.copy()
+        for handler, value in coupons:
+            remaining -= numpy.minimum(handler.discount_array(remaining, value), remaining)
+        return (totals - remaining).tolist()
+    discounts = []
+    for cart in carts:
+        total = remaining = get_total(cart)
+        for handler, value in coupons:
+            remaining -= min(handler.discount(remaining, value), remaining)
+        discounts.append(total - remaining)
+    return discounts
@@ -36,3 +36,15 @@ class CouponExpiredError(CouponError):
 
 class CouponIsUsableError(CouponError):
     pass
+
+
+class CouponRateLimitError(CouponError):
+    def __init__(self, retry_after=None):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class CouponStackingError(CouponError):
+    def __init__(self, violations):
+        super().__init__(", ".join(violation.rule.name for violation in violations))
+        self.violations = violations
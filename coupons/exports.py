@@ -0,0 +1,220 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import csv
+import json
+import zlib
+
+from django.db.models import prefetch_related_objects
+from django.utils.translation import gettext_lazy as _
+from fluo.db import models
+
+from . import sharding
+from .settings import EXPORT_CHUNK_SIZE
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def format_datetime(value):
+    return value.strftime(DATETIME_FORMAT) if value else ""
+
+
+def get_csv_header():
+    return [_("Count"), _("ID"), _("Code"), _("Value"), _("Start Date"), _("Expiration Date"), _("Campaign")]
+
+
+def to_csv(count, coupon):
+    return [
+        count,
+        coupon.pk,
+        coupon.code,
+        coupon.value,
+        format_datetime(coupon.valid_from),
+        format_datetime(coupon.valid_until),
+        coupon.campaign if coupon.campaign_id else "",
+    ]
+
+
+def to_json(coupon):
+    return {
+        "id": coupon.pk,
+        "code": coupon.code,
+        "value": coupon.value,
+        "type": coupon.type,
+        "action": coupon.action,
+        "user_limit": coupon.user_limit,
+        "valid_from": coupon.valid_from.isoformat() if coupon.valid_from else None,
+        "valid_until": coupon.valid_until.isoformat() if coupon.valid_until else None,
+        "campaign": str(coupon.campaign) if coupon.campaign_id else None,
+    }
+
+
+def iter_coupons(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterates ``queryset`` with a bounded memory footprint, fetching campaigns in the same query. Sharded coupons are
+    read from every shard in parallel and listed shard after shard.
+    """
+    return sharding.iter_shards(queryset.select_related("campaign").order_by("pk"), chunk_size=chunk_size)
+
+
+def iter_csv(coupons):
+    writer = csv.writer(Echo())
+    yield writer.writerow([str(name) for name in get_csv_header()])
+    for count, coupon in enumerate(coupons, start=1):
+        yield writer.writerow(to_csv(count, coupon))
+
+
+def iter_ndjson(coupons):
+    for coupon in coupons:
+        yield json.dumps(to_json(coupon)) + "\n"
+
+
+def iter_bytes(lines, buffer_size=65536):
+    """ Encodes ``lines`` and groups them in blocks of about ``buffer_size`` bytes. """
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_gzip(blocks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    "csv": (iter_csv, "text/csv"),
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+}
+
+
+def encode(lines, compress=False):
+    chunks = iter_bytes(lines)
+    if compress:
+        chunks = iter_gzip(chunks)
+    return chunks
+
+
+def export_coupons(queryset, format="csv", compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Returns ``(content_type, chunks)``, where ``chunks`` is a generator of the encoded, and optionally
+    gzipped, export of ``queryset``.
+    """
+    serializer, content_type = FORMATS[format]
+    return content_type, encode(serializer(iter_coupons(queryset, chunk_size=chunk_size)), compress=compress)
+
+
+def get_redemption_csv_header():
+    return [_("ID"), _("Code"), _("User"), _("Redeemed at"), _("Source type"), _("Source ID"), _("Source")]
+
+
+def format_content_type(content_type_id):
+    if content_type_id is None:
+        return None
+    content_type = models.ContentType.objects.get_for_id(content_type_id)
+    return "{}.{}".format(content_type.app_label, content_type.model)
+
+
+def redemption_to_csv(redemption):
+    source = redemption.source
+    return [
+        redemption.pk,
+        redemption.coupon.code,
+        redemption.user if redemption.user_id else "",
+        format_datetime(redemption.redeemed_at),
+        format_content_type(redemption.source_type_id) or "",
+        redemption.source_id or "",
+        source if source is not None else "",
+    ]
+
+
+def redemption_to_json(redemption):
+    source = redemption.source
+    return {
+        "id": redemption.pk,
+        "code": redemption.coupon.code,
+        "user": redemption.user_id,
+        "redeemed_at": redemption.redeemed_at.isoformat() if redemption.redeemed_at else None,
+        "source_type": format_content_type(redemption.source_type_id),
+        "source_id": redemption.source_id,
+        "source": str(source) if source is not None else None,
+    }
+
+
+def iter_redemptions(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterates ``queryset`` with a bounded memory footprint. Sources are prefetched per chunk, with one query per
+    content type, since ``iterator()`` skips ``prefetch_related``. Sharded redemptions are listed shard after shard.
+    """
+    chunk = []
+    for redemption in sharding.iter_shards(queryset.select_related("coupon", "user"), chunk_size=chunk_size):
+        chunk.append(redemption)
+        if len(chunk) >= chunk_size:
+            prefetch_related_objects(chunk, "source")
+            yield from chunk
+            chunk = []
+    prefetch_related_objects(chunk, "source")
+    yield from chunk
+
+
+def iter_redemptions_csv(redemptions):
+    writer = csv.writer(Echo())
+    yield writer.writerow([str(name) for name in get_redemption_csv_header()])
+    for redemption in redemptions:
+        yield writer.writerow(redemption_to_csv(redemption))
+
+
+def iter_redemptions_ndjson(redemptions):
+    for redemption in redemptions:
+        yield json.dumps(redemption_to_json(redemption)) + "\n"
+
+
+REDEMPTION_FORMATS = {
+    "csv": (iter_redemptions_csv, "text/csv"),
+    "ndjson": (iter_redemptions_ndjson, "application/x-ndjson"),
+}
+
+
+def export_redemptions(queryset, format="csv", compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """ Same as ``export_coupons`` for a ``CouponUser`` queryset, in the queryset order. """
+    serializer, content_type = REDEMPTION_FORMATS[format]
+    return content_type, encode(serializer(iter_redemptions(queryset, chunk_size=chunk_size)), compress=compress)
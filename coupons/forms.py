@@ -29,7 +29,7 @@ from django import forms
 from django.contrib.admin.widgets import AdminSplitDateTime
 from django.utils.translation import gettext_lazy as _
 
-from . import settings
+from . import metrics, ratelimit, routers, settings
 from .models import Campaign, Coupon, CouponUser
 
 
@@ -81,6 +81,46 @@ class CouponGenerationForm(forms.Form):
     )
 
 
+class CouponImportForm(forms.Form):
+    file = forms.FileField(
+        label=_("File"),
+        help_text=_("CSV file with a code column, or the codes in the first column"),
+    )
+    campaign = forms.ModelChoiceField(
+        required=False,
+        queryset=Campaign.objects.all(),
+        label=_("Campaign"),
+    )
+    value = forms.IntegerField(
+        label=_("Value"),
+    )
+    type = forms.ChoiceField(
+        choices=settings.COUPON_TYPES,
+        label=_("Type"),
+    )
+    action = forms.ChoiceField(
+        choices=settings.ACTION_TYPES,
+        label=_("Action"),
+    )
+    user_limit = forms.IntegerField(
+        min_value=0,
+        initial=1,
+        label=_("User limit"),
+    )
+    valid_from = forms.SplitDateTimeField(
+        required=False,
+        widget=AdminSplitDateTime,
+        label=_("Valid from"),
+        help_text=_("Coupons are valid from this date"),
+    )
+    valid_until = forms.SplitDateTimeField(
+        required=False,
+        widget=AdminSplitDateTime,
+        label=_("Valid until"),
+        help_text=_("Coupons expire at this date"),
+    )
+
+
 class CouponForm(forms.Form):
     code = forms.CharField(
         label=_("Coupon code"),
@@ -89,20 +129,41 @@ class CouponForm(forms.Form):
     def __init__(self, *args, **kwargs):
         self.user = None
         self.types = None
+        self.ip = None
         if "user" in kwargs:
             self.user = kwargs["user"]
             del kwargs["user"]
+        if "ip" in kwargs:
+            self.ip = kwargs["ip"]
+            del kwargs["ip"]
         if "types" in kwargs:
             self.types = kwargs["types"]
             del kwargs["types"]
         super().__init__(*args, **kwargs)
 
+    def full_clean(self):
+        with routers.sticky(self.user):
+            super().full_clean()
+
+    def redeem(self, source=None):
+        """
+        Redeems the validated coupon for the form user. The rate limit hit was counted by the validation, unlike
+        ``Coupon.objects.redeem`` this does not count another one.
+        """
+        return self.coupon.redeem(user=self.user, source=source)
+
     def clean_code(self):
         code = self.cleaned_data["code"]
         try:
-            coupon = Coupon.objects.get(code=code)
+            ratelimit.check("redeem", user=self.user, ip=self.ip)
+        except Coupon.RateLimitError:
+            raise forms.ValidationError(_("Too many attempts, please try again later."), code="ratelimit")
+        try:
+            coupon = Coupon.objects.get_by_code(code)
         except Coupon.DoesNotExist:
+            metrics.incr("coupons_lookups_total", source="form", outcome="missing")
             raise forms.ValidationError(_("This code is not valid."))
+        metrics.incr("coupons_lookups_total", source="form", outcome="found")
         self.coupon = coupon
 
         if self.user is None and coupon.user_limit is not 1:
@@ -0,0 +1,159 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import csv
+
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext as _
+
+from . import sharding, wallet
+from .models import CampaignStats, Coupon
+from .settings import CODE_CHARS, IMPORT_BATCH_SIZE, SEGMENT_SEPARATOR, SEGMENTED_CODES
+
+
+def read_codes(fp):
+    """
+    Yields ``(line, code)`` from a csv file, using the ``code`` column if there is a header, the first otherwise.
+    """
+    reader = csv.reader(fp)
+    index = 0
+    for row in reader:
+        if not row:
+            continue
+        if reader.line_num == 1 and "code" in [column.strip().lower() for column in row]:
+            index = [column.strip().lower() for column in row].index("code")
+            continue
+        yield reader.line_num, row[index].strip() if len(row) > index else ""
+
+
+class CouponImporter:
+    """
+    Imports externally generated codes as coupons sharing the given attributes.
+    Codes are validated, deduplicated within the input and against the database in batches of ``batch_size``,
+    and inserted with ``bulk_create``. Rejected rows are written to the ``rejected`` csv writer as they are found.
+    """
+    def __init__(self, type, action, value, campaign=None, user_limit=1, valid_from=None, valid_until=None,
+                 code_chars=CODE_CHARS, batch_size=IMPORT_BATCH_SIZE, rejected=None, progress=None):
+        self.attrs = {
+            "type": type,
+            "action": action,
+            "value": value,
+            "campaign": campaign,
+            "user_limit": user_limit,
+            "valid_from": valid_from,
+            "valid_until": valid_until,
+        }
+        self.allowed = set(code_chars)
+        if SEGMENTED_CODES:
+            self.allowed.update(SEGMENT_SEPARATOR)
+        self.max_length = Coupon._meta.get_field("code").max_length
+        self.batch_size = batch_size
+        self.rejected = rejected
+        self.progress = progress
+        self.seen = set()
+        self.read = self.imported = self.skipped = 0
+
+    def reject(self, line, code, reason):
+        self.skipped += 1
+        if self.rejected is not None:
+            self.rejected.writerow([line, code, reason])
+
+    def validate(self, code):
+        if not code:
+            return _("Empty code.")
+        if len(code) > self.max_length:
+            return _("Code longer than {} characters.").format(self.max_length)
+        if not self.allowed.issuperset(code):
+            return _("Code contains invalid characters.")
+        if code in self.seen:
+            return _("Duplicate code in file.")
+
+    def flush(self, batch):
+        if not batch:
+            return
+        groups = {}
+        for line, code in batch:
+            groups.setdefault(sharding.get_shard(code), []).append((line, code))
+        with sharding.atomic_shards():
+            count = sum(self.flush_shard(alias, rows) for alias, rows in groups.items())
+            CampaignStats.objects.increment(self.attrs["campaign"], total=count)
+            if self.attrs["campaign"] is not None and count:
+                # open coupons of the campaign are listed in every wallet
+                transaction.on_commit(wallet.invalidate_all)
+        self.imported += count
+        if self.progress is not None:
+            self.progress(self)
+
+    def flush_shard(self, alias, batch):
+        """ Inserts the ``batch`` codes held by the shard ``alias``, returns the number of imported coupons. """
+        codes = [code for line, code in batch]
+        existing = set(Coupon.objects.using(alias).filter(code__in=codes).values_list("code", flat=True))
+        coupons = []
+        for line, code in batch:
+            if code in existing:
+                self.reject(line, code, _("Code already exists."))
+            else:
+                normalized_code = Coupon.normalize_code(code)
+                coupon = Coupon(
+                    code=code,
+                    normalized_code=normalized_code,
+                    code_int=Coupon.encode_code(normalized_code),
+                    **self.attrs
+                )
+                coupons.append((line, coupon))
+        try:
+            with transaction.atomic(using=alias):
+                Coupon.objects.using(alias).bulk_create([coupon for line, coupon in coupons])
+        except IntegrityError:
+            # a concurrent writer inserted some of these codes after the lookup, insert one by one
+            inserted = []
+            for line, coupon in coupons:
+                try:
+                    with transaction.atomic(using=alias):
+                        coupon.save(force_insert=True, using=alias)
+                    inserted.append((line, coupon))
+                except IntegrityError:
+                    self.reject(line, coupon.code, _("Code already exists."))
+            coupons = inserted
+        return len(coupons)
+
+    def run(self, rows):
+        """ Imports ``rows``, an iterable of ``(line, code)``. """
+        batch = []
+        for line, code in rows:
+            self.read += 1
+            error = self.validate(code)
+            if error:
+                self.reject(line, code, error)
+                continue
+            self.seen.add(code)
+            batch.append((line, code))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+        return self
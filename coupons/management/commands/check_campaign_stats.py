@@ -0,0 +1,68 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import CampaignStats
+
+
+class Command(BaseCommand):
+    help = "Compare campaign statistics against coupons and redemptions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--campaign",
+            action="append",
+            type=int,
+            dest="campaigns",
+            help="Check only this campaign (can be repeated).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=100,
+            help="Number of campaigns checked at once.",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Rebuild the campaigns found out of sync.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for chunk in CampaignStats.objects.chunks(options["chunk_size"], campaigns=options["campaigns"]):
+            drift = CampaignStats.objects.drift(chunk)
+            for pk, counters in sorted(drift.items()):
+                for name, (stored, actual) in sorted(counters.items()):
+                    self.stdout.write("campaign {}: {} is {}, expected {}".format(pk, name, stored, actual))
+            if drift and options["fix"]:
+                CampaignStats.objects.rebuild(list(drift))
+            drifted += len(drift)
+        if drifted and not options["fix"]:
+            raise CommandError("{} campaigns out of sync.".format(drifted))
+        self.stdout.write("{} campaigns out of sync.".format(drifted))
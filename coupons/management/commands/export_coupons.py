@@ -0,0 +1,103 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import sys
+
+from django.core.management.base import BaseCommand
+
+from ...exports import FORMATS, export_coupons
+from ...models import Coupon
+from ...settings import EXPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Stream coupons as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=sorted(FORMATS),
+            default="csv",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the output with gzip.",
+        )
+        parser.add_argument(
+            "--output",
+            "-o",
+            help="Write to this file instead of the standard output.",
+        )
+        parser.add_argument(
+            "--campaign",
+            action="append",
+            type=int,
+            dest="campaigns",
+            help="Export only coupons of this campaign (can be repeated).",
+        )
+        parser.add_argument(
+            "--active",
+            action="store_true",
+            help="Export only active coupons.",
+        )
+        parser.add_argument(
+            "--expired",
+            action="store_true",
+            help="Export only expired coupons.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help="Number of coupons fetched per query.",
+        )
+
+    def get_queryset(self, options):
+        queryset = Coupon.objects.all()
+        if options["campaigns"]:
+            queryset = queryset.filter(campaign__in=options["campaigns"])
+        if options["active"]:
+            queryset = queryset.active()
+        if options["expired"]:
+            queryset = queryset.expired()
+        return queryset
+
+    def handle(self, *args, **options):
+        content_type, chunks = export_coupons(
+            self.get_queryset(options),
+            format=options["format"],
+            compress=options["gzip"],
+            chunk_size=options["chunk_size"],
+        )
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options["output"]:
+                output.close()
@@ -0,0 +1,100 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import csv
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ...imports import CouponImporter, read_codes
+from ...models import Campaign
+from ...settings import ACTION_TYPES, COUPON_TYPES, DEFAULT_ACTION_TYPE, IMPORT_BATCH_SIZE
+
+
+def datetime_type(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Import externally generated coupon codes from a csv file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="CSV file with a `code` column, or the codes in the first column.")
+        parser.add_argument("--type", choices=[name for name, label in COUPON_TYPES], required=True)
+        parser.add_argument("--action", choices=[name for name, label in ACTION_TYPES], default=DEFAULT_ACTION_TYPE)
+        parser.add_argument("--value", type=int, required=True)
+        parser.add_argument("--campaign", type=int, help="Campaign id.")
+        parser.add_argument("--user-limit", type=int, default=1)
+        parser.add_argument("--valid-from", type=datetime_type)
+        parser.add_argument("--valid-until", type=datetime_type)
+        parser.add_argument("--encoding", default="utf-8")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument("--rejected", help="Write rejected rows to this csv file.")
+
+    def progress(self, importer):
+        self.stdout.write("read {}, imported {}, rejected {}".format(
+            importer.read, importer.imported, importer.skipped,
+        ))
+
+    def handle(self, *args, **options):
+        campaign = None
+        if options["campaign"] is not None:
+            try:
+                campaign = Campaign.objects.get(pk=options["campaign"])
+            except Campaign.DoesNotExist:
+                raise CommandError("Campaign {} does not exist.".format(options["campaign"]))
+        report = open(options["rejected"], "w", newline="") if options["rejected"] else None
+        try:
+            rejected = None
+            if report is not None:
+                rejected = csv.writer(report)
+                rejected.writerow(["line", "code", "reason"])
+            importer = CouponImporter(
+                type=options["type"],
+                action=options["action"],
+                value=options["value"],
+                campaign=campaign,
+                user_limit=options["user_limit"],
+                valid_from=options["valid_from"],
+                valid_until=options["valid_until"],
+                batch_size=options["batch_size"],
+                rejected=rejected,
+                progress=self.progress if options["verbosity"] > 1 else None,
+            )
+            with io.open(options["file"], "r", encoding=options["encoding"], newline="") as fp:
+                importer.run(read_codes(fp))
+        finally:
+            if report is not None:
+                report.close()
+        self.progress(importer)
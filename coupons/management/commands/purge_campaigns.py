@@ -0,0 +1,66 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.management.base import BaseCommand
+
+from ...models import Campaign
+
+
+class Command(BaseCommand):
+    help = "Delete disabled campaigns with their coupons and redemptions, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--campaign",
+            action="append",
+            type=int,
+            dest="campaigns",
+            help="Delete this campaign, disabled or not (can be repeated). Defaults to every disabled campaign.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of coupons deleted per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        if options["campaigns"]:
+            campaigns = Campaign.objects.filter(pk__in=options["campaigns"])
+        else:
+            campaigns = Campaign.objects.filter(disabled_at__isnull=False)
+
+        def progress(count, last):
+            if options["verbosity"] > 1:
+                self.stdout.write("Deleted {} coupons (last id {})".format(count, last))
+
+        total = 0
+        for campaign in campaigns.order_by("pk"):
+            count = Campaign.objects.purge(campaign, chunk_size=options["chunk_size"], progress=progress)
+            total += count
+            self.stdout.write("Deleted campaign {} and its {} coupons.".format(campaign, count))
+        self.stdout.write("Deleted {} coupons.".format(total))
@@ -0,0 +1,67 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.management.base import BaseCommand
+
+from ...scheduler import Scheduler
+from ...settings import LOOKUP_CACHE, SCHEDULER_HORIZON, SCHEDULER_LEAD
+
+
+class Command(BaseCommand):
+    help = "Warm the coupon lookup cache before coupons become active and evict them once expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lead",
+            type=int,
+            default=SCHEDULER_LEAD,
+            help="Seconds before valid_from the coupons are warmed.",
+        )
+        parser.add_argument(
+            "--horizon",
+            type=int,
+            default=SCHEDULER_HORIZON,
+            help="Seconds ahead the transitions are tracked.",
+        )
+        parser.add_argument(
+            "--refresh",
+            type=int,
+            default=60,
+            help="Seconds between two reads of the upcoming transitions.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Handle the due transitions and exit instead of running forever.",
+        )
+
+    def handle(self, *args, **options):
+        if not LOOKUP_CACHE:
+            self.stderr.write("COUPONS_LOOKUP_CACHE is not set, there is nothing to warm.")
+            return
+        scheduler = Scheduler(lead=options["lead"], horizon=options["horizon"], refresh=options["refresh"])
+        scheduler.run(once=options["once"])
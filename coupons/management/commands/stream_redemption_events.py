@@ -0,0 +1,98 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import outbox
+from ...settings import OUTBOX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Stream the redemption events of the outbox as NDJSON from the stored position of a consumer."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "consumer",
+            help="Name of the consumer, each one has its own position.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=OUTBOX_BATCH_SIZE,
+            help="Number of events read per query.",
+        )
+        parser.add_argument(
+            "--output",
+            "-o",
+            help="Append to this file instead of writing to the standard output.",
+        )
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            help="Keep waiting for new events.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1,
+            help="Seconds between two polls with --follow.",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete the events acknowledged by every consumer once streamed.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            consumer = outbox.Consumer(options["consumer"], batch_size=options["batch_size"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        consumer.register()
+        output = open(options["output"], "a") if options["output"] else self.stdout
+        count = 0
+        try:
+            while True:
+                for batch in consumer.batches():
+                    output.write("".join(json.dumps(outbox.event_to_json(event)) + "\n" for event in batch))
+                    # the batch is acknowledged when the next one is requested, after it is written out
+                    output.flush()
+                    count += len(batch)
+                if options["prune"]:
+                    outbox.prune(batch_size=options["batch_size"])
+                if not options["follow"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if options["output"]:
+                output.close()
+        self.stderr.write("Streamed {} events.".format(count))
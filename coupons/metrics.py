@@ -0,0 +1,180 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.utils.module_loading import import_string
+
+from .settings import METRICS_SINK
+
+logger = logging.getLogger("coupons.metrics")
+
+
+class NullSink:
+    """ Discards everything, the default. """
+    enabled = False
+
+    def incr(self, name, value=1, labels=None):
+        pass
+
+    def timing(self, name, seconds, labels=None):
+        pass
+
+
+class LoggingSink(NullSink):
+    """ Logs every sample to the ``coupons.metrics`` logger at debug level. """
+    enabled = True
+
+    def incr(self, name, value=1, labels=None):
+        logger.debug("%s %s +%s", name, labels or {}, value)
+
+    def timing(self, name, seconds, labels=None):
+        logger.debug("%s %s %.6fs", name, labels or {}, seconds)
+
+
+class RegistrySink(NullSink):
+    """ Keeps counters, and count and sum of timers, in process memory. """
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = defaultdict(float)
+            self.timers = defaultdict(lambda: [0, 0.0])
+
+    def key(self, name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def incr(self, name, value=1, labels=None):
+        with self.lock:
+            self.counters[self.key(name, labels)] += value
+
+    def timing(self, name, seconds, labels=None):
+        with self.lock:
+            timer = self.timers[self.key(name, labels)]
+            timer[0] += 1
+            timer[1] += seconds
+
+    def get(self, name, **labels):
+        return self.counters.get(self.key(name, labels), 0)
+
+    def format_labels(self, labels):
+        if not labels:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(key, str(value).replace('"', '\\"')) for key, value in labels) + "}"
+
+    def prometheus(self):
+        """ Renders the registry in the Prometheus text exposition format. """
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timers = sorted(self.timers.items())
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append("# TYPE {} counter".format(name))
+                typed.add(name)
+            lines.append("{}{} {:g}".format(name, self.format_labels(labels), value))
+        for (name, labels), (count, total) in timers:
+            if name not in typed:
+                lines.append("# TYPE {} summary".format(name))
+                typed.add(name)
+            lines.append("{}_count{} {}".format(name, self.format_labels(labels), count))
+            lines.append("{}_sum{} {:.6f}".format(name, self.format_labels(labels), total))
+        return "\n".join(lines) + "\n"
+
+
+_sink = None
+
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        _sink = import_string(METRICS_SINK)() if METRICS_SINK else NullSink()
+    return _sink
+
+
+def set_sink(sink):
+    """ Replaces the configured sink, ``None`` reloads it from settings. """
+    global _sink
+    _sink = sink
+
+
+def incr(name, value=1, **labels):
+    sink = get_sink()
+    if sink.enabled:
+        sink.incr(name, value, labels)
+
+
+class Timer:
+    def __init__(self, sink, name, labels):
+        self.sink = sink
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.sink.timing(self.name, time.perf_counter() - self.start, self.labels)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+null_timer = NullTimer()
+
+
+def timer(name, **labels):
+    """ Times the ``with`` block, when metrics are disabled this is a shared no-op context manager. """
+    sink = get_sink()
+    if not sink.enabled:
+        return null_timer
+    return Timer(sink, name, labels)
+
+
+def timed(name, **labels):
+    """ Decorator timing every call of the decorated function. """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,76 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import django.db.models.deletion
+from coupons import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupons', '0004_added_campaignstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Name')),
+                ('position', models.BigIntegerField(default=0, verbose_name='Position')),
+            ],
+            options={
+                'verbose_name': 'Rollup cursor',
+                'verbose_name_plural': 'Rollup cursors',
+            },
+        ),
+        migrations.CreateModel(
+            name='RedemptionRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4, verbose_name='Period')),
+                ('bucket', models.DateTimeField(verbose_name='Bucket')),
+                ('type', models.CharField(choices=settings.COUPON_TYPES, max_length=20, verbose_name='Type')),
+                ('action', models.CharField(blank=True, choices=settings.ACTION_TYPES, max_length=20, verbose_name='Action')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Count')),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='coupons.Campaign', verbose_name='Campaign')),
+            ],
+            options={
+                'verbose_name': 'Redemption rollup',
+                'verbose_name_plural': 'Redemption rollups',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='redemptionrollup',
+            index=models.Index(fields=['period', 'campaign', 'bucket'], name='coupons_rollup_campaign_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='redemptionrollup',
+            index=models.Index(fields=['period', 'bucket'], name='coupons_rollup_bucket_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from coupons.settings import CODE_CONFUSABLES, SEGMENT_SEPARATOR
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def normalize_code(code):
+    # Coupon.normalize_code as of this migration
+    code = "".join((code or "").split())
+    if SEGMENT_SEPARATOR:
+        code = code.replace(SEGMENT_SEPARATOR, "")
+    return code.upper().translate(CODE_CONFUSABLES)
+
+
+def normalize_codes(apps, schema_editor):
+    Coupon = apps.get_model("coupons", "Coupon")
+    coupons = Coupon.objects.using(schema_editor.connection.alias)
+    last_pk = 0
+    while True:
+        chunk = list(coupons.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "code")[:1000])
+        if not chunk:
+            break
+        # one UPDATE per chunk
+        coupons.filter(pk__in=[pk for pk, code in chunk]).update(normalized_code=Case(
+            *[When(pk=pk, then=Value(normalize_code(code))) for pk, code in chunk],
+            output_field=models.CharField(),
+        ))
+        last_pk = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupons', '0005_added_redemptionrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='normalized_code',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=30, verbose_name='Normalized code'),
+        ),
+        migrations.RunPython(normalize_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import django.db.models.deletion
+import django.utils.timezone
+from coupons.settings import ACTION_TYPES, COUPON_TYPES
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('coupons', '0009_added_couponreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCoupon',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.IntegerField(verbose_name='Value')),
+                ('code', models.CharField(db_index=True, max_length=30, verbose_name='Code')),
+                ('normalized_code', models.CharField(db_index=True, max_length=30, verbose_name='Normalized code')),
+                ('type', models.CharField(choices=COUPON_TYPES, max_length=20, verbose_name='Type')),
+                ('action', models.CharField(blank=True, choices=ACTION_TYPES, max_length=20, verbose_name='Action')),
+                ('user_limit', models.PositiveIntegerField(verbose_name='User limit')),
+                ('valid_from', models.DateTimeField(blank=True, null=True, verbose_name='Valid from')),
+                ('valid_until', models.DateTimeField(blank=True, null=True, verbose_name='Valid until')),
+                ('created_at', models.DateTimeField(verbose_name='created')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Archived at')),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='coupons.Campaign', verbose_name='Campaign')),
+            ],
+            options={
+                'verbose_name': 'Archived coupon',
+                'verbose_name_plural': 'Archived coupons',
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedCouponUser',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('redeemed_at', models.DateTimeField(blank=True, null=True, verbose_name='Redeemed at')),
+                ('source_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='source id')),
+                ('created_at', models.DateTimeField(verbose_name='created')),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='users', to='coupons.archivedcoupon', verbose_name='Coupon')),
+                ('source_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='contenttypes.contenttype', verbose_name='source content type')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Archived redemption',
+                'verbose_name_plural': 'Archived redemptions',
+            },
+        ),
+    ]
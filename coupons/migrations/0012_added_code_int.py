@@ -0,0 +1,87 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from coupons.settings import CODE_CHARS, CODE_CONFUSABLES, SEGMENT_SEPARATOR
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def normalize_code(code):
+    # Coupon.normalize_code as of this migration
+    code = "".join((code or "").split())
+    if SEGMENT_SEPARATOR:
+        code = code.replace(SEGMENT_SEPARATOR, "")
+    return code.upper().translate(CODE_CONFUSABLES)
+
+
+def encode_code(digits, normalized_code):
+    # Coupon.encode_code as of this migration
+    if not normalized_code:
+        return None
+    value = 0
+    for char in normalized_code:
+        if char not in digits:
+            return None
+        value = value * len(digits) + digits[char]
+    return value if value < 2 ** 63 else None
+
+
+def encode_codes(apps, schema_editor):
+    Coupon = apps.get_model("coupons", "Coupon")
+    coupons = Coupon.objects.using(schema_editor.connection.alias)
+    digits = {char: digit for digit, char in enumerate(sorted(set(normalize_code(CODE_CHARS))), 1)}
+    last_pk = 0
+    while True:
+        chunk = list(coupons.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "normalized_code")[:1000])
+        if not chunk:
+            break
+        # codes that do not pack keep the NULL code_int of the new column
+        values = {pk: encode_code(digits, normalized_code) for pk, normalized_code in chunk}
+        values = {pk: value for pk, value in values.items() if value is not None}
+        if values:
+            # one UPDATE per chunk
+            coupons.filter(pk__in=list(values)).update(code_int=Case(
+                *[When(pk=pk, then=Value(value)) for pk, value in values.items()],
+                output_field=models.BigIntegerField(),
+            ))
+        last_pk = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupons', '0011_added_campaign_disabled_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='code_int',
+            field=models.BigIntegerField(db_index=True, editable=False, null=True, verbose_name='Integer code'),
+        ),
+        migrations.RunPython(encode_codes, migrations.RunPython.noop),
+    ]
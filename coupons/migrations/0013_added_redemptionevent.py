@@ -0,0 +1,62 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import django.utils.timezone
+from coupons.settings import ACTION_TYPES, COUPON_TYPES
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupons', '0012_added_code_int'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RedemptionEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('coupon_user_id', models.IntegerField(verbose_name='Redemption')),
+                ('coupon_id', models.IntegerField(verbose_name='Coupon')),
+                ('code', models.CharField(max_length=30, verbose_name='Code')),
+                ('campaign_id', models.IntegerField(blank=True, null=True, verbose_name='Campaign')),
+                ('user_id', models.IntegerField(blank=True, null=True, verbose_name='User')),
+                ('type', models.CharField(choices=COUPON_TYPES, max_length=20, verbose_name='Type')),
+                ('action', models.CharField(choices=ACTION_TYPES, max_length=20, verbose_name='Action')),
+                ('value', models.IntegerField(verbose_name='Value')),
+                ('redeemed_at', models.DateTimeField(verbose_name='Redeemed at')),
+                ('source_type_id', models.IntegerField(blank=True, null=True, verbose_name='source content type')),
+                ('source_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='source id')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Redemption event',
+                'verbose_name_plural': 'Redemption events',
+            },
+        ),
+    ]
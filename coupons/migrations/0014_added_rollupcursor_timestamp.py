@@ -0,0 +1,56 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.db import migrations, models
+
+
+def set_timestamps(apps, schema_editor):
+    # the redemptions up to the primary key watermark are rolled up, continue after the latest of them
+    RollupCursor = apps.get_model("coupons", "RollupCursor")
+    CouponUser = apps.get_model("coupons", "CouponUser")
+    alias = schema_editor.connection.alias
+    for cursor in RollupCursor.objects.using(alias).filter(name="redemptions", position__gt=0):
+        redemptions = CouponUser.objects.using(alias).filter(pk__lte=cursor.position, redeemed_at__isnull=False)
+        last = redemptions.order_by("-redeemed_at", "-pk").values_list("pk", "redeemed_at").first()
+        if last is not None:
+            RollupCursor.objects.using(alias).filter(pk=cursor.pk).update(position=last[0], timestamp=last[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coupons', '0013_added_redemptionevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupcursor',
+            name='timestamp',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Timestamp'),
+        ),
+        migrations.RunPython(set_timestamps, migrations.RunPython.noop),
+    ]
@@ -26,23 +26,85 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import random
+import uuid
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+from functools import partial
+from itertools import islice
 
 from django.conf import settings
-from django.db import IntegrityError, transaction
-from django.db.models import Q
+from django.core import checks
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, Exists, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy as _
 from fluo.db import models
 
-from . import exceptions
+from . import cache, discounts, exceptions, metrics, ratelimit, routers, sharding, stacking, wallet
 from .settings import (
-    ACTION_TYPES, CODE_CHARS, CODE_LENGTH, COUPON_TYPES, DEFAULT_ACTION_TYPE, SEGMENT_LENGTH, SEGMENT_SEPARATOR,
+    ACTION_TYPES, CODE_CHARS, CODE_CONFUSABLES, CODE_INT_LOOKUP, CODE_LENGTH, COUPON_TYPES, DEFAULT_ACTION_TYPE,
+    OUTBOX_ENABLED, RESERVATION_TTL, ROLLUP_ON_REDEEM, ROLLUP_SAFETY_MARGIN, SEGMENT_LENGTH, SEGMENT_SEPARATOR,
     SEGMENTED_CODES,
 )
 
 
+def delete_rows(model, pks, using):
+    """
+    Deletes the ``model`` rows ``pks`` on ``using`` with one DELETE statement. Unlike ``QuerySet.delete()`` no
+    instance is loaded and no signal is sent, the rows referencing them must be deleted first.
+    """
+    if not pks:
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {} WHERE {} IN ({})".format(
+            connection.ops.quote_name(model._meta.db_table),
+            connection.ops.quote_name(model._meta.pk.column),
+            ", ".join(["%s"] * len(pks)),
+        ), list(pks))
+
+
+class CampaignManager(models.Manager):
+    def purge(self, campaign, chunk_size=1000, progress=None):
+        """
+        Deletes ``campaign`` with its coupons and redemptions, ``chunk_size`` coupons at a time, each chunk in its own
+        transaction. Rows are removed with set-based DELETEs, no coupon instance is loaded, so large campaigns are
+        deleted without the cascade collector. An interrupted purge is resumed by running it again.
+        ``progress`` is called with the running count after each chunk. Returns the number of deleted coupons.
+        """
+        pk = getattr(campaign, "pk", campaign)
+        count = 0
+        for alias in sharding.get_shards():
+            using = alias or router.db_for_write(Coupon)
+            coupons = Coupon.objects.using(using).filter(campaign=pk).order_by("pk")
+            while True:
+                with transaction.atomic(using=using):
+                    rows = list(coupons.values_list("pk", "normalized_code")[:chunk_size])
+                    if not rows:
+                        break
+                    pks, codes = [row[0] for row in rows], {row[1] for row in rows}
+                    CouponUser.objects.using(using).filter(coupon__in=pks).delete()
+                    CouponReservation.objects.using(using).filter(coupon__in=pks).delete()
+                    # the related rows are gone, a raw DELETE skips the collector which would load every coupon
+                    delete_rows(Coupon, pks, using)
+                    transaction.on_commit(lambda codes=codes: cache.evict(codes), using=using)
+                count += len(pks)
+                if progress is not None:
+                    progress(count, pks[-1])
+        # the campaign is replicated on every shard, its coupons are gone so the collector has little to load
+        for alias in sharding.get_shards():
+            if alias is not None:
+                self.using(alias).filter(pk=pk).delete()
+        self.filter(pk=pk).delete()
+        return count
+
+
 class Campaign(models.TimestampModel):
+    objects = CampaignManager()
+
     name = models.CharField(
         max_length=255,
         unique=True,
@@ -52,6 +114,13 @@ class Campaign(models.TimestampModel):
         blank=True,
         verbose_name=_("Description"),
     )
+    disabled_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name=_("Disabled at"),
+        help_text=_("Coupons of disabled campaigns expired at this date, purge_campaigns deletes them"),
+    )
 
     class Meta:
         ordering = ["name"]
@@ -61,6 +130,182 @@ class Campaign(models.TimestampModel):
     def __str__(self):
         return self.name
 
+    @routers.use_primary
+    def disable(self):
+        """
+        Expires every coupon of the campaign with one UPDATE, releases their reservations and purges the lookup and
+        wallet caches once committed. Returns the number of expired coupons.
+        """
+        now = timezone.now()
+        count = 0
+        with sharding.atomic_shards():
+            Campaign.objects.filter(pk=self.pk).update(disabled_at=now)
+            self.disabled_at = now
+            for alias in sharding.get_shards():
+                coupons = Coupon.objects.using(alias).filter(campaign=self.pk)
+                count += coupons.filter(Q(valid_until__isnull=True) | Q(valid_until__gt=now)).update(valid_until=now)
+                CouponReservation.objects.using(alias).filter(coupon__campaign=self.pk).delete()
+            CampaignStats.objects.rebuild([self.pk])
+            transaction.on_commit(self.purge_caches)
+        return count
+
+    def purge_caches(self):
+        """ Evicts the codes of the campaign from the lookup cache and invalidates the cached wallets. """
+        if cache.get_cache() is not None:
+            for alias in sharding.get_shards():
+                codes = Coupon.objects.using(alias).filter(campaign=self.pk).order_by()
+                codes = codes.values_list("normalized_code", flat=True).iterator()
+                while True:
+                    chunk = list(islice(codes, 1000))
+                    if not chunk:
+                        break
+                    cache.evict(chunk)
+        # open coupons of the campaign are listed in every wallet
+        wallet.invalidate_all()
+
+
+class CampaignStatsManager(models.Manager):
+    def increment(self, campaign, last_redeemed_at=None, **deltas):
+        """
+        Add ``deltas`` to the counters of ``campaign`` with a single UPDATE.
+        A missing row is rebuilt from scratch, which already accounts for the change.
+        """
+        if campaign is None:
+            return
+        pk = getattr(campaign, "pk", campaign)
+        values = {name: F(name) + delta for name, delta in deltas.items() if delta}
+        if last_redeemed_at is not None:
+            value = Value(last_redeemed_at, output_field=models.DateTimeField())
+            values["last_redeemed_at"] = Greatest(Coalesce(F("last_redeemed_at"), value), value)
+        if values and not self.filter(campaign_id=pk).update(**values):
+            self.rebuild([pk])
+
+    @routers.use_primary
+    def compute(self, campaigns):
+        """
+        Returns the counters of ``campaigns`` as computed from ``Coupon`` and ``CouponUser``, read on the primary:
+        they are stored or compared to the stored ones, which a lagging replica would not match.
+        """
+        pks = [getattr(campaign, "pk", campaign) for campaign in campaigns]
+        stats = {
+            pk: {"total": 0, "used": 0, "redeemed": 0, "expired": 0, "last_redeemed_at": None}
+            for pk in pks
+        }
+        # every coupon lives on a single shard, the counters of the shards add up
+        for shard_stats in sharding.fan_out(lambda alias: self.compute_shard(pks, alias)):
+            for pk, values in shard_stats.items():
+                for name in ["total", "used", "redeemed", "expired"]:
+                    stats[pk][name] += values[name]
+                last_redeemed_at = values["last_redeemed_at"]
+                if last_redeemed_at is not None:
+                    stats[pk]["last_redeemed_at"] = max(stats[pk]["last_redeemed_at"] or last_redeemed_at, last_redeemed_at)  # noqa: E501
+        return stats
+
+    def compute_shard(self, pks, using=None):
+        stats = {
+            pk: {"total": 0, "used": 0, "redeemed": 0, "expired": 0, "last_redeemed_at": None}
+            for pk in pks
+        }
+        coupons = Coupon.objects.using(using).filter(campaign__in=pks).order_by()
+        for row in coupons.values("campaign").annotate(count=Count("pk")):
+            stats[row["campaign"]]["total"] = row["count"]
+        for row in coupons.expired().values("campaign").annotate(count=Count("pk")):
+            stats[row["campaign"]]["expired"] = row["count"]
+        used = coupons.filter(users__redeemed_at__isnull=False)
+        for row in used.values("campaign").annotate(count=Count("pk", distinct=True)):
+            stats[row["campaign"]]["used"] = row["count"]
+        redeemed = CouponUser.objects.using(using).filter(coupon__campaign__in=pks, redeemed_at__isnull=False).order_by()  # noqa: E501
+        for row in redeemed.values("coupon__campaign").annotate(count=Count("pk"), last=Max("redeemed_at")):
+            stats[row["coupon__campaign"]]["redeemed"] = row["count"]
+            stats[row["coupon__campaign"]]["last_redeemed_at"] = row["last"]
+        return stats
+
+    @routers.use_primary
+    @transaction.atomic
+    def rebuild(self, campaigns):
+        """ Recomputes the counters of ``campaigns`` from scratch. """
+        now = timezone.now()
+        for pk, values in self.compute(campaigns).items():
+            values["rebuilt_at"] = now
+            self.update_or_create(campaign_id=pk, defaults=values)
+
+    def drift(self, campaigns):
+        """
+        Returns ``{campaign_pk: {counter: (stored, actual)}}`` for every counter out of sync.
+        ``expired`` is a snapshot taken at ``rebuilt_at`` and is not compared.
+        """
+        stored = {stats.campaign_id: stats for stats in self.filter(campaign__in=campaigns)}
+        drift = {}
+        for pk, values in self.compute(campaigns).items():
+            stats = stored.get(pk)
+            for name in ["total", "used", "redeemed", "last_redeemed_at"]:
+                current = getattr(stats, name) if stats is not None else None
+                if current != values[name]:
+                    drift.setdefault(pk, {})[name] = (current, values[name])
+        return drift
+
+    def chunks(self, chunk_size, campaigns=None):
+        """ Yields lists of at most ``chunk_size`` campaign pks, walking the primary key. """
+        queryset = Campaign.objects.order_by("pk")
+        if campaigns:
+            queryset = queryset.filter(pk__in=campaigns)
+        last = None
+        while True:
+            chunk = queryset if last is None else queryset.filter(pk__gt=last)
+            chunk = list(chunk.values_list("pk", flat=True)[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last = chunk[-1]
+
+
+class CampaignStats(models.Model):
+    campaign = models.OneToOneField(
+        Campaign,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="stats",
+        verbose_name=_("Campaign"),
+    )
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Total"),
+    )
+    used = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Used"),
+        help_text=_("Coupons redeemed at least once"),
+    )
+    redeemed = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Redeemed"),
+        help_text=_("Number of redemptions"),
+    )
+    expired = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Expired"),
+        help_text=_("Expired coupons at the last rebuild"),
+    )
+    last_redeemed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("Last redeemed at"),
+    )
+    rebuilt_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("Rebuilt at"),
+    )
+
+    objects = CampaignStatsManager()
+
+    class Meta:
+        verbose_name = _("Campaign statistics")
+        verbose_name_plural = _("Campaign statistics")
+
+    def __str__(self):
+        return str(self.campaign)
+
 
 class CouponQuerySet(models.QuerySet):
     def used(self):
@@ -78,25 +323,124 @@ class CouponQuerySet(models.QuerySet):
         q2 = Q(Q(valid_until__isnull=True) | Q(valid_until__gte=now))
         return self.filter(q1 & q2)
 
+    def for_code(self, code):
+        """ Routes the queryset to the shard holding ``code`` when coupons are sharded and no database was chosen. """
+        shard = sharding.get_shard(code)
+        if self._db is None and shard is not None:
+            return self.using(shard)
+        return self
+
+    def filter_code(self, code):
+        """
+        Filters the coupons sharing the normalized form of ``code``. With ``COUPONS_CODE_INT_LOOKUP`` the codes packed
+        by ``Coupon.encode_code`` are looked up by ``code_int`` alone, the others by ``normalized_code``.
+        """
+        normalized_code = self.model.normalize_code(code)
+        code_int = self.model.encode_code(normalized_code) if CODE_INT_LOOKUP else None
+        if code_int is not None:
+            return self.for_code(code).filter(code_int=code_int)
+        return self.for_code(code).filter(normalized_code=normalized_code)
+
+    def filter_codes(self, codes):
+        """ Same as ``filter_code`` for several codes, in one query. """
+        normalized_codes = {self.model.normalize_code(code) for code in codes}
+        code_ints = {code: self.model.encode_code(code) for code in normalized_codes} if CODE_INT_LOOKUP else {}
+        encoded = {code for code, code_int in code_ints.items() if code_int is not None}
+        q = Q(normalized_code__in=normalized_codes - encoded)
+        if encoded:
+            q |= Q(code_int__in={code_ints[code] for code in encoded})
+        return self.filter(q)
+
+    def get_by_code(self, code):
+        """ Looks ``code`` up by its normalized form, see ``Coupon.match_code``. """
+        return self.model.match_code(code, self.filter_code(code))
+
+    def with_usage(self):
+        """
+        Annotates ``user_count``, ``redeemed_count`` and ``held_count`` (unexpired reservations), used by
+        ``is_usable`` and ``is_redeemed`` in place of a query.
+        """
+        users = CouponUser.objects.filter(coupon=OuterRef("pk")).order_by().values("coupon")
+        holds = CouponReservation.objects.filter(
+            coupon=OuterRef("pk"), expires_at__gt=Now(),
+        ).order_by().values("coupon")
+
+        def count(queryset):
+            counts = queryset.annotate(count=Count("pk")).values("count")
+            return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+        return self.annotate(
+            user_count=count(users),
+            redeemed_count=count(users.filter(redeemed_at__isnull=False)),
+            held_count=count(holds),
+        )
+
+    def for_user(self, user, campaigns=None):
+        """
+        Returns the coupons ``user`` can still redeem, in one query: the active coupons bound to the user and not
+        redeemed yet, plus the open ones (bound to nobody) of ``campaigns``, or of every campaign.
+        Usage follows ``Coupon.is_usable``: every ``CouponUser`` and unexpired hold counts against ``user_limit``.
+        """
+        if user is None or not user.is_authenticated:
+            return self.none()
+        users = CouponUser.objects.filter(coupon=OuterRef("pk"))
+        open_coupons = Q(campaign__isnull=False, bound_count=0)
+        if campaigns is not None:
+            open_coupons &= Q(campaign__in=campaigns)
+        return self.active().with_usage().annotate(
+            bound=Exists(users.filter(user=user, redeemed_at__isnull=True)),
+            redeemed_by_user=Exists(users.filter(user=user, redeemed_at__isnull=False)),
+            bound_count=Coalesce(Subquery(users.filter(user__isnull=False).order_by().values("coupon").annotate(count=Count("pk")).values("count"), output_field=IntegerField()), 0),  # noqa: E501
+        ).filter(
+            Q(bound=True) | open_coupons,
+            held_count__lt=F("user_limit") - F("user_count"),
+            redeemed_by_user=False,
+        )
+
 
 class CouponManager(models.Manager.from_queryset(CouponQuerySet)):
     def create_coupon(self, type, action, value, users=[], valid_from=None, valid_until=None, prefix="", campaign=None, user_limit=None, code_chars=CODE_CHARS, code_length=CODE_LENGTH):  # noqa
-        coupon = self.create(
-            value=value,
-            code=Coupon.generate_code(prefix=prefix, code_chars=code_chars, code_length=code_length),
-            type=type,
-            action=action,
-            valid_from=valid_from,
-            valid_until=valid_until,
-            campaign=campaign,
-        )
-        if user_limit is not None:  # otherwise use default value of model
-            coupon.user_limit = user_limit
+        with sharding.atomic_shards():
+            coupon = self._create_coupon(
+                type=type,
+                action=action,
+                value=value,
+                users=users,
+                valid_from=valid_from,
+                valid_until=valid_until,
+                prefix=prefix,
+                campaign=campaign,
+                user_limit=user_limit,
+                code_chars=code_chars,
+                code_length=code_length,
+            )
+            CampaignStats.objects.increment(campaign, total=1)
+            if campaign is not None and not any(users if isinstance(users, list) else [users]):
+                # open coupons of the campaign are listed in every wallet
+                transaction.on_commit(wallet.invalidate_all)
+        return coupon
+
+    def _create_coupon(self, type, action, value, users=[], valid_from=None, valid_until=None, prefix="", campaign=None, user_limit=None, code_chars=CODE_CHARS, code_length=CODE_LENGTH):  # noqa
+        extra = {} if user_limit is None else {"user_limit": user_limit}  # otherwise use default value of model
+        code = Coupon.generate_code(prefix=prefix, code_chars=code_chars, code_length=code_length)
+        shard = sharding.get_shard(code)
         try:
-            coupon.save()
+            # the savepoint keeps an outer transaction usable after a code collision
+            with transaction.atomic(using=shard):
+                coupon = self.db_manager(shard).create(
+                    value=value,
+                    code=code,
+                    type=type,
+                    action=action,
+                    valid_from=valid_from,
+                    valid_until=valid_until,
+                    campaign=campaign,
+                    **extra
+                )
         except IntegrityError:
             # Try again with other code
-            coupon = Coupon.objects.create_coupon(
+            metrics.incr("coupons_code_collisions_total")
+            coupon = Coupon.objects._create_coupon(
                 type=type,
                 action=action,
                 value=value,
@@ -105,6 +449,7 @@ class CouponManager(models.Manager.from_queryset(CouponQuerySet)):
                 valid_until=valid_until,
                 prefix=prefix,
                 campaign=campaign,
+                user_limit=user_limit,
                 code_chars=code_chars,
                 code_length=code_length,
             )
@@ -113,11 +458,24 @@ class CouponManager(models.Manager.from_queryset(CouponQuerySet)):
         for user in users:
             if user:
                 CouponUser(user=user, coupon=coupon).save()
+                transaction.on_commit(lambda user_id=user.pk: wallet.invalidate(user_id))
         return coupon
 
+    @metrics.timed("coupons_create_coupons_seconds")
     def create_coupons(self, quantity, type, action, value, valid_from=None, valid_until=None, prefix="", campaign=None, code_chars=CODE_CHARS, code_length=CODE_LENGTH):  # noqa
-        return [
-            self.create_coupon(
+        with sharding.atomic_shards():
+            coupons = self._create_coupons(
+                quantity, type, action, value, valid_from=valid_from, valid_until=valid_until, prefix=prefix,
+                campaign=campaign, code_chars=code_chars, code_length=code_length,
+            )
+            if campaign is not None and coupons:
+                # open coupons of the campaign are listed in every wallet
+                transaction.on_commit(wallet.invalidate_all)
+        return coupons
+
+    def _create_coupons(self, quantity, type, action, value, valid_from=None, valid_until=None, prefix="", campaign=None, code_chars=CODE_CHARS, code_length=CODE_LENGTH):  # noqa
+        coupons = [
+            self._create_coupon(
                 type=type,
                 action=action,
                 value=value,
@@ -131,12 +489,44 @@ class CouponManager(models.Manager.from_queryset(CouponQuerySet)):
             )
             for i in range(quantity)
         ]
+        CampaignStats.objects.increment(campaign, total=len(coupons))
+        metrics.incr("coupons_generated_total", len(coupons), type=type)
+        return coupons
+
+    def get_including_archived(self, code):
+        """
+        Looks ``code`` up among the coupons and then the archived ones, for audits. An ``ArchivedCoupon`` is
+        returned for archived codes, it has ``is_archived`` set.
+        """
+        try:
+            return self.get_by_code(code)
+        except Coupon.DoesNotExist:
+            pass
+        # archived rows stay on the shard of their code
+        archived = ArchivedCoupon.objects.using(sharding.get_shard(code)).filter(
+            normalized_code=Coupon.normalize_code(code),
+        )
+        try:
+            return Coupon.match_code(code, archived)
+        except Coupon.DoesNotExist:
+            raise Coupon.DoesNotExist("No coupon or archived coupon matches the code {!r}.".format(code))
 
+    @routers.use_primary
     def redeem(self, code, user, source=None, action=None):
-        q = {"code": code}
+        """
+        Looks ``code`` up and redeems it, counting one ``redeem`` rate limit hit. A code validated by ``CouponForm``
+        has been counted already, redeem it with ``CouponForm.redeem``.
+        """
+        ratelimit.check("redeem", user=user)
+        q = {}
         if action is not None:
             q["action"] = action
-        coupon = self.active().get(**q)
+        try:
+            coupon = self.active().filter(**q).get_by_code(code)
+        except Coupon.DoesNotExist:
+            metrics.incr("coupons_lookups_total", source="redeem", outcome="missing")
+            raise
+        metrics.incr("coupons_lookups_total", source="redeem", outcome="found")
         return coupon.redeem(user=user, source=source)
 
 
@@ -144,6 +534,8 @@ class Coupon(models.TimestampModel):
     Error = exceptions.CouponError
     ExpiredError = exceptions.CouponExpiredError
     IsUsableError = exceptions.CouponIsUsableError
+    RateLimitError = exceptions.CouponRateLimitError
+    StackingError = exceptions.CouponStackingError
 
     objects = CouponManager()
 
@@ -158,6 +550,19 @@ class Coupon(models.TimestampModel):
         verbose_name=_("Code"),
         help_text=_("Leaving this field empty will generate a random code."),
     )
+    normalized_code = models.CharField(
+        max_length=30,
+        db_index=True,
+        editable=False,
+        default="",
+        verbose_name=_("Normalized code"),
+    )
+    code_int = models.BigIntegerField(
+        null=True,
+        db_index=True,
+        editable=False,
+        verbose_name=_("Integer code"),
+    )
     type = models.CharField(
         choices=COUPON_TYPES,
         max_length=20,
@@ -200,17 +605,35 @@ class Coupon(models.TimestampModel):
         verbose_name = _("Coupon")
         verbose_name_plural = _("Coupons")
 
+    is_archived = False
+
     def __str__(self):
         return self.code
 
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = Coupon.generate_code()
+        self.normalized_code = Coupon.normalize_code(self.code)
+        self.code_int = Coupon.encode_code(self.normalized_code)
         super().save(*args, **kwargs)
+        normalized_code = self.normalized_code
+        transaction.on_commit(lambda: cache.evict([normalized_code]), using=self._state.db)
+
+    def delete(self, *args, **kwargs):
+        normalized_code = self.normalized_code
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: cache.evict([normalized_code]), using=self._state.db)
+        return result
 
     def expired(self):
         return self.is_expired
 
+    @property
+    def is_active(self):
+        """ Same as ``CouponQuerySet.active()`` for a single coupon. """
+        now = timezone.now()
+        return (self.valid_from is None or self.valid_from <= now) and (self.valid_until is None or self.valid_until >= now)  # noqa: E501
+
     @property
     def is_expired(self):
         return self.valid_until is not None and self.valid_until < timezone.now()
@@ -218,9 +641,10 @@ class Coupon(models.TimestampModel):
     @property
     def is_redeemed(self):
         """ Returns true is a coupon is redeemed (completely for all users) otherwise returns false. """
-        return self.users.filter(
-            redeemed_at__isnull=False
-        ).count() >= self.user_limit and self.user_limit is not 0
+        redeemed_count = getattr(self, "redeemed_count", None)
+        if redeemed_count is None:
+            redeemed_count = self.users.filter(redeemed_at__isnull=False).count()
+        return redeemed_count >= self.user_limit and self.user_limit is not 0
 
     @property
     def redeemed_at(self):
@@ -238,17 +662,142 @@ class Coupon(models.TimestampModel):
         else:
             return prefix + code
 
+    @classmethod
+    def normalize_code(cls, code):
+        """
+        Returns the canonical form of ``code``: without whitespace and segment separators, uppercased and with the
+        ``CODE_CONFUSABLES`` characters replaced.
+        """
+        code = "".join((code or "").split())
+        if SEGMENT_SEPARATOR:
+            code = code.replace(SEGMENT_SEPARATOR, "")
+        return code.upper().translate(CODE_CONFUSABLES)
+
+    @classmethod
+    def get_code_digits(cls):
+        digits = cls.__dict__.get("_code_digits")
+        if digits is None:
+            chars = sorted(set(cls.normalize_code(CODE_CHARS)))
+            digits = cls._code_digits = {char: digit for digit, char in enumerate(chars, 1)}
+        return digits
+
+    @classmethod
+    def encode_code(cls, normalized_code):
+        """
+        Packs ``normalized_code`` into a positive 64-bit integer, its characters being the digits of a bijective
+        numeral over the normalized ``CODE_CHARS``: two codes never share a value. Returns ``None`` for codes using
+        characters outside of ``CODE_CHARS`` or too long to fit (more than 12 characters with the default alphabet).
+        """
+        if not normalized_code:
+            return None
+        digits = cls.get_code_digits()
+        base = len(digits)
+        value = 0
+        try:
+            for char in normalized_code:
+                value = value * base + digits[char]
+        except KeyError:
+            return None
+        return value if value < 2 ** 63 else None
+
+    @classmethod
+    def get_code_int_length(cls):
+        """ Returns the length of the longest normalized codes ``encode_code`` packs whatever their characters. """
+        digits = cls.get_code_digits()
+        last = max(digits, key=digits.get)
+        length = 0
+        while cls.encode_code(last * (length + 1)) is not None:
+            length += 1
+        return length
+
+    @classmethod
+    def check(cls, **kwargs):
+        errors = super().check(**kwargs)
+        if CODE_INT_LOOKUP and CODE_LENGTH > cls.get_code_int_length():
+            errors.append(checks.Error(
+                "COUPONS_CODE_INT_LOOKUP packs codes of at most {} characters, COUPONS_CODE_LENGTH is {}.".format(
+                    cls.get_code_int_length(), CODE_LENGTH,
+                ),
+                hint="Lower COUPONS_CODE_LENGTH or disable COUPONS_CODE_INT_LOOKUP, longer codes have no code_int.",
+                obj=cls,
+                id="coupons.E001",
+            ))
+        return errors
+
+    @classmethod
+    def match_code(cls, code, candidates):
+        """
+        Picks the coupon for ``code`` among ``candidates`` sharing its normalized form: an exact match wins, otherwise
+        the only candidate. Codes differing only by case or confusable characters can coexist, their normalized
+        lookup is ambiguous and raises ``DoesNotExist`` like a missing code.
+        """
+        candidates = list(candidates)
+        for coupon in candidates:
+            if coupon.code == code:
+                return coupon
+        if len(candidates) == 1:
+            return candidates[0]
+        raise cls.DoesNotExist("No coupon matches the code {!r}.".format(code))
+
+    def get_discount(self, cart):
+        """ Returns the discount of the coupon on ``cart``, see ``coupons.discounts.apply_discounts``. """
+        return discounts.apply_discounts([cart], [self], use_numpy=False)[0]
+
+    def lock(self):
+        """
+        Locks the coupon row until the end of the transaction and drops the ``with_usage()`` annotations, a snapshot
+        for display: the usage is counted again under the lock.
+        """
+        Coupon.objects.db_manager(hints={"instance": self}).select_for_update().values_list("pk", flat=True).get(pk=self.pk)  # noqa: E501
+        self.forget_usage()
+
+    def forget_usage(self):
+        """ Drops the ``with_usage()`` annotations, ``is_usable`` and ``is_redeemed`` count again. """
+        for name in ("user_count", "redeemed_count", "held_count"):
+            self.__dict__.pop(name, None)
+
     @property
     def is_usable(self):
         user_limit = self.user_limit
-        is_usable = -1 < CouponUser.objects.filter(coupon=self).count() < user_limit
+        user_count, held_count = getattr(self, "user_count", None), getattr(self, "held_count", None)
+        if user_count is None or held_count is None:
+            user_count, held_count = Coupon.objects.db_manager(hints={"instance": self}).filter(pk=self.pk).with_usage().values_list(  # noqa: E501
+                "user_count", "held_count",
+            ).get()
+        is_usable = -1 < user_count + held_count < user_limit
         if is_usable:
             is_usable = self.do_is_usable_pipeline()
         return is_usable
 
-    @transaction.atomic
+    @routers.use_primary
+    @sharding.atomic
+    def reserve(self, user=None, ttl=RESERVATION_TTL):
+        """
+        Holds one use of the coupon for ``ttl`` seconds, until ``CouponReservation.confirm`` redeems it or the hold is
+        released. Holds count against ``user_limit`` in ``is_usable``. The coupon row is locked while checking.
+        """
+        self.lock()
+        if not self.is_usable:
+            raise Coupon.IsUsableError()
+        if self.is_expired:
+            raise Coupon.ExpiredError()
+        return CouponReservation.objects.create(
+            coupon=self,
+            user=user,
+            expires_at=timezone.now() + timedelta(seconds=ttl),
+        )
+
+    @routers.use_primary
+    @sharding.atomic
+    @metrics.timed("coupons_redeem_seconds")
     def redeem(self, user=None, source=None, **kwargs):
+        """
+        Redeems one use of the coupon. The coupon row is locked while checking, like ``reserve``, so concurrent
+        redemptions and holds cannot exceed ``user_limit``.
+        """
+        self.lock()
         if not self.is_usable:
+            metrics.incr("coupons_redemptions_total", type=self.type, outcome="rejected")
             raise Coupon.IsUsableError()
 
         coupon_user = CouponUser(coupon=self, user=user)
@@ -259,7 +808,30 @@ class Coupon(models.TimestampModel):
 
         coupon_user.save()
 
+        using = sharding.get_write_db(self)
+        if self.campaign_id is not None:
+            first = not self.users.filter(redeemed_at__isnull=False).exclude(pk=coupon_user.pk).exists()
+            # the counters live on the default database, a shard updates them once the redemption commits
+            sharding.on_commit(partial(
+                CampaignStats.objects.increment,
+                self.campaign_id,
+                used=1 if first else 0,
+                redeemed=1,
+                last_redeemed_at=coupon_user.redeemed_at,
+            ), using)
+        if user is not None:
+            transaction.on_commit(lambda: wallet.invalidate(user.pk), using=using)
+            # the replicas lag behind, the next reads of the user go to the primary
+            transaction.on_commit(lambda: routers.pin_user(user), using=using)
+        if ROLLUP_ON_REDEEM:
+            sharding.on_commit(partial(
+                RedemptionRollup.objects.append, [(coupon_user.redeemed_at, self.campaign_id, self.type, self.action)],
+            ), using)
+        if OUTBOX_ENABLED:
+            RedemptionEvent.objects.append(self, coupon_user)
+
         self.do_redeem_pipeline(coupon_user=coupon_user, user=user, source=source, **kwargs)
+        metrics.incr("coupons_redemptions_total", type=self.type, outcome="redeemed")
 
         return coupon_user
 
@@ -267,7 +839,8 @@ class Coupon(models.TimestampModel):
         coupon = self
         for name in getattr(settings, "COUPONS_IS_USABLE_PIPELINE", []):
             pipeline = import_string(name)
-            coupon, is_usable = pipeline(coupon=coupon, **kwargs)
+            with metrics.timer("coupons_pipeline_seconds", pipeline="is_usable", stage=name):
+                coupon, is_usable = pipeline(coupon=coupon, **kwargs)
             if not is_usable:
                 return False
         return True
@@ -276,10 +849,117 @@ class Coupon(models.TimestampModel):
         coupon = self
         for name in getattr(settings, "COUPONS_REDEEM_PIPELINE", []):
             pipeline = import_string(name)
-            coupon = pipeline(coupon=coupon, **kwargs)
+            with metrics.timer("coupons_pipeline_seconds", pipeline="redeem", stage=name):
+                coupon = pipeline(coupon=coupon, **kwargs)
+
+
+class StackingRuleQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # no signal is sent for an update
+        transaction.on_commit(stacking.invalidate)
+        return super().update(**kwargs)
+
+
+class StackingRule(models.TimestampModel):
+    """
+    Restricts which coupons can be used together. The rule applies to the coupons matching all of its ``type``,
+    ``action`` and ``campaign`` (an empty one matches everything): at most ``max_coupons`` of them in a set, and
+    none together with a coupon of the ``excluded_campaigns``.
+    """
+    objects = StackingRuleQuerySet.as_manager()
+
+    name = models.CharField(
+        max_length=255,
+        verbose_name=_("Name"),
+    )
+    is_active = models.BooleanField(
+        default=True,
+        verbose_name=_("Active"),
+    )
+    type = models.CharField(
+        choices=COUPON_TYPES,
+        max_length=20,
+        blank=True,
+        verbose_name=_("Type"),
+    )
+    action = models.CharField(
+        choices=ACTION_TYPES,
+        max_length=20,
+        blank=True,
+        verbose_name=_("Action"),
+    )
+    campaign = models.ForeignKey(
+        Campaign,
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="stacking_rules",
+        verbose_name=_("Campaign"),
+    )
+    max_coupons = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_("Max coupons"),
+        help_text=_("Maximum number of matching coupons used together, leave empty for no limit."),
+    )
+    excluded_campaigns = models.ManyToManyField(
+        Campaign,
+        blank=True,
+        related_name="+",
+        verbose_name=_("Excluded campaigns"),
+        help_text=_("Matching coupons cannot be used together with coupons of these campaigns."),
+    )
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name = _("Stacking rule")
+        verbose_name_plural = _("Stacking rules")
+
+    def __str__(self):
+        return self.name
+
+
+def invalidate_stacking(sender, **kwargs):
+    # on commit, so the excluded campaigns saved after the rule are compiled too
+    transaction.on_commit(stacking.invalidate)
+
+
+post_save.connect(invalidate_stacking, sender=StackingRule)
+post_delete.connect(invalidate_stacking, sender=StackingRule)
+# also connected to post_delete, so deleting an excluded campaign sends it instead of a bare DELETE
+post_delete.connect(invalidate_stacking, sender=StackingRule.excluded_campaigns.through)
+m2m_changed.connect(invalidate_stacking, sender=StackingRule.excluded_campaigns.through)
+
+
+class CouponUserQuerySet(models.QuerySet):
+    def redeemed(self):
+        return self.filter(redeemed_at__isnull=False)
+
+    def history(self, user=None, campaign=None):
+        """ Redemptions of ``user`` and/or ``campaign``, newest first, in ``(redeemed_at, id)`` keyset order. """
+        queryset = self.redeemed()
+        if user is not None:
+            queryset = queryset.filter(user=user)
+        if campaign is not None:
+            queryset = queryset.filter(coupon__campaign=campaign)
+        return queryset.select_related("coupon", "coupon__campaign", "user").order_by("-redeemed_at", "-id")
+
+    def before(self, redeemed_at, pk):
+        """ Keyset filter returning the rows after ``(redeemed_at, pk)`` in ``history()`` order. """
+        return self.filter(Q(redeemed_at__lt=redeemed_at) | Q(redeemed_at=redeemed_at, pk__lt=pk))
+
+    def after(self, redeemed_at, pk):
+        """ Keyset filter returning the rows after ``(redeemed_at, pk)`` in chronological order. """
+        return self.filter(Q(redeemed_at__gt=redeemed_at) | Q(redeemed_at=redeemed_at, pk__gt=pk))
+
+    def with_sources(self):
+        """ Prefetches ``source`` with one query per content type instead of one per row. """
+        return self.prefetch_related("source")
 
 
 class CouponUser(models.TimestampModel):
+    objects = CouponUserQuerySet.as_manager()
+
     coupon = models.ForeignKey(
         Coupon,
         on_delete=models.CASCADE,
@@ -318,6 +998,481 @@ class CouponUser(models.TimestampModel):
     class Meta:
         verbose_name = _("Coupon")
         verbose_name_plural = _("Coupons")
+        indexes = [
+            models.Index(fields=["redeemed_at", "id"], name="coupons_history_idx"),
+            models.Index(fields=["user", "redeemed_at", "id"], name="coupons_user_history_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.user)
+
+
+class CouponReservationQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+    def sweep(self, batch_size=1000):
+        """ Deletes the expired holds ``batch_size`` at a time, each batch in its own short query. """
+        deleted = 0
+        for alias in sharding.get_shards():
+            queryset = self.using(alias)
+            while True:
+                pks = list(queryset.expired().order_by("expires_at").values_list("pk", flat=True)[:batch_size])
+                if not pks:
+                    break
+                deleted += CouponReservation.objects.using(queryset.db).filter(pk__in=pks).delete()[0]
+        return deleted
+
+
+class CouponReservation(models.TimestampModel):
+    """ A time limited hold on one use of a coupon, taken at checkout and confirmed once the payment is captured. """
+    objects = CouponReservationQuerySet.as_manager()
+
+    token = models.UUIDField(
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+        verbose_name=_("Token"),
+    )
+    coupon = models.ForeignKey(
+        Coupon,
+        on_delete=models.CASCADE,
+        related_name="reservations",
+        verbose_name=_("Coupon"),
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name=_("User"),
+    )
+    expires_at = models.DateTimeField(
+        db_index=True,
+        verbose_name=_("Expires at"),
+    )
+
+    class Meta:
+        verbose_name = _("Reservation")
+        verbose_name_plural = _("Reservations")
+        indexes = [
+            models.Index(fields=["coupon", "expires_at"], name="coupons_reservation_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.token)
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    @routers.use_primary
+    @sharding.atomic
+    def confirm(self, source=None, **kwargs):
+        """ Turns the hold into a redemption of its user, raises ``Coupon.ExpiredError`` once it expired. """
+        locked = CouponReservation.objects.db_manager(hints={"instance": self}).select_for_update().filter(
+            pk=self.pk,
+        ).values_list("pk", flat=True)
+        if not list(locked) or self.is_expired:
+            raise Coupon.ExpiredError()
+        self.delete()
+        return self.coupon.redeem(user=self.user, source=source, **kwargs)
+
+    def release(self):
+        CouponReservation.objects.db_manager(hints={"instance": self}).filter(pk=self.pk).delete()
+
+
+class RedemptionRollupManager(models.Manager):
+    def truncate(self, value, period):
+        """ Returns the start of the ``period`` bucket containing ``value`` (UTC based when time zones are enabled). """
+        if timezone.is_aware(value):
+            value = value.astimezone(dt_timezone.utc)
+        value = value.replace(minute=0, second=0, microsecond=0)
+        if period == RedemptionRollup.DAY:
+            value = value.replace(hour=0)
+        return value
+
+    def append(self, redemptions):
+        """
+        Appends rollup rows for ``redemptions``, an iterable of ``(redeemed_at, campaign_id, type, action)``.
+        Rows are never updated, so concurrent writers do not contend on the same bucket.
+        """
+        counter = Counter()
+        for redeemed_at, campaign_id, type, action in redemptions:
+            for period in RedemptionRollup.PERIODS:
+                counter[(period, self.truncate(redeemed_at, period), campaign_id, type, action)] += 1
+        self.bulk_create([
+            RedemptionRollup(period=period, bucket=bucket, campaign_id=campaign_id, type=type, action=action, count=count)  # noqa
+            for (period, bucket, campaign_id, type, action), count in counter.items()
+        ])
+        return sum(counter.values()) // len(RedemptionRollup.PERIODS)
+
+    @routers.use_primary
+    def roll_up(self, batch_size=1000, safety_margin=None):
+        """
+        Appends the redemptions recorded after the stored ``(redeemed_at, pk)`` high-watermark, ``batch_size`` at
+        a time. A primary key is allocated on insert but visible on commit, and a bound ``CouponUser`` is redeemed
+        long after its insert: only the redemptions older than ``safety_margin`` seconds are read, a transaction
+        still running at that time would commit behind the watermark. Redemptions are read on the primary, a lagging
+        replica would miss rows behind the advanced watermark. Each shard has its own watermark.
+        """
+        if safety_margin is None:
+            safety_margin = ROLLUP_SAFETY_MARGIN
+        horizon = timezone.now() - timedelta(seconds=safety_margin)
+        count = 0
+        for alias in sharding.get_shards():
+            name = "redemptions" if alias is None else "redemptions:{}".format(alias)
+            while True:
+                with transaction.atomic():
+                    cursor, created = RollupCursor.objects.select_for_update().get_or_create(name=name)
+                    queryset = CouponUser.objects.using(alias).filter(redeemed_at__lt=horizon)
+                    if cursor.timestamp is not None:
+                        queryset = queryset.after(cursor.timestamp, cursor.position)
+                    rows = list(
+                        queryset.order_by("redeemed_at", "pk").values_list(
+                            "pk", "redeemed_at", "coupon__campaign", "coupon__type", "coupon__action",
+                        )[:batch_size]
+                    )
+                    if not rows:
+                        break
+                    count += self.append(row[1:] for row in rows)
+                    cursor.position, cursor.timestamp = rows[-1][0], rows[-1][1]
+                    cursor.save()
+        return count
+
+    def series(self, start, end, period="hour", campaign=None, type=None, action=None):
+        """ Returns the ``[(bucket, count), ...]`` time series between ``start`` and ``end``, zero filled. """
+        queryset = self.filter(period=period, bucket__gte=self.truncate(start, period), bucket__lte=end)
+        if campaign is not None:
+            queryset = queryset.filter(campaign=campaign)
+        if type is not None:
+            queryset = queryset.filter(type=type)
+        if action is not None:
+            queryset = queryset.filter(action=action)
+        counts = dict(queryset.order_by().values_list("bucket").annotate(total=Sum("count")))
+        step = timedelta(days=1) if period == RedemptionRollup.DAY else timedelta(hours=1)
+        bucket, series = self.truncate(start, period), []
+        while bucket <= end:
+            series.append((bucket, counts.get(bucket, 0)))
+            bucket += step
+        return series
+
+
+class RedemptionRollup(models.Model):
+    HOUR = "hour"
+    DAY = "day"
+    PERIODS = [HOUR, DAY]
+
+    period = models.CharField(
+        choices=[(HOUR, _("Hour")), (DAY, _("Day"))],
+        max_length=4,
+        verbose_name=_("Period"),
+    )
+    bucket = models.DateTimeField(
+        verbose_name=_("Bucket"),
+    )
+    campaign = models.ForeignKey(
+        Campaign,
+        blank=True,
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name=_("Campaign"),
+    )
+    type = models.CharField(
+        choices=COUPON_TYPES,
+        max_length=20,
+        verbose_name=_("Type"),
+    )
+    action = models.CharField(
+        choices=ACTION_TYPES,
+        max_length=20,
+        blank=True,
+        verbose_name=_("Action"),
+    )
+    count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Count"),
+    )
+
+    objects = RedemptionRollupManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["period", "campaign", "bucket"], name="coupons_rollup_campaign_idx"),
+            models.Index(fields=["period", "bucket"], name="coupons_rollup_bucket_idx"),
+        ]
+        verbose_name = _("Redemption rollup")
+        verbose_name_plural = _("Redemption rollups")
+
+    def __str__(self):
+        return "{} {}".format(self.bucket, self.count)
+
+
+class RollupCursor(models.Model):
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name=_("Name"),
+    )
+    position = models.BigIntegerField(
+        default=0,
+        verbose_name=_("Position"),
+    )
+    timestamp = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("Timestamp"),
+    )
+
+    class Meta:
+        verbose_name = _("Rollup cursor")
+        verbose_name_plural = _("Rollup cursors")
+
+    def __str__(self):
+        return self.name
+
+
+class RedemptionEventManager(models.Manager):
+    def append(self, coupon, coupon_user):
+        """
+        Appends the event of ``coupon_user`` on the database the coupon is written to, in the redemption transaction:
+        the event is visible exactly when the redemption is.
+        """
+        return self.db_manager(sharding.get_write_db(coupon)).create(
+            coupon_user_id=coupon_user.pk,
+            coupon_id=coupon.pk,
+            code=coupon.code,
+            campaign_id=coupon.campaign_id,
+            user_id=coupon_user.user_id,
+            type=coupon.type,
+            action=coupon.action,
+            value=coupon.value,
+            redeemed_at=coupon_user.redeemed_at,
+            source_type_id=coupon_user.source_type_id,
+            source_id=coupon_user.source_id,
+        )
+
+
+class RedemptionEvent(models.Model):
+    """
+    A redemption in the outbox, read by ``coupons.outbox.Consumer`` in ``id`` order.
+    The ids are plain columns, the event outlives the archiving or the purge of what it refers to.
+    """
+    objects = RedemptionEventManager()
+
+    id = models.BigAutoField(
+        primary_key=True,
+        verbose_name=_("ID"),
+    )
+    coupon_user_id = models.IntegerField(
+        verbose_name=_("Redemption"),
+    )
+    coupon_id = models.IntegerField(
+        verbose_name=_("Coupon"),
+    )
+    code = models.CharField(
+        max_length=30,
+        verbose_name=_("Code"),
+    )
+    campaign_id = models.IntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_("Campaign"),
+    )
+    user_id = models.IntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_("User"),
+    )
+    type = models.CharField(
+        choices=COUPON_TYPES,
+        max_length=20,
+        verbose_name=_("Type"),
+    )
+    action = models.CharField(
+        choices=ACTION_TYPES,
+        max_length=20,
+        verbose_name=_("Action"),
+    )
+    value = models.IntegerField(
+        verbose_name=_("Value"),
+    )
+    redeemed_at = models.DateTimeField(
+        verbose_name=_("Redeemed at"),
+    )
+    source_type_id = models.IntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_("source content type"),
+    )
+    source_id = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_("source id"),
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name=_("Created at"),
+    )
+
+    class Meta:
+        verbose_name = _("Redemption event")
+        verbose_name_plural = _("Redemption events")
+
+    def __str__(self):
+        return "{} {}".format(self.pk, self.code)
+
+
+class PendingEvent(models.Model):
+    """
+    An outbox id a ``coupons.outbox.Consumer`` moved past before its event showed up, read again by the next polls
+    until it does or until the consumer gives it up.
+    """
+    cursor = models.ForeignKey(
+        RollupCursor,
+        on_delete=models.CASCADE,
+        related_name="pending_events",
+        verbose_name=_("Cursor"),
+    )
+    event_id = models.BigIntegerField(
+        verbose_name=_("Event"),
+    )
+    skipped_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name=_("Skipped at"),
+    )
+
+    class Meta:
+        unique_together = [("cursor", "event_id")]
+        verbose_name = _("Pending event")
+        verbose_name_plural = _("Pending events")
+
+    def __str__(self):
+        return "{} {}".format(self.cursor, self.event_id)
+
+
+class ArchivedCoupon(models.Model):
+    """ A coupon moved out of ``Coupon`` by ``archive_coupons``, keeping its primary key. """
+    id = models.IntegerField(
+        primary_key=True,
+        verbose_name=_("ID"),
+    )
+    value = models.IntegerField(
+        verbose_name=_("Value"),
+    )
+    code = models.CharField(
+        max_length=30,
+        db_index=True,
+        verbose_name=_("Code"),
+    )
+    normalized_code = models.CharField(
+        max_length=30,
+        db_index=True,
+        verbose_name=_("Normalized code"),
+    )
+    type = models.CharField(
+        choices=COUPON_TYPES,
+        max_length=20,
+        verbose_name=_("Type"),
+    )
+    action = models.CharField(
+        choices=ACTION_TYPES,
+        max_length=20,
+        blank=True,
+        verbose_name=_("Action"),
+    )
+    user_limit = models.PositiveIntegerField(
+        verbose_name=_("User limit"),
+    )
+    valid_from = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("Valid from"),
+    )
+    valid_until = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("Valid until"),
+    )
+    campaign = models.ForeignKey(
+        Campaign,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name=_("Campaign"),
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("created"),
+    )
+    archived_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name=_("Archived at"),
+    )
+
+    is_archived = True
+
+    class Meta:
+        ordering = ["-archived_at"]
+        verbose_name = _("Archived coupon")
+        verbose_name_plural = _("Archived coupons")
+
+    def __str__(self):
+        return self.code
+
+
+class ArchivedCouponUser(models.Model):
+    id = models.IntegerField(
+        primary_key=True,
+        verbose_name=_("ID"),
+    )
+    coupon = models.ForeignKey(
+        ArchivedCoupon,
+        on_delete=models.CASCADE,
+        related_name="users",
+        verbose_name=_("Coupon"),
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name=_("User"),
+    )
+    redeemed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_("Redeemed at"),
+    )
+    source_type = models.ForeignKey(
+        models.ContentType,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name=_("source content type"),
+    )
+    source_id = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_("source id"),
+    )
+    source = models.GenericForeignKey(
+        "source_type", "source_id",
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("created"),
+    )
+
+    class Meta:
+        verbose_name = _("Archived redemption")
+        verbose_name_plural = _("Archived redemptions")
 
     def __str__(self):
         return str(self.user)
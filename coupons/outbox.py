@@ -0,0 +1,246 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import logging
+from datetime import timedelta
+
+from django.db import router, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from . import routers, sharding
+from .settings import OUTBOX_BATCH_SIZE, OUTBOX_GAP_TIMEOUT, OUTBOX_RECONCILE_TIMEOUT
+
+CURSOR_PREFIX = "outbox"
+
+logger = logging.getLogger("coupons.outbox")
+
+
+def get_label(alias):
+    return alias or "default"
+
+
+def get_cursor_prefix(alias):
+    return "{}:{}:".format(CURSOR_PREFIX, get_label(alias))
+
+
+def get_queryset(alias=None):
+    """ Returns the events of the shard ``alias``, read from the primary since the replicas lag behind. """
+    from .models import RedemptionEvent
+
+    queryset = RedemptionEvent.objects.all()
+    if alias is not None:
+        queryset = queryset.using(alias)
+    return queryset.order_by("pk")
+
+
+def event_to_json(event):
+    return {
+        "id": event.pk,
+        "redemption": event.coupon_user_id,
+        "coupon": event.coupon_id,
+        "code": event.code,
+        "campaign": event.campaign_id,
+        "user": event.user_id,
+        "type": event.type,
+        "action": event.action,
+        "value": event.value,
+        "redeemed_at": event.redeemed_at.isoformat(),
+        "source_type": event.source_type_id,
+        "source_id": event.source_id,
+    }
+
+
+class Consumer:
+    """
+    Reads the outbox from a position stored in a ``RollupCursor`` per shard, named after the consumer.
+
+        consumer = Consumer("billing")
+        for batch in consumer.batches():
+            send(batch)
+
+    Ids are allocated when a row is inserted, not when it is committed: a transaction still in flight can hold an
+    id lower than events already visible. ``poll()`` stops at such a gap until the missing id shows up, or until
+    the event after it is older than ``gap_timeout`` seconds. The cursor then moves past the id but keeps it as a
+    ``PendingEvent``, read again by the next polls: a late commit is still delivered, out of order. The id is given
+    up, with a warning, once it is missing for ``reconcile_timeout`` seconds.
+    """
+    def __init__(self, name, batch_size=OUTBOX_BATCH_SIZE, gap_timeout=OUTBOX_GAP_TIMEOUT,
+                 reconcile_timeout=OUTBOX_RECONCILE_TIMEOUT):
+        from .models import RollupCursor
+
+        max_length = RollupCursor._meta.get_field("name").max_length
+        longest = max(len(get_cursor_prefix(alias)) for alias in sharding.get_shards()) + len(name)
+        if not name or ":" in name or longest > max_length:
+            raise ValueError("Invalid consumer name {!r}.".format(name))
+        self.name = name
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self.reconcile_timeout = reconcile_timeout
+
+    def get_cursor_name(self, alias=None):
+        return get_cursor_prefix(alias) + self.name
+
+    def register(self):
+        """ Creates the cursors of the consumer, from then on ``prune()`` keeps the events it did not acknowledge. """
+        from .models import RollupCursor
+
+        for alias in sharding.get_shards():
+            RollupCursor.objects.get_or_create(name=self.get_cursor_name(alias))
+
+    def get_position(self, alias=None):
+        from .models import RollupCursor
+
+        with routers.primary():
+            position = RollupCursor.objects.filter(name=self.get_cursor_name(alias)).values_list("position", flat=True)
+            return position.first() or 0
+
+    def get_pending(self, alias=None):
+        """ Returns ``{event_id: skipped_at}``, the ids of the shard ``alias`` the cursor moved past. """
+        from .models import PendingEvent
+
+        with routers.primary():
+            pending = PendingEvent.objects.filter(cursor__name=self.get_cursor_name(alias))
+            return dict(pending.values_list("event_id", "skipped_at"))
+
+    def give_up(self, alias, pks):
+        from .models import PendingEvent
+
+        logger.warning(
+            "Consumer %s gave up the outbox events %s of %s, missing for %s seconds.",
+            self.name, sorted(pks), get_label(alias), self.reconcile_timeout,
+        )
+        PendingEvent.objects.filter(cursor__name=self.get_cursor_name(alias), event_id__in=pks).delete()
+
+    def poll(self, alias=None):
+        """
+        Returns the next events of the shard ``alias``, at most ``batch_size``: the pending ids that showed up, then
+        the events after the cursor without a gap.
+        """
+        position = self.get_position(alias)
+        pending = self.get_pending(alias)
+        with routers.primary():
+            events = list(get_queryset(alias).filter(Q(pk__gt=position) | Q(pk__in=pending))[:self.batch_size])
+            reconcile_horizon = timezone.now() - timedelta(seconds=self.reconcile_timeout)
+            expired = [pk for pk, skipped_at in pending.items() if skipped_at < reconcile_horizon]
+            if expired:
+                expired = set(expired) - set(get_queryset(alias).filter(pk__in=expired).values_list("pk", flat=True))
+        if expired:
+            self.give_up(alias, expired)
+        horizon = timezone.now() - timedelta(seconds=self.gap_timeout)
+        batch = []
+        for event in events:
+            if event.pk in pending:
+                batch.append(event)
+                continue
+            if event.pk != position + 1 and event.created_at > horizon:
+                break
+            batch.append(event)
+            position = event.pk
+        return batch
+
+    def ack(self, events, alias=None):
+        """
+        Moves the cursor of the shard ``alias`` past ``events``, it never moves back. The ids skipped on the way are
+        kept pending, unless the event after them is older than ``reconcile_timeout`` seconds.
+        """
+        from .models import PendingEvent, RollupCursor
+
+        if not events:
+            return
+        reconcile_horizon = timezone.now() - timedelta(seconds=self.reconcile_timeout)
+        with transaction.atomic():
+            cursor, created = RollupCursor.objects.select_for_update().get_or_create(name=self.get_cursor_name(alias))
+            PendingEvent.objects.filter(cursor=cursor, event_id__in=[event.pk for event in events]).delete()
+            position, skipped, expired = cursor.position, [], []
+            for event in events:
+                if event.pk <= position:
+                    continue
+                # a cursor still at 0 starts at its first event, the ids before it may have been pruned
+                if position:
+                    gap = range(position + 1, event.pk)
+                    (skipped if event.created_at >= reconcile_horizon else expired).extend(gap)
+                position = event.pk
+            PendingEvent.objects.bulk_create([PendingEvent(cursor=cursor, event_id=pk) for pk in skipped])
+            RollupCursor.objects.filter(pk=cursor.pk, position__lt=position).update(position=position)
+        if expired:
+            logger.warning(
+                "Consumer %s skipped the outbox events %s of %s, missing for over %s seconds.",
+                self.name, expired, get_label(alias), self.reconcile_timeout,
+            )
+
+    def batches(self):
+        """
+        Yields the pending batches, shard after shard. A batch is acknowledged when the next one is requested, so
+        an event is delivered at least once: a consumer stopping before that receives the batch again.
+        """
+        for alias in sharding.get_shards():
+            while True:
+                batch = self.poll(alias)
+                if not batch:
+                    break
+                yield batch
+                self.ack(batch, alias=alias)
+
+    def lag(self):
+        """ Returns the number of events not acknowledged yet, pending ids that showed up included. """
+        count = 0
+        with routers.primary():
+            for alias in sharding.get_shards():
+                events = Q(pk__gt=self.get_position(alias)) | Q(pk__in=self.get_pending(alias))
+                count += get_queryset(alias).filter(events).count()
+        return count
+
+
+def prune(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Deletes the events acknowledged by every registered consumer, ``batch_size`` at a time, up to the lowest pending
+    id. Events of a shard without any consumer are kept. Returns the number of events deleted.
+    """
+    from .models import PendingEvent, RedemptionEvent, RollupCursor
+
+    count = 0
+    for alias in sharding.get_shards():
+        with routers.primary():
+            cursors = RollupCursor.objects.filter(name__startswith=get_cursor_prefix(alias))
+            position = min(cursors.values_list("position", flat=True), default=None)
+            pending = PendingEvent.objects.filter(cursor__in=cursors).aggregate(first=Min("event_id"))["first"]
+        if position is None:
+            continue
+        if pending is not None:
+            # a pending id may still commit, its event must outlive the pruning
+            position = min(position, pending - 1)
+        using = alias or router.db_for_write(RedemptionEvent)
+        queryset = get_queryset(alias).using(using).filter(pk__lte=position)
+        while True:
+            pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                break
+            # the events have no relations, the collector deletes them with one statement per chunk
+            RedemptionEvent.objects.using(using).filter(pk__in=pks).delete()
+            count += len(pks)
+    return count
@@ -0,0 +1,88 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .settings import ESTIMATED_COUNT_THRESHOLD
+
+
+def estimate_count(queryset):
+    """
+    Returns the planner row estimate for ``queryset``, or ``None`` when the database cannot provide one.
+    Only PostgreSQL is supported.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the planner estimate for big result sets instead of an exact ``COUNT(*)``.
+    Counts below ``threshold`` are still exact.
+    """
+    threshold = ESTIMATED_COUNT_THRESHOLD
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list) if hasattr(self.object_list, "query") else None
+        if estimate is None or estimate < self.threshold:
+            return super().count
+        return estimate
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(value, pk):
+    """ Encodes the ``(datetime, pk)`` keyset position as an url safe ``"<microseconds>:<pk>"`` token. """
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=dt_timezone.utc)
+    delta = value - EPOCH
+    return "{}:{}".format((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds, pk)
+
+
+def decode_cursor(token):
+    """ Returns the ``(datetime, pk)`` encoded by ``encode_cursor``, raises ``ValueError`` on a malformed token. """
+    microseconds, sep, pk = token.partition(":")
+    value = EPOCH + timedelta(microseconds=int(microseconds))
+    if not timezone.is_aware(timezone.now()):
+        value = value.replace(tzinfo=None)
+    return value, int(pk)
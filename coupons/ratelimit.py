@@ -0,0 +1,151 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import math
+import threading
+import time
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .exceptions import CouponRateLimitError
+from .settings import RATELIMIT_BACKEND, RATELIMIT_CACHE, RATELIMIT_IP, RATELIMIT_IP_META, RATELIMIT_USER
+
+
+class Backend:
+    """
+    Sliding window counter: hits are counted in fixed windows and the previous window is weighted by how much of it
+    still overlaps the sliding one. Rejected hits are counted too, so a client hammering the limit stays limited.
+    """
+
+    def incr(self, key, delta, timeout):
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def hit(self, key, limit, window, cost=1):
+        """ Counts ``cost`` hits for ``key``, returns ``(allowed, retry_after)``. """
+        now = time.time()
+        current = int(now // window)
+        elapsed = now - current * window
+        count = self.incr("{}:{}".format(key, current), cost, 2 * window)
+        previous = self.get("{}:{}".format(key, current - 1))
+        if previous * (1 - elapsed / window) + count <= limit:
+            return True, 0
+        return False, max(1, math.ceil(window - elapsed))
+
+
+class LocalBackend(Backend):
+    """ Counters kept in process memory, each process limits on its own. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.purged_at = time.monotonic()
+
+    def purge(self, now):
+        self.counters = {key: item for key, item in self.counters.items() if item[1] > now}
+        self.purged_at = now
+
+    def incr(self, key, delta, timeout):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.purged_at > timeout:
+                self.purge(now)
+            value, expires = self.counters.get(key, (0, 0))
+            if expires <= now:
+                value, expires = 0, now + timeout
+            self.counters[key] = (value + delta, expires)
+            return value + delta
+
+    def get(self, key):
+        with self.lock:
+            value, expires = self.counters.get(key, (0, 0))
+            return value if expires > time.monotonic() else 0
+
+
+class CacheBackend(Backend):
+    """ Counters kept in the ``COUPONS_RATELIMIT_CACHE`` Django cache, shared by every process using it. """
+
+    def __init__(self):
+        self.cache = caches[RATELIMIT_CACHE]
+
+    def incr(self, key, delta, timeout):
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:  # expired between add and incr
+            self.cache.set(key, delta, timeout)
+            return delta
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None and RATELIMIT_BACKEND:
+        _backend = import_string(RATELIMIT_BACKEND)()
+    return _backend
+
+
+def set_backend(backend):
+    """ Replaces the configured backend, ``None`` reloads it from settings. """
+    global _backend
+    _backend = backend
+
+
+def get_ip(request):
+    return request.META.get(RATELIMIT_IP_META) or None
+
+
+def check(scope, user=None, ip=None, cost=1):
+    """
+    Counts ``cost`` attempts of ``user`` and ``ip`` on ``scope`` and raises ``CouponRateLimitError`` once either is
+    over its ``COUPONS_RATELIMIT_USER`` or ``COUPONS_RATELIMIT_IP`` limit. Does nothing without a backend.
+    """
+    backend = get_backend()
+    if backend is None:
+        return
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    for kind, ident, rate in (("user", user_id, RATELIMIT_USER), ("ip", ip, RATELIMIT_IP)):
+        if ident is None or rate is None:
+            continue
+        limit, window = rate
+        allowed, retry_after = backend.hit("coupons:ratelimit:{}:{}:{}".format(scope, kind, ident), limit, window, cost)
+        if not allowed:
+            metrics.incr("coupons_ratelimited_total", scope=scope, kind=kind)
+            raise CouponRateLimitError(retry_after)
+
+
+def check_request(request, scope, cost=1):
+    check(scope, user=getattr(request, "user", None), ip=get_ip(request), cost=cost)
@@ -0,0 +1,125 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.core.cache import caches
+
+from .settings import PRIMARY_DATABASE, READ_REPLICAS, REPLICA_PIN_CACHE, REPLICA_STICKY_SECONDS
+
+_local = threading.local()
+
+
+def is_pinned():
+    return getattr(_local, "pinned", 0) > 0
+
+
+@contextmanager
+def primary():
+    """ Sends the coupon reads of the current thread to the primary database until the block exits. """
+    _local.pinned = getattr(_local, "pinned", 0) + 1
+    try:
+        yield
+    finally:
+        _local.pinned -= 1
+
+
+def use_primary(func):
+    """ Decorator running ``func`` inside ``primary()``. """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with primary():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def get_cache():
+    return caches[REPLICA_PIN_CACHE] if READ_REPLICAS and REPLICA_PIN_CACHE else None
+
+
+def make_key(user_id):
+    return "coupons:pin:{}".format(user_id)
+
+
+def pin_user(user):
+    """ Keeps the reads made for ``user`` on the primary for ``REPLICA_STICKY_SECONDS``, past the replication lag. """
+    cache = get_cache()
+    if cache is not None and user is not None and user.pk is not None:
+        cache.set(make_key(user.pk), 1, REPLICA_STICKY_SECONDS)
+
+
+def is_user_pinned(user):
+    cache = get_cache()
+    if cache is None or user is None or not user.is_authenticated:
+        return False
+    return cache.get(make_key(user.pk)) is not None
+
+
+@contextmanager
+def sticky(user):
+    """ Runs the block on the primary when ``user`` redeemed recently, on the replicas otherwise. """
+    if is_user_pinned(user):
+        with primary():
+            yield
+    else:
+        yield
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of the coupons models to one of ``COUPONS_READ_REPLICAS``, and the writes to
+    ``COUPONS_PRIMARY_DATABASE``. Reads made inside ``primary()`` stay on the primary, redemptions run there.
+    Add ``"coupons.routers.ReplicaRouter"`` to ``DATABASE_ROUTERS`` to enable it.
+    """
+    app_label = "coupons"
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label or not READ_REPLICAS:
+            return None
+        if is_pinned():
+            return PRIMARY_DATABASE
+        return random.choice(READ_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != self.app_label or not READ_REPLICAS:
+            return None
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = [PRIMARY_DATABASE] + list(READ_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema from the primary
+        if db in READ_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,125 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import heapq
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import cache, metrics, sharding
+from .settings import SCHEDULER_HORIZON, SCHEDULER_LEAD
+
+WARM = "warm"
+EVICT = "evict"
+
+
+class Scheduler:
+    """
+    Tracks the upcoming ``valid_from``/``valid_until`` instants of the coupons in a min-heap. The lookup cache is
+    warmed ``lead`` seconds before coupons become active, so a launch is served from memory, and their entries
+    are evicted as soon as they expire. Transitions are read again from the database every ``refresh`` seconds,
+    up to ``horizon`` seconds ahead.
+    """
+
+    def __init__(self, lead=SCHEDULER_LEAD, horizon=SCHEDULER_HORIZON, refresh=60, chunk_size=1000):
+        self.lead = timedelta(seconds=lead)
+        self.horizon = timedelta(seconds=horizon)
+        self.refresh_interval = refresh
+        self.chunk_size = chunk_size
+        self.heap = []
+        self.scheduled = set()
+        self.refreshed_at = None
+
+    def push(self, when, kind, instant):
+        if (kind, instant) not in self.scheduled:
+            self.scheduled.add((kind, instant))
+            heapq.heappush(self.heap, (when, kind, instant))
+
+    def refresh(self, now):
+        from .models import Coupon
+
+        # the instants of every shard share the heap, push() drops the duplicates
+        for alias in sharding.get_shards():
+            coupons = Coupon.objects.using(alias).order_by()
+            starts = coupons.filter(valid_from__gt=now, valid_from__lte=now + self.horizon)
+            for instant in starts.values_list("valid_from", flat=True).distinct():
+                self.push(instant - self.lead, WARM, instant)
+            ends = coupons.filter(valid_until__gt=now, valid_until__lte=now + self.horizon)
+            for instant in ends.values_list("valid_until", flat=True).distinct():
+                self.push(instant, EVICT, instant)
+        self.refreshed_at = now
+
+    def iter_codes(self, queryset):
+        """ Yields lists of ``chunk_size`` normalized codes of ``queryset``, walking the primary key. """
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "normalized_code")[:self.chunk_size])  # noqa: E501
+            if not rows:
+                return
+            yield [normalized_code for pk, normalized_code in rows]
+            last_pk = rows[-1][0]
+
+    def handle(self, kind, instant):
+        from .models import Coupon
+
+        for alias in sharding.get_shards():
+            coupons = Coupon.objects.using(alias)
+            if kind == WARM:
+                for codes in self.iter_codes(coupons.filter(valid_from=instant)):
+                    cache.warm(codes)
+            else:
+                for codes in self.iter_codes(coupons.filter(valid_until=instant)):
+                    cache.evict(codes)
+        metrics.incr("coupons_scheduler_events_total", kind=kind)
+
+    def run_pending(self, now):
+        """ Handles the events due at ``now``, returns their number. """
+        count = 0
+        while self.heap and self.heap[0][0] <= now:
+            when, kind, instant = heapq.heappop(self.heap)
+            self.scheduled.discard((kind, instant))
+            self.handle(kind, instant)
+            count += 1
+        return count
+
+    def get_delay(self, now):
+        """ Seconds until the next event or refresh. """
+        delay = self.refresh_interval - (now - self.refreshed_at).total_seconds()
+        if self.heap:
+            delay = min(delay, (self.heap[0][0] - now).total_seconds())
+        return max(0, delay)
+
+    def run(self, once=False, sleep=time.sleep):
+        while True:
+            now = timezone.now()
+            if self.refreshed_at is None or (now - self.refreshed_at).total_seconds() >= self.refresh_interval:
+                self.refresh(now)
+            self.run_pending(now)
+            if once:
+                return
+            sleep(self.get_delay(timezone.now()))
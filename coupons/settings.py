@@ -52,3 +52,103 @@ CODE_CHARS = getattr(settings, "COUPONS_CODE_CHARS", string.ascii_letters+string
 SEGMENTED_CODES = getattr(settings, "COUPONS_SEGMENTED_CODES", False)
 SEGMENT_LENGTH = getattr(settings, "COUPONS_SEGMENT_LENGTH", 4)
 SEGMENT_SEPARATOR = getattr(settings, "COUPONS_SEGMENT_SEPARATOR", "-")
+
+# characters folded together when matching codes typed by users, applied after uppercasing
+CODE_CONFUSABLES = str.maketrans(getattr(settings, "COUPONS_CODE_CONFUSABLES", {"O": "0", "I": "1", "L": "1"}))
+# look codes up through Coupon.code_int, the normalized code packed into a 64-bit integer over CODE_CHARS.
+# Only codes of at most 12 characters fit with the default alphabet, the system checks reject a longer CODE_LENGTH
+CODE_INT_LOOKUP = getattr(settings, "COUPONS_CODE_INT_LOOKUP", False)
+
+# append redemptions to the analytics rollups inside Coupon.redeem instead of using the rollup_redemptions command
+ROLLUP_ON_REDEEM = getattr(settings, "COUPONS_ROLLUP_ON_REDEEM", False)
+# seconds rollup_redemptions stays behind the latest redemptions, longer than any redeem transaction
+ROLLUP_SAFETY_MARGIN = getattr(settings, "COUPONS_ROLLUP_SAFETY_MARGIN", 300)
+
+# append a RedemptionEvent to the outbox inside Coupon.redeem, streamed by stream_redemption_events
+OUTBOX_ENABLED = getattr(settings, "COUPONS_OUTBOX_ENABLED", False)
+# number of events a consumer reads, and the pruning deletes, per query
+OUTBOX_BATCH_SIZE = getattr(settings, "COUPONS_OUTBOX_BATCH_SIZE", 500)
+# seconds a consumer waits on a missing event id, of a transaction still in flight, before skipping it
+OUTBOX_GAP_TIMEOUT = getattr(settings, "COUPONS_OUTBOX_GAP_TIMEOUT", 30)
+# seconds a skipped event id is read again in case its transaction commits late, before it is given up
+OUTBOX_RECONCILE_TIMEOUT = getattr(settings, "COUPONS_OUTBOX_RECONCILE_TIMEOUT", 3600)
+
+# above this many rows the admin trusts the database planner estimate instead of running COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, "COUPONS_ESTIMATED_COUNT_THRESHOLD", 100000)
+
+# number of rows shown, and loaded on demand, by the coupon and redemption inlines
+INLINE_PER_PAGE = getattr(settings, "COUPONS_INLINE_PER_PAGE", 20)
+
+# number of rows fetched per query while exporting coupons
+EXPORT_CHUNK_SIZE = getattr(settings, "COUPONS_EXPORT_CHUNK_SIZE", 2000)
+
+# number of codes checked against the database and inserted per query while importing coupons
+IMPORT_BATCH_SIZE = getattr(settings, "COUPONS_IMPORT_BATCH_SIZE", 1000)
+
+# dotted path of the metrics sink class, e.g. "coupons.metrics.RegistrySink", metrics are disabled by default
+METRICS_SINK = getattr(settings, "COUPONS_METRICS_SINK", None)
+
+# maximum number of codes accepted by a single batch check request
+BATCH_CHECK_MAX_CODES = getattr(settings, "COUPONS_BATCH_CHECK_MAX_CODES", 50)
+
+# dotted path of the rate limit backend, "coupons.ratelimit.LocalBackend" or "coupons.ratelimit.CacheBackend",
+# rate limiting is disabled by default
+RATELIMIT_BACKEND = getattr(settings, "COUPONS_RATELIMIT_BACKEND", None)
+RATELIMIT_CACHE = getattr(settings, "COUPONS_RATELIMIT_CACHE", "default")
+# (attempts, seconds) allowed per authenticated user and per client ip on each scope, None disables the limit
+RATELIMIT_USER = getattr(settings, "COUPONS_RATELIMIT_USER", (30, 60))
+RATELIMIT_IP = getattr(settings, "COUPONS_RATELIMIT_IP", (60, 60))
+# request.META key holding the client ip, e.g. "HTTP_X_REAL_IP" behind a trusted proxy
+RATELIMIT_IP_META = getattr(settings, "COUPONS_RATELIMIT_IP_META", "REMOTE_ADDR")
+
+# coupons listed per page by the user wallet view
+WALLET_PER_PAGE = getattr(settings, "COUPONS_WALLET_PER_PAGE", 20)
+# cache alias holding the wallet pages of each user, None disables caching, invalidated when the user redeems and
+# when open coupons are created, imported or disabled
+WALLET_CACHE = getattr(settings, "COUPONS_WALLET_CACHE", None)
+WALLET_CACHE_TIMEOUT = getattr(settings, "COUPONS_WALLET_CACHE_TIMEOUT", 300)
+
+# redemptions listed per page by the redemption history view
+HISTORY_PER_PAGE = getattr(settings, "COUPONS_HISTORY_PER_PAGE", 20)
+
+# discount handler class of each coupon type, used by coupons.discounts.apply_discounts
+DISCOUNT_HANDLERS = getattr(settings, "COUPONS_DISCOUNT_HANDLERS", {
+    "monetary": "coupons.discounts.MonetaryDiscount",
+    "percentage": "coupons.discounts.PercentageDiscount",
+    "virtual_currency": "coupons.discounts.NoDiscount",
+})
+# evaluate discounts with NumPy when it is installed
+DISCOUNT_USE_NUMPY = getattr(settings, "COUPONS_DISCOUNT_USE_NUMPY", True)
+
+# cache alias sharing the version of the stacking rules between processes, it must be shared by every worker
+# (memcached, redis, database): a per-process cache like LocMemCache never sees the changes made by the others.
+# None relies on the ttl only, changes made by other processes show up within STACKING_RULES_TTL seconds
+STACKING_CACHE = getattr(settings, "COUPONS_STACKING_CACHE", None)
+# seconds a process uses its compiled stacking rules before checking them again, or recompiling them without a cache
+STACKING_RULES_TTL = getattr(settings, "COUPONS_STACKING_RULES_TTL", 5)
+
+# seconds a checkout reservation holds a coupon use before the sweeper releases it
+RESERVATION_TTL = getattr(settings, "COUPONS_RESERVATION_TTL", 900)
+
+# cache alias holding coupons by normalized code for CheckCouponView, None disables it
+LOOKUP_CACHE = getattr(settings, "COUPONS_LOOKUP_CACHE", None)
+LOOKUP_CACHE_TIMEOUT = getattr(settings, "COUPONS_LOOKUP_CACHE_TIMEOUT", 3600)
+# seconds before valid_from the scheduler warms the lookup cache, and horizon of the transitions it tracks
+SCHEDULER_LEAD = getattr(settings, "COUPONS_SCHEDULER_LEAD", 60)
+SCHEDULER_HORIZON = getattr(settings, "COUPONS_SCHEDULER_HORIZON", 3600)
+
+# days after valid_until before archive_coupons moves a coupon and its redemptions to the archive tables
+ARCHIVE_RETENTION_DAYS = getattr(settings, "COUPONS_ARCHIVE_RETENTION_DAYS", 365)
+
+# database aliases coupons.routers.ReplicaRouter sends the coupon reads to, empty to read from the primary
+READ_REPLICAS = getattr(settings, "COUPONS_READ_REPLICAS", [])
+PRIMARY_DATABASE = getattr(settings, "COUPONS_PRIMARY_DATABASE", "default")
+# cache alias remembering the users who just redeemed, their reads stay on the primary for REPLICA_STICKY_SECONDS
+REPLICA_PIN_CACHE = getattr(settings, "COUPONS_REPLICA_PIN_CACHE", "default")
+REPLICA_STICKY_SECONDS = getattr(settings, "COUPONS_REPLICA_STICKY_SECONDS", 10)
+
+# database aliases holding the Coupon, CouponUser and CouponReservation rows, empty keeps them on the default database
+SHARDS = getattr(settings, "COUPONS_SHARDS", [])
+# "hash" places a code on a shard by the crc32 of its normalized form, "prefix" uses SHARD_PREFIXES first
+SHARD_BY = getattr(settings, "COUPONS_SHARD_BY", "hash")
+SHARD_PREFIXES = getattr(settings, "COUPONS_SHARD_PREFIXES", {})
@@ -0,0 +1,232 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import wraps
+from queue import Empty, Full, Queue
+
+from django.db import connections, router, transaction
+
+from .settings import SHARD_BY, SHARD_PREFIXES, SHARDS
+
+SHARDED_MODELS = ["coupon", "couponuser", "couponreservation"]
+
+
+def get_shards():
+    """ Returns the shard aliases, ``[None]`` (the routed default) when sharding is disabled. """
+    return list(SHARDS) or [None]
+
+
+def get_shard(code):
+    """ Returns the alias of the shard holding ``code``, ``None`` when sharding is disabled. """
+    from .models import Coupon
+
+    if not SHARDS:
+        return None
+    normalized_code = Coupon.normalize_code(code)
+    if SHARD_BY == "prefix":
+        for prefix in sorted(SHARD_PREFIXES, key=len, reverse=True):
+            if normalized_code.startswith(Coupon.normalize_code(prefix)):
+                return SHARD_PREFIXES[prefix]
+    return SHARDS[zlib.crc32(normalized_code.encode("utf-8")) % len(SHARDS)]
+
+
+def group(codes):
+    """ Returns ``{alias: codes}``, the ``codes`` held by each shard. """
+    groups = {}
+    for code in codes:
+        groups.setdefault(get_shard(code), []).append(code)
+    return groups
+
+
+def get_instance_shard(instance):
+    """ Returns the shard of a ``Coupon``, ``CouponUser`` or ``CouponReservation`` instance, if known. """
+    from .models import Coupon
+
+    if instance._state.db in SHARDS:
+        return instance._state.db
+    if isinstance(instance, Coupon):
+        return get_shard(instance.code) if instance.code else None
+    coupon_field = instance._meta.get_field("coupon")
+    if coupon_field.is_cached(instance):
+        return get_instance_shard(coupon_field.get_cached_value(instance))
+    return None
+
+
+def get_write_db(instance):
+    return router.db_for_write(type(instance), instance=instance)
+
+
+def atomic(method):
+    """ Like ``transaction.atomic`` for a method, on the database the instance is written to. """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with transaction.atomic(using=get_write_db(self)):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def on_commit(func, using):
+    """
+    Runs ``func``, which writes to the default database, for a change made on ``using``: once the shard commits, a
+    rolled back shard transaction leaves the default database untouched. Without sharding both are one database and
+    ``func`` runs in the current transaction.
+    """
+    if using in SHARDS:
+        transaction.on_commit(func, using=using)
+    else:
+        func()
+
+
+def atomic_shards():
+    """ Returns a context manager opening a transaction on the default database and on every shard. """
+    stack = ExitStack()
+    stack.enter_context(transaction.atomic())
+    for alias in SHARDS:
+        stack.enter_context(transaction.atomic(using=alias))
+    return stack
+
+
+def run_in_thread(func, *args):
+    try:
+        return func(*args)
+    finally:
+        # connections are per thread, do not leak the ones opened here
+        connections.close_all()
+
+
+def fan_out(func, shards=None):
+    """
+    Calls ``func(alias)`` for each shard, in parallel threads when there are several, and returns the results in
+    the shards order. Without sharding ``func(None)`` is called in the current thread, as well as inside a
+    transaction on a shard, whose uncommitted rows other threads do not see.
+    """
+    shards = get_shards() if shards is None else list(shards)
+    if len(shards) <= 1 or any(connections[alias].in_atomic_block for alias in shards):
+        return [func(alias) for alias in shards]
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        return list(executor.map(lambda alias: run_in_thread(func, alias), shards))
+
+
+_done = object()
+
+
+def iter_prefetched(queryset, chunk_size, buffer_size=2):
+    """
+    Iterates ``queryset`` while a thread fetches it ``chunk_size`` rows at a time, at most ``buffer_size`` chunks
+    ahead of the consumer.
+    """
+    chunks = Queue(maxsize=buffer_size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        chunk = []
+        try:
+            for obj in queryset.iterator(chunk_size=chunk_size):
+                chunk.append(obj)
+                if len(chunk) >= chunk_size:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if put(chunk):
+                put(_done)
+        except Exception as exc:
+            put(exc)
+
+    thread = threading.Thread(target=run_in_thread, args=(produce,), daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=0.1)
+            except Empty:
+                if not thread.is_alive():
+                    return
+                continue
+            if item is _done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+    finally:
+        stopped.set()
+
+
+def iter_shards(queryset, chunk_size):
+    """
+    Iterates ``queryset`` on every shard, shard after shard in the queryset order of each one. The shards are read
+    in parallel, each ahead of the consumer by a bounded number of chunks. Without sharding this is
+    ``queryset.iterator()``.
+    """
+    if not SHARDS or queryset._db is not None:
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+    iterators = [iter_prefetched(queryset.using(alias), chunk_size) for alias in SHARDS]
+    for iterator in iterators:
+        yield from iterator
+
+
+class ShardRouter:
+    """
+    Places the ``Coupon``, ``CouponUser`` and ``CouponReservation`` rows of a code on one of ``COUPONS_SHARDS``.
+    Queries on a known instance go to its shard, lookups by code go through ``CouponQuerySet.for_code``.
+    The shards hold the full schema, the rows referenced by coupons (campaigns, users, content types) must exist on
+    every shard. Add ``"coupons.sharding.ShardRouter"`` first in ``DATABASE_ROUTERS`` to enable it.
+    """
+    def is_sharded(self, model):
+        return bool(SHARDS) and model._meta.app_label == "coupons" and model._meta.model_name in SHARDED_MODELS
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is None or not self.is_sharded(model) or not self.is_sharded(type(instance)):
+            return None
+        return get_instance_shard(instance)
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.is_sharded(type(obj1)) or self.is_sharded(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the shards hold the full schema and run the data migrations, a router listed after this one must not skip them
+        if db in SHARDS:
+            return True
+        return None
@@ -0,0 +1,179 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import threading
+import time
+from collections import namedtuple
+
+from django.core.cache import caches
+
+from .exceptions import CouponStackingError
+from .settings import STACKING_CACHE, STACKING_RULES_TTL
+
+Rule = namedtuple("Rule", ["pk", "name", "type", "action", "campaign_id", "max_coupons", "excluded_campaigns"])
+Violation = namedtuple("Violation", ["rule", "coupons"])
+
+
+class RuleSet:
+    """
+    ``StackingRule`` rows compiled for evaluation without queries. Every rule is a bit: each distinct
+    ``(type, action, campaign_id)`` of the coupons is resolved once to the mask of the rules it matches and to
+    the mask of the campaigns those rules exclude, which is then memoized.
+    """
+
+    def __init__(self, rules, version=None):
+        self.rules = list(rules)
+        self.version = version
+        self.limits = [(1 << index, rule) for index, rule in enumerate(self.rules) if rule.max_coupons is not None]
+        campaigns = sorted({pk for rule in self.rules for pk in rule.excluded_campaigns})
+        self.campaign_bits = {pk: 1 << index for index, pk in enumerate(campaigns)}
+        self.masks = {}
+
+    def get_masks(self, key):
+        try:
+            return self.masks[key]
+        except KeyError:
+            pass
+        type, action, campaign_id = key
+        rules = excludes = 0
+        for index, rule in enumerate(self.rules):
+            if rule.type and rule.type != type:
+                continue
+            if rule.action and rule.action != action:
+                continue
+            if rule.campaign_id is not None and rule.campaign_id != campaign_id:
+                continue
+            rules |= 1 << index
+            for pk in rule.excluded_campaigns:
+                excludes |= self.campaign_bits[pk]
+        self.masks[key] = rules, excludes
+        return rules, excludes
+
+    def check(self, coupons):
+        """ Returns the ``Violation`` list of ``coupons`` used together, empty when they can be combined. """
+        coupons = list(coupons)
+        masks = [self.get_masks((coupon.type, coupon.action, coupon.campaign_id)) for coupon in coupons]
+        violations = []
+        for bit, rule in self.limits:
+            matching = [coupon for coupon, (rules, excludes) in zip(coupons, masks) if rules & bit]
+            if len(matching) > rule.max_coupons:
+                violations.append(Violation(rule, matching))
+        campaigns = [self.campaign_bits.get(coupon.campaign_id, 0) for coupon in coupons]
+        for i, (rules, excludes) in enumerate(masks):
+            if not excludes:
+                continue
+            others = 0
+            for j, campaign in enumerate(campaigns):
+                if j != i:
+                    others |= campaign
+            if excludes & others:
+                violations.extend(self.get_exclusions(coupons, i, rules))
+        return violations
+
+    def get_exclusions(self, coupons, i, rules):
+        for index, rule in enumerate(self.rules):
+            if not rules & (1 << index) or not rule.excluded_campaigns:
+                continue
+            excluded = [
+                coupon for j, coupon in enumerate(coupons)
+                if j != i and coupon.campaign_id in rule.excluded_campaigns
+            ]
+            if excluded:
+                yield Violation(rule, [coupons[i]] + excluded)
+
+    def validate(self, coupons):
+        violations = self.check(coupons)
+        if violations:
+            raise CouponStackingError(violations)
+
+
+def compile_ruleset(version=None):
+    from .models import StackingRule
+
+    excluded = {}
+    through = StackingRule.excluded_campaigns.through
+    for rule_id, campaign_id in through.objects.filter(stackingrule__is_active=True).values_list("stackingrule_id", "campaign_id"):  # noqa: E501
+        excluded.setdefault(rule_id, set()).add(campaign_id)
+    rules = [
+        Rule(pk, name, type, action, campaign_id, max_coupons, frozenset(excluded.get(pk, ())))
+        for pk, name, type, action, campaign_id, max_coupons in StackingRule.objects.filter(is_active=True).order_by("pk").values_list(  # noqa: E501
+            "pk", "name", "type", "action", "campaign_id", "max_coupons",
+        )
+    ]
+    return RuleSet(rules, version=version)
+
+
+VERSION_KEY = "coupons:stacking:version"
+_lock = threading.Lock()
+_ruleset = None
+_checked_at = 0
+
+
+def get_cache():
+    return caches[STACKING_CACHE] if STACKING_CACHE else None
+
+
+def get_ruleset():
+    """
+    Returns the compiled rules of this process. Every ``STACKING_RULES_TTL`` seconds they are compared with the
+    version shared in ``STACKING_CACHE`` and recompiled when another process changed the rules, or recompiled
+    unconditionally without a cache. The version only reaches the other processes through a shared cache backend.
+    """
+    global _ruleset, _checked_at
+    now = time.monotonic()
+    ruleset = _ruleset
+    if ruleset is not None and now - _checked_at < STACKING_RULES_TTL:
+        return ruleset
+    with _lock:
+        cache = get_cache()
+        version = cache.get(VERSION_KEY, 0) if cache is not None else None
+        if _ruleset is None or cache is None or _ruleset.version != version:
+            _ruleset = compile_ruleset(version=version)
+        _checked_at = now
+        return _ruleset
+
+
+def invalidate():
+    """ Drops the compiled rules of this process and tells the other ones to drop theirs. """
+    global _ruleset
+    cache = get_cache()
+    if cache is not None:
+        cache.add(VERSION_KEY, 0, None)
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, None)
+    with _lock:
+        _ruleset = None
+
+
+def check(coupons):
+    return get_ruleset().check(coupons)
+
+
+def validate(coupons):
+    get_ruleset().validate(coupons)
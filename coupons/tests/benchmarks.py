@@ -0,0 +1,325 @@
+"""
+Throughput and latency benchmarks for the coupon hot paths.
+
+    DJANGO_SETTINGS_MODULE=coupons.tests.settings python -m coupons.tests.benchmarks --size 10k
+    python -m coupons.tests.benchmarks --size 1m --save baseline.json
+    python -m coupons.tests.benchmarks --size 1m --baseline baseline.json --tolerance 0.2
+
+Each scenario reports operations per second, latency percentiles and queries per operation,
+the sizes of the code indexes are reported when the database exposes them.
+With ``--baseline`` the run fails when a scenario gets slower than the tolerance allows,
+or issues more queries than the baseline did.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+SIZES = {"10k": 10000, "1m": 1000000, "10m": 10000000}
+
+
+def parse_size(value):
+    value = value.lower()
+    if value in SIZES:
+        return SIZES[value]
+    return int(value)
+
+
+def get_code(index):
+    # 12 characters, the longest codes Coupon.encode_code packs with the default alphabet
+    return "B{:011d}".format(index)
+
+
+def build_dataset(size, batch_size=10000, redeemed_every=10):
+    """
+    Creates ``size`` coupons in one campaign, with a redemption for every ``redeemed_every``-th coupon.
+    Codes are derived from the row index, so scenarios can pick existing codes without querying.
+    """
+    from coupons.models import Campaign, CampaignStats, Coupon, CouponUser
+    from django.utils import timezone
+
+    campaign = Campaign.objects.create(name="benchmark-{}".format(size))
+    now = timezone.now()
+    for start in range(0, size, batch_size):
+        indexes = range(start, min(start + batch_size, size))
+        coupons = [
+            Coupon(
+                code=get_code(index),
+                normalized_code=Coupon.normalize_code(get_code(index)),
+                code_int=Coupon.encode_code(Coupon.normalize_code(get_code(index))),
+                type="monetary",
+                value=100,
+                campaign=campaign,
+            )
+            for index in indexes
+        ]
+        # lookup[code_int] would otherwise compare against an index of NULLs
+        assert all(coupon.code_int is not None for coupon in coupons), "The codes do not fit in code_int."
+        coupons = Coupon.objects.bulk_create(coupons)
+        if not coupons or coupons[0].pk is None:
+            coupons = Coupon.objects.filter(code__in=[get_code(index) for index in indexes]).order_by("code")
+        CouponUser.objects.bulk_create([
+            CouponUser(coupon=coupon, redeemed_at=now)
+            for index, coupon in zip(indexes, coupons) if index % redeemed_every == 0
+        ])
+    CampaignStats.objects.rebuild([campaign])
+    return campaign
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Scenario:
+    name = None
+    # operations run while counting queries, before the timed ones
+    sampled = 3
+
+    def __init__(self, size, campaign, user):
+        self.size = size
+        self.campaign = campaign
+        self.user = user
+
+    def setup(self):
+        pass
+
+    def __call__(self):
+        raise NotImplementedError
+
+
+class GenerateCode(Scenario):
+    name = "generate_code"
+
+    def __call__(self):
+        from coupons.models import Coupon
+        Coupon.generate_code()
+
+
+class CreateCoupons(Scenario):
+    name = "create_coupons[100]"
+
+    def __call__(self):
+        from coupons.models import Coupon
+        Coupon.objects.create_coupons(100, "monetary", "discount", 100, campaign=self.campaign)
+
+
+class CleanCode(Scenario):
+    name = "CouponForm.clean_code"
+
+    def __call__(self):
+        from coupons.forms import CouponForm
+        form = CouponForm(data={"code": get_code(random.randrange(self.size))}, user=self.user)
+        form.is_valid()
+
+
+class CheckCoupon(Scenario):
+    name = "CheckCouponView.post"
+
+    def setup(self):
+        from coupons.views import CheckCouponView
+        from django.test import RequestFactory
+        self.view = CheckCouponView.as_view()
+        self.factory = RequestFactory()
+
+    def __call__(self):
+        request = self.factory.post("/check", {"code": get_code(random.randrange(self.size))})
+        request.user = self.user
+        self.view(request)
+
+
+class Redeem(Scenario):
+    name = "Coupon.redeem"
+
+    def setup(self):
+        # walk the coupons never redeemed by the dataset
+        self.indexes = (index for index in itertools.count(1) if index % 10 != 0)
+
+    def __call__(self):
+        from coupons.models import Coupon
+        Coupon.objects.redeem(get_code(next(self.indexes)), self.user)
+
+
+class ApplyDiscounts(Scenario):
+    name = "apply_discounts[1000]"
+
+    def setup(self):
+        self.carts = [[random.randrange(100, 10000) for line in range(5)] for cart in range(1000)]
+        self.coupons = [("percentage", 10), ("monetary", 500)]
+
+    def __call__(self):
+        from coupons.discounts import apply_discounts
+        apply_discounts(self.carts, self.coupons)
+
+
+class LookupNormalizedCode(Scenario):
+    name = "lookup[normalized_code]"
+
+    def lookup(self, code):
+        from coupons.models import Coupon
+        normalized_code = Coupon.normalize_code(code)
+        return list(Coupon.objects.filter(normalized_code=normalized_code).values_list("pk", flat=True))
+
+    def __call__(self):
+        self.lookup(get_code(random.randrange(self.size)))
+
+
+class LookupCodeInt(LookupNormalizedCode):
+    name = "lookup[code_int]"
+
+    def lookup(self, code):
+        from coupons.models import Coupon
+        code_int = Coupon.encode_code(Coupon.normalize_code(code))
+        return list(Coupon.objects.filter(code_int=code_int).values_list("pk", flat=True))
+
+
+SCENARIOS = [
+    GenerateCode, CreateCoupons, CleanCode, CheckCoupon, Redeem, ApplyDiscounts, LookupNormalizedCode, LookupCodeInt,
+]
+
+INDEXED_COLUMNS = ["code", "normalized_code", "code_int"]
+
+
+def get_index_sizes(columns=INDEXED_COLUMNS):
+    """
+    Returns the size in bytes of the single column indexes of the coupons table on ``columns``, for the databases
+    reporting it (SQLite built with dbstat, PostgreSQL).
+    """
+    from coupons.models import Coupon
+    from django.db import connection
+
+    table = Coupon._meta.db_table
+    sizes = {}
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("PRAGMA index_list({})".format(connection.ops.quote_name(table)))
+            for index in [row[1] for row in cursor.fetchall()]:
+                cursor.execute("PRAGMA index_info({})".format(connection.ops.quote_name(index)))
+                indexed = [row[2] for row in cursor.fetchall()]
+                if len(indexed) == 1 and indexed[0] in columns:
+                    try:
+                        cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [index])
+                    except Exception:
+                        return {}
+                    sizes[indexed[0]] = cursor.fetchone()[0]
+        elif connection.vendor == "postgresql":
+            constraints = connection.introspection.get_constraints(cursor, table)
+            for index, constraint in constraints.items():
+                indexed = constraint["columns"]
+                if (constraint["index"] or constraint["unique"]) and len(indexed) == 1 and indexed[0] in columns:
+                    cursor.execute("SELECT pg_relation_size(%s::regclass)", [connection.ops.quote_name(index)])
+                    sizes[indexed[0]] = cursor.fetchone()[0]
+    return sizes
+
+
+def run_scenario(scenario, ops):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    scenario.setup()
+    with CaptureQueriesContext(connection) as queries:
+        for i in range(scenario.sampled):
+            scenario()
+    latencies = []
+    started = time.perf_counter()
+    for i in range(ops):
+        start = time.perf_counter()
+        scenario()
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    return {
+        "ops": ops,
+        "ops_per_sec": ops / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "queries_per_op": len(queries) / scenario.sampled,
+    }
+
+
+def run(size, ops=200, scenarios=SCENARIOS):
+    from django.contrib.auth import get_user_model
+
+    campaign = build_dataset(size)
+    user = get_user_model().objects.create_user(username="benchmark")
+    results = {}
+    for scenario in scenarios:
+        # no more redemptions than the coupons left unredeemed by the dataset
+        count = min(ops, size * 9 // 10 - scenario.sampled) if scenario is Redeem else ops
+        results[scenario.name] = run_scenario(scenario(size, campaign, user), count)
+    return {"size": size, "scenarios": results, "indexes": get_index_sizes()}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """ Returns the regressions of ``results`` against ``baseline``. """
+    regressions = []
+    for name, expected in baseline["scenarios"].items():
+        actual = results["scenarios"].get(name)
+        if actual is None:
+            continue
+        if actual["ops_per_sec"] < expected["ops_per_sec"] * (1 - tolerance):
+            regressions.append("{}: {:.1f} ops/sec, baseline {:.1f}".format(
+                name, actual["ops_per_sec"], expected["ops_per_sec"],
+            ))
+        if actual["queries_per_op"] > expected["queries_per_op"]:
+            regressions.append("{}: {:g} queries/op, baseline {:g}".format(
+                name, actual["queries_per_op"], expected["queries_per_op"],
+            ))
+    return regressions
+
+
+def report(results, out=sys.stdout):
+    out.write("{} coupons\n".format(results["size"]))
+    out.write("{:<24} {:>12} {:>10} {:>10} {:>10} {:>10}\n".format(
+        "scenario", "ops/sec", "p50 ms", "p95 ms", "p99 ms", "queries",
+    ))
+    for name, result in results["scenarios"].items():
+        out.write("{:<24} {:>12.1f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10g}\n".format(
+            name, result["ops_per_sec"], result["p50_ms"], result["p95_ms"], result["p99_ms"], result["queries_per_op"],
+        ))
+    for column, size in sorted(results.get("indexes", {}).items()):
+        out.write("index on {:<16} {:>12.1f} KiB\n".format(column, size / 1024))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the coupon hot paths.")
+    parser.add_argument("--size", type=parse_size, default="10k", help="Dataset size: 10k, 1m, 10m or a number.")
+    parser.add_argument("--ops", type=int, default=200, help="Timed operations per scenario.")
+    parser.add_argument("--scenario", action="append", help="Run only this scenario (can be repeated).")
+    parser.add_argument("--save", help="Save the results to this json file.")
+    parser.add_argument("--baseline", help="Compare against this json file and fail on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed ops/sec drop against the baseline.")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "coupons.tests.settings")
+    import django
+    from django.test.runner import DiscoverRunner
+    django.setup()
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenario or scenario.name in args.scenario]
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        results = run(args.size, ops=args.ops, scenarios=scenarios)
+    finally:
+        runner.teardown_databases(old_config)
+
+    report(results)
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as fp:
+            regressions = compare(results, json.load(fp), tolerance=args.tolerance)
+        for regression in regressions:
+            sys.stderr.write("REGRESSION {}\n".format(regression))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
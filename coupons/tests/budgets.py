@@ -0,0 +1,89 @@
+"""
+Query budget assertions.
+
+    with QueryBudget(3):
+        coupon.redeem(user)
+
+    class MyTestCase(QueryBudgetMixin, TestCase):
+        def test_changelist(self):
+            self.assertQueryBudget(5, self.render_changelist, scale=self.add_campaigns)
+
+A failing budget lists the SQL issued; with ``scale`` the operation is measured at growing dataset sizes,
+so a count that grows with the number of rows (an N+1) fails even while it is still under budget.
+"""
+
+from contextlib import ContextDecorator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+def format_queries(queries):
+    return "\n".join("{}. {}".format(index, query["sql"]) for index, query in enumerate(queries, start=1))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget(ContextDecorator):
+    """ Fails when the wrapped block, or the decorated function, issues more than ``budget`` queries. """
+    def __init__(self, budget, label="", using=DEFAULT_DB_ALIAS):
+        self.budget = budget
+        self.label = label
+        self.using = using
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self.context
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None and len(self.context) > self.budget:
+            raise QueryBudgetExceeded("{}{} queries issued, budget is {}:\n{}".format(
+                "{}: ".format(self.label) if self.label else "",
+                len(self.context),
+                self.budget,
+                format_queries(self.context.captured_queries),
+            ))
+
+
+class QueryBudgetMixin:
+    def measure_queries(self, operation, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            operation()
+        return context.captured_queries
+
+    def assertQueryBudget(self, budget, operation, scale=None, sizes=(1, 3, 5), label="", using=DEFAULT_DB_ALIAS):
+        """
+        Asserts ``operation()`` issues at most ``budget`` queries.
+        ``scale(n)`` must grow the dataset to ``n`` rows: the operation is then measured once per size
+        and its query count must not depend on it.
+        """
+        label = "{}: ".format(label) if label else ""
+        if scale is None:
+            queries = self.measure_queries(operation, using=using)
+            if len(queries) > budget:
+                self.fail("{}{} queries issued, budget is {}:\n{}".format(
+                    label, len(queries), budget, format_queries(queries),
+                ))
+            return len(queries)
+        runs = []
+        for size in sizes:
+            scale(size)
+            runs.append((size, self.measure_queries(operation, using=using)))
+        counts = [len(queries) for size, queries in runs]
+        worst = max(runs, key=lambda run: len(run[1]))
+        if len(set(counts)) > 1:
+            self.fail("{}query count grows with N ({}), budget is {}:\n{}".format(
+                label,
+                ", ".join("{} at N={}".format(len(queries), size) for size, queries in runs),
+                budget,
+                format_queries(worst[1]),
+            ))
+        if counts[0] > budget:
+            self.fail("{}{} queries issued, budget is {} (constant in N):\n{}".format(
+                label, counts[0], budget, format_queries(worst[1]),
+            ))
+        return counts[0]
@@ -51,7 +51,23 @@ MIDDLEWARE_CLASSES = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'tests.urls'
+MIDDLEWARE = MIDDLEWARE_CLASSES
+
+ROOT_URLCONF = 'coupons.tests.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'tests', 'static')
 
@@ -73,7 +89,19 @@ CACHES = {
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-    }
+    },
+    # stand-in read replica for coupons.routers, it mirrors the default database
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+    # stand-in shards for coupons.sharding
+    'shard0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+    },
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+    },
 }
 
 if django.VERSION[:2] < (1, 6):
@@ -0,0 +1,19 @@
+"""Django settings for tests against a local PostgreSQL server."""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('COUPONS_TEST_DB_NAME', 'coupons'),
+        'USER': os.environ.get('COUPONS_TEST_DB_USER', ''),
+        'PASSWORD': os.environ.get('COUPONS_TEST_DB_PASSWORD', ''),
+        'HOST': os.environ.get('COUPONS_TEST_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('COUPONS_TEST_DB_PORT', ''),
+    },
+}
+DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+DATABASES['shard0'] = dict(DATABASES['default'], NAME=DATABASES['default']['NAME'] + '_shard0')
+DATABASES['shard1'] = dict(DATABASES['default'], NAME=DATABASES['default']['NAME'] + '_shard1')
@@ -0,0 +1,117 @@
+"""
+Concurrent redemption stress harness.
+
+    DJANGO_SETTINGS_MODULE=coupons.tests.settings python -m coupons.tests.stress --workers 8 --limits 1,2,5
+    DJANGO_SETTINGS_MODULE=coupons.tests.settings_postgresql python -m coupons.tests.stress --mode process
+
+For every ``user_limit`` in ``--limits`` a fresh coupon receives ``--attempts`` concurrent redemptions,
+each by a different user, from a thread or process pool. The report shows throughput, latency percentiles,
+and how many redemptions went over ``user_limit``: ``Coupon.redeem`` checks ``is_usable`` and then inserts,
+so concurrent requests can both pass the check.
+In memory SQLite databases cannot be shared between processes, use ``--mode thread`` with them.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .benchmarks import percentile
+
+
+def redeem(code, user_id):
+    """ Runs one redemption and returns ``(outcome, latency)``, outcome is ``redeemed``, ``rejected`` or an error. """
+    from coupons.models import Coupon
+    from django.contrib.auth import get_user_model
+    from django.db import connections
+
+    user = get_user_model()(pk=user_id)
+    start = time.perf_counter()
+    try:
+        Coupon.objects.redeem(code, user)
+        outcome = "redeemed"
+    except Coupon.Error:
+        outcome = "rejected"
+    except Exception as exc:
+        outcome = type(exc).__name__
+    finally:
+        latency = time.perf_counter() - start
+        # every worker thread opens its own connection
+        connections.close_all()
+    return outcome, latency
+
+
+def run_limit(user_limit, users, executor):
+    from coupons.models import Coupon
+
+    coupon = Coupon.objects.create_coupon("monetary", "discount", 100, user_limit=user_limit)
+    started = time.perf_counter()
+    futures = [executor.submit(redeem, coupon.code, user_id) for user_id in users]
+    results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    outcomes = [outcome for outcome, latency in results]
+    latencies = [latency for outcome, latency in results]
+    redeemed = coupon.users.filter(redeemed_at__isnull=False).count()
+    return {
+        "user_limit": user_limit,
+        "attempts": len(results),
+        "redeemed": redeemed,
+        "over_redeemed": max(0, redeemed - user_limit) if user_limit else 0,
+        "rejected": outcomes.count("rejected"),
+        "errors": len(outcomes) - outcomes.count("redeemed") - outcomes.count("rejected"),
+        "ops_per_sec": len(results) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def run(limits, attempts, workers=8, mode="thread"):
+    from django.contrib.auth import get_user_model
+    from django.db import connections
+
+    User = get_user_model()
+    users = [User.objects.create_user(username="stress{}".format(index)).pk for index in range(attempts)]
+    if mode == "process":
+        # forked workers must not share the parent connection
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    with executor:
+        return [run_limit(user_limit, users, executor) for user_limit in limits]
+
+
+def report(results, out=sys.stdout):
+    columns = ["user_limit", "attempts", "redeemed", "over_redeemed", "rejected", "errors"]
+    out.write("".join("{:>14}".format(column) for column in columns + ["ops/sec", "p50 ms", "p99 ms"]) + "\n")
+    for result in results:
+        out.write("".join("{:>14}".format(result[column]) for column in columns))
+        out.write("{:>14.1f}{:>14.3f}{:>14.3f}\n".format(result["ops_per_sec"], result["p50_ms"], result["p99_ms"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress concurrent coupon redemptions.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=50, help="Redemptions attempted per coupon.")
+    parser.add_argument("--limits", default="1,2,5,10", help="Comma separated user_limit values.")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "coupons.tests.settings")
+    import django
+    from django.test.runner import DiscoverRunner
+    django.setup()
+
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        results = run([int(limit) for limit in args.limits.split(",")], args.attempts, args.workers, args.mode)
+    finally:
+        runner.teardown_databases(old_config)
+    report(results)
+    return 1 if any(result["over_redeemed"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,18 @@
+import json
 from distutils.version import StrictVersion
 from unittest import skipIf
 
 import django
-from coupons.admin import CouponAdmin
-from coupons.models import Coupon
+from coupons.admin import CouponAdmin, CouponInline
+from coupons.models import Campaign, Coupon
+from coupons.pagination import EstimatedCountPaginator
+from coupons.views import InlinePageAdminView
 from django.contrib.admin.sites import AdminSite
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+
+User = get_user_model()
 
 
 class MockRequest(object):
@@ -27,3 +34,89 @@ class CouponAdminTestCase(TestCase):
             list(admin.get_fields(request)),
             ['value', 'code', 'type', 'user_limit', 'valid_from', 'valid_until', 'campaign']
         )
+
+
+class CouponChangeListTestCase(TestCase):
+    def setUp(self):
+        self.site = AdminSite()
+        self.admin = CouponAdmin(Coupon, self.site)
+        self.factory = RequestFactory()
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.coupons = [
+            Coupon.objects.create(code="ABC{}".format(i), type='monetary', value=i) for i in range(5)
+        ]
+        self.coupons[0].redeem(self.user)
+
+    def get_request(self, **params):
+        request = self.factory.get("/admin/coupons/coupon/", params)
+        request.user = self.user
+        return request
+
+    def test_annotated_columns(self):
+        request = self.get_request()
+        coupons = {coupon.pk: coupon for coupon in self.admin.get_queryset(request)}
+        coupon = coupons[self.coupons[0].pk]
+        self.assertEqual(self.admin._user_count(coupon), 1)
+        self.assertTrue(self.admin._is_redeemed(coupon))
+        self.assertFalse(self.admin._is_redeemed(coupons[self.coupons[1].pk]))
+
+    def test_search(self):
+        request = self.get_request()
+        queryset, duplicates = self.admin.get_search_results(request, self.admin.get_queryset(request), "ABC")
+        self.assertEqual(queryset.count(), 5)
+        queryset, duplicates = self.admin.get_search_results(request, self.admin.get_queryset(request), "abc")
+        self.assertEqual(queryset.count(), 0)
+        queryset, duplicates = self.admin.get_search_results(request, self.admin.get_queryset(request), "3")
+        self.assertEqual(list(queryset), [self.coupons[3]])
+
+    def test_keyset(self):
+        self.admin.list_per_page = 2
+        response = self.admin.changelist_view(self.get_request())
+        self.assertEqual(len(response.context_data["cl"].result_list), 2)
+        self.assertIn("after=", response.context_data["keyset_next_url"])
+        response = self.admin.changelist_view(self.get_request(after=self.coupons[2].pk))
+        self.assertEqual(list(response.context_data["cl"].result_list), self.coupons[3:])
+        self.assertEqual(EstimatedCountPaginator(Coupon.objects.all(), 2).count, 5)
+
+    def test_keyset_other_ordering(self):
+        self.admin.list_per_page = 2
+        # sorted by code, walking the primary key would skip or repeat rows
+        response = self.admin.changelist_view(self.get_request(o="1"))
+        self.assertEqual(len(response.context_data["cl"].result_list), 2)
+        self.assertNotIn("keyset_next_url", response.context_data)
+
+
+class PaginatedInlineTestCase(TestCase):
+    def setUp(self):
+        self.site = AdminSite()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.campaign = Campaign.objects.create(name="test")
+        self.coupons = Coupon.objects.create_coupons(5, 'monetary', 'discount', 100, campaign=self.campaign)
+        self.inline = CouponInline(Campaign, self.site)
+        self.inline.per_page = 2
+
+    def get_request(self, **params):
+        request = self.factory.get("/admin/coupons/campaign/{}/coupons/".format(self.campaign.pk), params)
+        request.user = self.user
+        return request
+
+    def test_formset(self):
+        formset = self.inline.get_formset(self.get_request())(instance=self.campaign)
+        self.assertEqual(len(formset.forms), 2)
+        self.assertTrue(formset.has_more)
+        self.assertEqual(formset.last_pk, self.coupons[1].pk)
+
+    def test_page_view(self):
+        view = InlinePageAdminView.as_view(inline=self.inline)
+        response = view(self.get_request(after=self.coupons[1].pk), str(self.campaign.pk))
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual([row["original"] for row in data["results"]], [c.code for c in self.coupons[2:4]])
+        self.assertIn("after={}".format(self.coupons[3].pk), data["next"])
+        response = view(self.get_request(after=self.coupons[3].pk), str(self.campaign.pk))
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(len(data["results"]), 1)
+        self.assertIsNone(data["next"])
+        self.assertEqual(view(self.get_request(after="abc"), str(self.campaign.pk)).status_code, 400)
+        with self.assertRaises(Http404):
+            view(self.get_request(), "abc")
@@ -0,0 +1,89 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from coupons import archive
+from coupons.models import (
+    ArchivedCoupon, ArchivedCouponUser, Campaign, CampaignStats, Coupon, CouponUser, RedemptionRollup,
+)
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+SHARDS = ["shard0", "shard1"]
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user")
+        self.campaign = Campaign.objects.create(name="campaign")
+        long_ago = timezone.now() - timedelta(days=400)
+        self.expired = Coupon.objects.create_coupons(
+            3, 'monetary', 'discount', 100, valid_until=long_ago, campaign=self.campaign,
+        )
+        for coupon in self.expired:
+            CouponUser.objects.create(coupon=coupon, user=self.user, redeemed_at=long_ago - timedelta(days=1))
+        self.recent = Coupon.objects.create_coupon(
+            'monetary', 'discount', 100, valid_until=timezone.now() - timedelta(days=1), campaign=self.campaign,
+        )
+        CampaignStats.objects.rebuild([self.campaign.pk])
+
+    def test_archive(self):
+        progress = []
+        count = archive.archive(chunk_size=2, progress=lambda count, last: progress.append(count))
+        self.assertEqual(count, 3)
+        self.assertEqual(progress, [2, 3])
+        self.assertEqual(list(Coupon.objects.all()), [self.recent])
+        self.assertEqual(CouponUser.objects.count(), 0)
+        self.assertEqual(
+            sorted(ArchivedCoupon.objects.values_list("pk", flat=True)), sorted(coupon.pk for coupon in self.expired),
+        )
+        self.assertEqual(ArchivedCouponUser.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(CampaignStats.objects.get(campaign=self.campaign).total, 1)
+        self.assertEqual(archive.archive(), 0)
+
+    def test_get_including_archived(self):
+        code = self.expired[0].code
+        archive.archive()
+        with self.assertRaises(Coupon.DoesNotExist):
+            Coupon.objects.get_by_code(code)
+        coupon = Coupon.objects.get_including_archived(code.lower())
+        self.assertTrue(coupon.is_archived)
+        self.assertEqual(coupon.users.get().user, self.user)
+        self.assertFalse(Coupon.objects.get_including_archived(self.recent.code).is_archived)
+        with self.assertRaises(Coupon.DoesNotExist):
+            Coupon.objects.get_including_archived("MISSING")
+
+    def test_command(self):
+        out = StringIO()
+        call_command("archive_coupons", "--dry-run", stdout=out)
+        self.assertIn("3 coupons", out.getvalue())
+        self.assertEqual(ArchivedCoupon.objects.count(), 0)
+        call_command("archive_coupons", "--retention-days", "0", "--chunk-size", "1", stdout=out)
+        self.assertIn("Archived 4 coupons", out.getvalue())
+
+    @mock.patch("coupons.archive.ROLLUP_ON_REDEEM", True)
+    def test_rollup_on_redeem(self):
+        # the redemptions were rolled up by redeem, the cursor must not count them again
+        with mock.patch.object(RedemptionRollup.objects, "roll_up") as roll_up:
+            archive.archive()
+        roll_up.assert_not_called()
+
+
+@override_settings(DATABASE_ROUTERS=["coupons.sharding.ShardRouter"])
+@mock.patch("coupons.sharding.SHARDS", SHARDS)
+class ShardedArchiveTestCase(TransactionTestCase):
+    databases = {"default", "shard0", "shard1"}
+
+    def test_archive(self):
+        long_ago = timezone.now() - timedelta(days=400)
+        coupons = Coupon.objects.create_coupons(10, 'monetary', 'discount', 100, valid_until=long_ago)
+        self.assertEqual(archive.count_expired(archive.get_cutoff()), 10)
+        self.assertEqual(archive.archive(chunk_size=3), 10)
+        for alias in SHARDS:
+            self.assertFalse(Coupon.objects.using(alias).exists())
+        for coupon in coupons:
+            # the archived rows stay on the shard of their code
+            self.assertTrue(ArchivedCoupon.objects.using(coupon._state.db).filter(pk=coupon.pk).exists())
+            self.assertTrue(Coupon.objects.get_including_archived(coupon.code).is_archived)
@@ -0,0 +1,25 @@
+from coupons.tests import benchmarks
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+
+class BenchmarkTestCase(TestCase):
+    def test_run(self):
+        results = benchmarks.run(100, ops=3)
+        self.assertEqual(set(results["scenarios"]), {scenario.name for scenario in benchmarks.SCENARIOS})
+        self.assertEqual(results["scenarios"]["generate_code"]["queries_per_op"], 0)
+        self.assertEqual(results["scenarios"]["lookup[code_int]"]["queries_per_op"], 1)
+        self.assertEqual(set(results["indexes"]) - set(benchmarks.INDEXED_COLUMNS), set())
+        self.assertEqual(get_user_model().objects.get(username="benchmark").couponuser_set.count(), 6)
+        pks = [
+            scenario(100, None, None).lookup(benchmarks.get_code(42))
+            for scenario in (benchmarks.LookupNormalizedCode, benchmarks.LookupCodeInt)
+        ]
+        self.assertEqual(len(pks[1]), 1)
+        self.assertEqual(pks[0], pks[1])
+
+    def test_compare(self):
+        baseline = {"scenarios": {"redeem": {"ops_per_sec": 100.0, "queries_per_op": 4}}}
+        self.assertEqual(benchmarks.compare({"scenarios": {"redeem": {"ops_per_sec": 90.0, "queries_per_op": 4}}}, baseline), [])  # noqa
+        self.assertEqual(len(benchmarks.compare({"scenarios": {"redeem": {"ops_per_sec": 70.0, "queries_per_op": 5}}}, baseline)), 2)  # noqa
+        self.assertEqual(benchmarks.parse_size("1m"), 1000000)
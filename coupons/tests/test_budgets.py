@@ -0,0 +1,151 @@
+from unittest import mock
+
+from coupons.admin import CampaignAdmin
+from coupons.forms import CouponForm
+from coupons.models import Campaign, Coupon
+from coupons.tests.budgets import QueryBudget, QueryBudgetExceeded, QueryBudgetMixin
+from coupons.views import BatchCheckCouponView, CheckCouponView, WalletView
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase
+
+User = get_user_model()
+
+# maximum number of queries issued by each public operation
+BUDGETS = {
+    "CouponManager.redeem": 8,
+    "Coupon.redeem": 7,
+    "Coupon.redeem (outbox)": 8,
+    "CouponForm.is_valid": 5,
+    "CheckCouponView.post": 2,
+    "BatchCheckCouponView.post": 1,
+    "WalletView.get": 1,
+    "CouponAdmin.changelist": 5,
+    "CampaignAdmin.changelist": 5,
+}
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.campaign = Campaign.objects.create(name="test")
+        self.coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign, user_limit=100)
+
+    def add_redemptions(self, n):
+        while self.coupon.users.count() < n:
+            self.coupon.redeem(User.objects.create_user(username="user{}".format(self.coupon.users.count())))
+
+    def add_coupons(self, n):
+        while Coupon.objects.count() < n:
+            Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign).redeem(self.user)
+
+    def add_campaigns(self, n):
+        while Campaign.objects.count() < n:
+            campaign = Campaign.objects.create(name="campaign{}".format(Campaign.objects.count()))
+            Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=campaign)
+
+    def test_manager_redeem(self):
+        self.assertQueryBudget(
+            BUDGETS["CouponManager.redeem"],
+            lambda: Coupon.objects.redeem(self.coupon.code, self.user),
+            scale=self.add_redemptions,
+            label="CouponManager.redeem",
+        )
+
+    def test_coupon_redeem(self):
+        self.assertQueryBudget(
+            BUDGETS["Coupon.redeem"], lambda: self.coupon.redeem(self.user), scale=self.add_redemptions,
+            label="Coupon.redeem",
+        )
+
+    @mock.patch("coupons.models.OUTBOX_ENABLED", True)
+    def test_coupon_redeem_outbox(self):
+        self.assertQueryBudget(
+            BUDGETS["Coupon.redeem (outbox)"], lambda: self.coupon.redeem(self.user), scale=self.add_redemptions,
+            label="Coupon.redeem (outbox)",
+        )
+
+    def test_form(self):
+        self.assertQueryBudget(
+            BUDGETS["CouponForm.is_valid"],
+            lambda: self.assertTrue(CouponForm(data={"code": self.coupon.code}, user=self.user).is_valid()),
+            scale=self.add_redemptions,
+            label="CouponForm.is_valid",
+        )
+
+    def test_check_view(self):
+        factory = RequestFactory()
+
+        def check():
+            request = factory.post("/check", {"code": self.coupon.code})
+            request.user = self.user
+            self.assertEqual(CheckCouponView.as_view()(request).status_code, 200)
+
+        self.assertQueryBudget(
+            BUDGETS["CheckCouponView.post"], check, scale=self.add_redemptions, label="CheckCouponView.post",
+        )
+
+    def test_batch_check_view(self):
+        factory = RequestFactory()
+        codes = []
+
+        def scale(n):
+            self.add_coupons(n)
+            codes[:] = Coupon.objects.values_list("code", flat=True)
+
+        def check():
+            request = factory.post("/check/batch", {"codes": codes})
+            request.user = self.user
+            self.assertEqual(BatchCheckCouponView.as_view()(request).status_code, 200)
+
+        self.assertQueryBudget(
+            BUDGETS["BatchCheckCouponView.post"], check, scale=scale, label="BatchCheckCouponView.post",
+        )
+
+    def test_wallet_view(self):
+        factory = RequestFactory()
+
+        def add_coupons(n):
+            while Coupon.objects.count() < n:
+                Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign)
+
+        def wallet():
+            request = factory.get("/wallet")
+            request.user = self.user
+            self.assertEqual(WalletView.as_view()(request).status_code, 200)
+
+        self.assertQueryBudget(BUDGETS["WalletView.get"], wallet, scale=add_coupons, label="WalletView.get")
+
+    def test_coupon_changelist(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(
+            BUDGETS["CouponAdmin.changelist"],
+            lambda: self.assertEqual(self.client.get("/admin/coupons/coupon/").status_code, 200),
+            scale=self.add_coupons,
+            label="CouponAdmin.changelist",
+        )
+
+    def test_campaign_changelist(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget(
+            BUDGETS["CampaignAdmin.changelist"],
+            lambda: self.assertEqual(self.client.get("/admin/coupons/campaign/").status_code, 200),
+            scale=self.add_campaigns,
+            label="CampaignAdmin.changelist",
+        )
+
+    def test_campaign_counts(self):
+        Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign).redeem(self.user)
+        campaign = CampaignAdmin(Campaign, AdminSite()).get_queryset(None).get(pk=self.campaign.pk)
+        self.assertEqual(campaign.coupon_count, self.campaign.coupons.count())
+        self.assertEqual(campaign.used_count, self.campaign.coupons.used().count())
+        self.assertEqual(campaign.unused_count, self.campaign.coupons.unused().count())
+        self.assertEqual(campaign.expired_count, self.campaign.coupons.expired().count())
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with QueryBudget(0):
+                Coupon.objects.count()
+        with self.assertRaises(AssertionError) as context:
+            self.assertQueryBudget(10, lambda: [coupon.campaign for coupon in Coupon.objects.all()], scale=self.add_campaigns)  # noqa
+        self.assertIn("grows with N", str(context.exception))
@@ -0,0 +1,47 @@
+from unittest import mock, skipUnless
+
+from coupons import discounts
+from coupons.discounts import apply_discounts
+from coupons.models import Coupon
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+
+class DiscountTestCase(SimpleTestCase):
+    carts = [[1000, 999], 2500, [], [199]]
+    coupons = [("percentage", 10), ("monetary", 500), ("virtual_currency", 100)]
+
+    def test_python(self):
+        # 1999 -> 10% is 199.9, rounded half up to 200 -> 500 off; 199 -> 20 -> the remaining 179
+        self.assertEqual(apply_discounts(self.carts, self.coupons, use_numpy=False), [700, 750, 0, 199])
+
+    @skipUnless(discounts.numpy, "NumPy is not installed")
+    def test_numpy(self):
+        self.assertEqual(
+            apply_discounts(self.carts, self.coupons, use_numpy=True),
+            apply_discounts(self.carts, self.coupons, use_numpy=False),
+        )
+        carts = discounts.numpy.array([[1000, 999], [2500, 0]])
+        self.assertEqual(apply_discounts(carts, self.coupons[:2], use_numpy=True), [700, 750])
+
+    @skipUnless(discounts.numpy, "NumPy is not installed")
+    def test_handlers_parity(self):
+        totals = list(range(0, 2000, 7)) + [0, 1, 49, 50, 99, 100, 101]
+        array = discounts.numpy.array(totals, dtype=discounts.numpy.int64)
+        for type in ["monetary", "percentage", "virtual_currency"]:
+            handler = discounts.get_handler(type)
+            for value in [-10, 0, 1, 15, 50, 99, 100, 150, 5000]:
+                self.assertEqual(
+                    handler.discount_array(array, value).tolist(), [handler.discount(total, value) for total in totals],
+                    "{} {}".format(type, value),
+                )
+
+    def test_coupon(self):
+        coupon = Coupon(type="percentage", value=15)
+        self.assertEqual(coupon.get_discount([1000, 500]), 225)
+        self.assertEqual(apply_discounts([100], [coupon, Coupon(type="monetary", value=1000)]), [100])
+
+    def test_unknown_type(self):
+        with mock.patch("coupons.discounts._handlers", {}):
+            with self.assertRaises(ImproperlyConfigured):
+                apply_discounts([100], [("monetary", 100)])
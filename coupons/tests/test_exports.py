@@ -0,0 +1,50 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from coupons.admin import CouponAdmin
+from coupons.exports import export_coupons
+from coupons.models import Campaign, Coupon
+from django.contrib.admin.sites import AdminSite
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name="test")
+        self.coupons = Coupon.objects.create_coupons(5, 'monetary', 'discount', 100, campaign=self.campaign)
+
+    def test_csv(self):
+        content_type, chunks = export_coupons(Coupon.objects.all(), chunk_size=2)
+        with self.assertNumQueries(1):
+            rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+        self.assertEqual(content_type, "text/csv")
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][2], self.coupons[0].code)
+        self.assertEqual(rows[1][6], "test")
+
+    def test_ndjson_gzip(self):
+        content_type, chunks = export_coupons(Coupon.objects.all(), format="ndjson", compress=True)
+        lines = gzip.decompress(b"".join(chunks)).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line)["code"] for line in lines], [coupon.code for coupon in self.coupons])
+
+    def test_admin_action(self):
+        admin = CouponAdmin(Coupon, AdminSite())
+        request = RequestFactory().get("/")
+        response = admin.export_ndjson(request, admin.get_queryset(request).filter(pk=self.coupons[0].pk))
+        self.assertEqual(b"".join(response.streaming_content).count(b"\n"), 1)
+
+    def test_command(self):
+        Coupon.objects.create_coupon('monetary', 'discount', 100)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            call_command("export_coupons", "--campaign", str(self.campaign.pk), "--gzip", "--output", path)
+            with gzip.open(path, "rt") as fp:
+                self.assertEqual(len(fp.readlines()), 6)
+        finally:
+            os.unlink(path)
@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from coupons.exports import export_redemptions
+from coupons.models import Campaign, Coupon, CouponUser
+from coupons.pagination import decode_cursor, encode_cursor
+from coupons.views import RedemptionHistoryView
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+
+class RedemptionHistoryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user")
+        self.campaign = Campaign.objects.create(name="test")
+        self.coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign, user_limit=10)
+        now = timezone.now()
+        # two redemptions share their timestamp, sources are of two content types
+        sources = [self.campaign, self.user, Campaign.objects.create(name="other"), None]
+        self.redemptions = [
+            CouponUser.objects.create(
+                coupon=self.coupon, user=self.user, redeemed_at=now - timedelta(minutes=min(i, 2)), source=source,
+            )
+            for i, source in enumerate(sources)
+        ]
+
+    def test_cursor(self):
+        value = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(value, 42)), (value, 42))
+
+    def test_history(self):
+        expected = sorted(self.redemptions, key=lambda redemption: (redemption.redeemed_at, redemption.pk))[::-1]
+        self.assertEqual(list(CouponUser.objects.history(user=self.user)), expected)
+        self.assertEqual(list(CouponUser.objects.history(campaign=self.campaign)), expected)
+        last = expected[1]
+        self.assertEqual(list(CouponUser.objects.history().before(last.redeemed_at, last.pk)), expected[2:])
+
+    def test_with_sources(self):
+        with self.assertNumQueries(3):
+            sources = [redemption.source for redemption in CouponUser.objects.history().with_sources()]
+        self.assertEqual(sorted(map(str, filter(None, sources))), ["other", "test", "user"])
+
+    def get(self, **params):
+        request = RequestFactory().get("/history", params)
+        request.user = self.user
+        return RedemptionHistoryView.as_view()(request)
+
+    @mock.patch.object(RedemptionHistoryView, "per_page", 3)
+    def test_view(self):
+        with self.assertNumQueries(3):
+            data = json.loads(self.get().content.decode("utf-8"))["data"]
+        self.assertEqual(len(data["results"]), 3)
+        data = json.loads(self.get(after=data["next"]).content.decode("utf-8"))["data"]
+        self.assertEqual(len(data["results"]), 1)
+        self.assertIsNone(data["next"])
+
+    def test_view_export(self):
+        response = self.get(format="ndjson")
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[0])["source"], "test")
+        with self.assertRaises(PermissionDenied):
+            self.get(campaign=self.campaign.pk)
+
+    def test_export(self):
+        content_type, chunks = export_redemptions(CouponUser.objects.history(), chunk_size=2)
+        # one query per chunk, plus one per content type in each chunk
+        with self.assertNumQueries(4):
+            rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1][4], "coupons.campaign")
+
+    def test_command(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            call_command("export_redemptions", "--campaign", str(self.campaign.pk), "--format", "ndjson", "-o", path)
+            with open(path) as fp:
+                self.assertEqual(len(fp.readlines()), 4)
+        finally:
+            os.unlink(path)
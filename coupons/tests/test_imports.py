@@ -0,0 +1,44 @@
+import csv
+import io
+import os
+import tempfile
+
+from coupons.imports import CouponImporter, read_codes
+from coupons.models import Campaign, CampaignStats, Coupon
+from django.core.management import call_command
+from django.test import TestCase
+
+
+class CouponImporterTestCase(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name="test")
+        Coupon.objects.create(code="EXISTING", type='monetary', value=1)
+
+    def test_run(self):
+        data = "code,note\nABC1,x\nABC2,y\nABC1,dup\nEXISTING,z\nnot valid!,w\n{}\n\nABC3\n".format("A" * 31)
+        report = io.StringIO()
+        importer = CouponImporter(
+            'monetary', 'discount', 10, campaign=self.campaign, batch_size=2, rejected=csv.writer(report),
+        ).run(read_codes(io.StringIO(data)))
+        self.assertEqual((importer.read, importer.imported, importer.skipped), (7, 3, 4))
+        self.assertEqual(
+            set(Coupon.objects.filter(campaign=self.campaign).values_list("code", flat=True)), {"ABC1", "ABC2", "ABC3"},
+        )
+        self.assertEqual(sorted(row[0] for row in csv.reader(io.StringIO(report.getvalue()))), ["4", "5", "6", "7"])
+        self.assertEqual(CampaignStats.objects.get(campaign=self.campaign).total, 3)
+
+    def test_command(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        rejected = path + ".rejected"
+        try:
+            with open(path, "w") as fp:
+                fp.write("ABC1\nEXISTING\n")
+            call_command("import_coupons", path, "--type", "monetary", "--value", "5", "--rejected", rejected, stdout=io.StringIO())  # noqa
+            self.assertTrue(Coupon.objects.filter(code="ABC1", value=5).exists())
+            with open(rejected) as fp:
+                self.assertEqual(len(fp.readlines()), 2)
+        finally:
+            os.unlink(path)
+            if os.path.exists(rejected):
+                os.unlink(rejected)
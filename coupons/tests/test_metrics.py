@@ -0,0 +1,76 @@
+from coupons import metrics
+from coupons.models import Coupon
+from coupons.views import GenerateCouponsAdminView, MetricsView
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+User = get_user_model()
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.sink = metrics.RegistrySink()
+        metrics.set_sink(self.sink)
+        self.user = User.objects.create_user(username="user", password="password")
+
+    def tearDown(self):
+        metrics.set_sink(None)
+
+    def test_null_sink(self):
+        metrics.set_sink(metrics.NullSink())
+        self.assertIs(metrics.timer("anything"), metrics.null_timer)
+        metrics.incr("anything")
+
+    def test_redeem(self):
+        Coupon.objects.create_coupons(2, 'monetary', 'discount', 100)
+        coupon = Coupon.objects.first()
+        Coupon.objects.redeem(coupon.code, self.user)
+        with self.assertRaises(Coupon.IsUsableError):
+            coupon.redeem(self.user)
+        with self.assertRaises(Coupon.DoesNotExist):
+            Coupon.objects.redeem("missing", self.user)
+        self.assertEqual(self.sink.get("coupons_generated_total", type="monetary"), 2)
+        self.assertEqual(self.sink.get("coupons_lookups_total", source="redeem", outcome="found"), 1)
+        self.assertEqual(self.sink.get("coupons_lookups_total", source="redeem", outcome="missing"), 1)
+        self.assertEqual(self.sink.get("coupons_redemptions_total", type="monetary", outcome="redeemed"), 1)
+        self.assertEqual(self.sink.get("coupons_redemptions_total", type="monetary", outcome="rejected"), 1)
+        self.assertEqual(self.sink.timers[self.sink.key("coupons_redeem_seconds", {})][0], 2)
+
+    def test_check(self):
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100)
+        self.client.force_login(self.user)
+        self.client.post(reverse("coupons-check"), {"code": coupon.code})
+        self.client.post(reverse("coupons-check"), {"code": "missing"})
+        self.assertEqual(self.sink.get("coupons_checks_total", status=200), 1)
+        self.assertEqual(self.sink.get("coupons_checks_total", status=404), 1)
+
+    def test_generate(self):
+        request = RequestFactory().post("/admin/coupons/coupon/generate/", {
+            "quantity": 3, "value": 100, "type": "monetary", "action": "discount", "code_length": 8,
+            "code_chars": "ABCDEFGH",
+        })
+        request.user = self.user
+        response = GenerateCouponsAdminView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sink.get("coupons_generated_total", type="monetary"), 3)
+        self.assertEqual(self.sink.timers[self.sink.key("coupons_generate_seconds", {"method": "post"})][0], 1)
+
+    @override_settings(INTERNAL_IPS=[])
+    def test_prometheus(self):
+        metrics.incr("coupons_checks_total", status=200)
+        with metrics.timer("coupons_check_seconds"):
+            pass
+        self.assertEqual(self.client.get(reverse("coupons-metrics")).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("coupons-metrics"))
+        self.assertEqual(response["Content-Type"], MetricsView.content_type)
+        lines = response.content.decode("utf-8").splitlines()
+        self.assertIn('coupons_checks_total{status="200"} 1', lines)
+        self.assertIn("coupons_check_seconds_count 1", lines)
+
+    def test_prometheus_disabled(self):
+        metrics.set_sink(metrics.NullSink())
+        self.assertEqual(self.client.get(reverse("coupons-metrics")).status_code, 404)
@@ -1,10 +1,13 @@
 import re
 from datetime import timedelta
+from unittest import mock
 
 from coupons.models import Campaign, Coupon
 from coupons.settings import (CODE_CHARS, CODE_LENGTH, SEGMENT_LENGTH,
                               SEGMENT_SEPARATOR)
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 
@@ -105,9 +108,87 @@ class CouponTestCase(TestCase):
         self.assertEqual(Coupon.objects.used().count(), 1)
         self.assertEqual(Coupon.objects.unused().count(), 0)
 
+    def test_redeem_annotated(self):
+        Coupon.objects.create_coupon('monetary', 'discount', 100)
+        coupon = Coupon.objects.with_usage().get()
+        coupon.redeem()
+        # the annotated counts are stale after the first redemption
+        with self.assertRaises(Coupon.IsUsableError):
+            coupon.redeem()
+        self.assertTrue(coupon.is_redeemed)
+
 
 class CampaignTestCase(TestCase):
     def test_str(self):
         campaign = Campaign(name="test")
         campaign.save()
         self.assertEqual("test", str(campaign))
+
+
+class NormalizedCodeTestCase(TestCase):
+    def test_normalize_code(self):
+        self.assertEqual(Coupon.normalize_code(" ab{}co l1 ".format(SEGMENT_SEPARATOR)), "ABC011")
+        self.assertEqual(Coupon.normalize_code("Oil"), Coupon.normalize_code("011"))
+
+    def test_saved(self):
+        coupon = Coupon.objects.create(code="ab{}cd".format(SEGMENT_SEPARATOR), type='monetary', value=100)
+        self.assertEqual(coupon.normalized_code, "ABCD")
+
+    def test_get_by_code(self):
+        coupon = Coupon.objects.create(code="ABCD{}EF0".format(SEGMENT_SEPARATOR), type='monetary', value=100)
+        with self.assertNumQueries(1):
+            self.assertEqual(Coupon.objects.get_by_code(" abcd efo "), coupon)
+        with self.assertRaises(Coupon.DoesNotExist):
+            Coupon.objects.get_by_code("abcdefg")
+
+    def test_ambiguous(self):
+        upper = Coupon.objects.create(code="ABCD", type='monetary', value=100)
+        lower = Coupon.objects.create(code="abcd", type='monetary', value=100)
+        self.assertEqual(Coupon.objects.get_by_code("ABCD"), upper)
+        self.assertEqual(Coupon.objects.get_by_code("abcd"), lower)
+        with self.assertRaises(Coupon.DoesNotExist):
+            Coupon.objects.get_by_code("AbCd")
+
+    def test_redeem(self):
+        coupon = Coupon.objects.create(code="ABCD", type='monetary', value=100)
+        self.assertEqual(Coupon.objects.redeem("ab{}cd".format(SEGMENT_SEPARATOR), None).coupon, coupon)
+
+
+@mock.patch("coupons.models.CODE_INT_LOOKUP", True)
+class CodeIntTestCase(TestCase):
+    def test_encode_code(self):
+        self.assertEqual(Coupon.encode_code("A"), Coupon.get_code_digits()["A"])
+        self.assertNotEqual(Coupon.encode_code("0A"), Coupon.encode_code("A"))
+        self.assertIsNone(Coupon.encode_code("A+B"))
+        self.assertIsNone(Coupon.encode_code(""))
+        codes = {Coupon.normalize_code(Coupon.generate_code(code_length=12)) for i in range(200)}
+        self.assertEqual(len({Coupon.encode_code(code) for code in codes}), len(codes))
+        self.assertLess(Coupon.encode_code("Z" * 10), 2 ** 63)
+        self.assertIsNone(Coupon.encode_code("Z" * 30))
+
+    def get_errors(self):
+        return [error.id for error in Coupon.check() if error.id.startswith("coupons.")]
+
+    def test_check(self):
+        self.assertEqual(Coupon.get_code_int_length(), 12)
+        with mock.patch("coupons.models.CODE_LENGTH", 12):
+            self.assertEqual(self.get_errors(), [])
+        with mock.patch("coupons.models.CODE_LENGTH", 15):
+            self.assertEqual(self.get_errors(), ["coupons.E001"])
+        with mock.patch("coupons.models.CODE_INT_LOOKUP", False), mock.patch("coupons.models.CODE_LENGTH", 15):
+            self.assertEqual(self.get_errors(), [])
+
+    def test_get_by_code(self):
+        coupon = Coupon.objects.create(code="abcd", type='monetary', value=100)
+        self.assertEqual(coupon.code_int, Coupon.encode_code("ABCD"))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Coupon.objects.get_by_code("AB-CD"), coupon)
+        self.assertIn("code_int", queries[0]["sql"])
+        self.assertNotIn("normalized_code\" =", queries[0]["sql"])
+        other = Coupon.objects.create(code="a+b", type='monetary', value=100)
+        self.assertIsNone(other.code_int)
+        self.assertEqual(Coupon.objects.get_by_code("A+B"), other)
+        long = Coupon.objects.create(code="A" * 30, type='monetary', value=100)
+        self.assertIsNone(long.code_int)
+        self.assertEqual(Coupon.objects.get_by_code("a" * 30), long)
+        self.assertEqual(set(Coupon.objects.filter_codes(["abcd", "A+B", "A" * 30, "missing"])), {coupon, other, long})
@@ -0,0 +1,191 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from coupons import outbox
+from coupons.models import Campaign, Coupon, PendingEvent, RedemptionEvent, RollupCursor
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+SHARDS = ["shard0", "shard1"]
+
+
+@mock.patch("coupons.models.OUTBOX_ENABLED", True)
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user")
+        self.campaign = Campaign.objects.create(name="campaign")
+
+    def redeem(self, n):
+        coupons = Coupon.objects.create_coupons(n, 'monetary', 'discount', 100, campaign=self.campaign)
+        return [coupon.redeem(self.user) for coupon in coupons]
+
+    def add_event(self, pk, created_at=None):
+        return RedemptionEvent.objects.create(
+            pk=pk, coupon_user_id=pk, coupon_id=pk, code="CODE{}".format(pk), type="monetary", action="discount",
+            value=100, redeemed_at=timezone.now(), created_at=created_at or timezone.now(),
+        )
+
+    def test_redeem(self):
+        coupon_user = self.redeem(1)[0]
+        event = RedemptionEvent.objects.get()
+        self.assertEqual(event.coupon_user_id, coupon_user.pk)
+        self.assertEqual(event.code, coupon_user.coupon.code)
+        self.assertEqual(event.campaign_id, self.campaign.pk)
+        self.assertEqual(event.user_id, self.user.pk)
+        self.assertEqual(outbox.event_to_json(event)["redemption"], coupon_user.pk)
+
+    def test_rollback(self):
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100)
+        with mock.patch.object(Coupon, "do_redeem_pipeline", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                coupon.redeem(self.user)
+        self.assertFalse(RedemptionEvent.objects.exists())
+
+    def test_disabled(self):
+        with mock.patch("coupons.models.OUTBOX_ENABLED", False):
+            self.redeem(1)
+        self.assertFalse(RedemptionEvent.objects.exists())
+
+    def test_batches(self):
+        redemptions = self.redeem(5)
+        consumer = outbox.Consumer("billing", batch_size=2)
+        seen = []
+        for batch in consumer.batches():
+            seen.extend(event.coupon_user_id for event in batch)
+        self.assertEqual(seen, [coupon_user.pk for coupon_user in redemptions])
+        self.assertEqual(consumer.lag(), 0)
+        self.assertEqual(list(consumer.batches()), [])
+        self.assertEqual(RollupCursor.objects.get(name="outbox:default:billing").position, RedemptionEvent.objects.last().pk)  # noqa: E501
+
+    def test_at_least_once(self):
+        self.redeem(3)
+        consumer = outbox.Consumer("billing", batch_size=2)
+        batches = consumer.batches()
+        first = next(batches)
+        batches.close()
+        # the batch was not acknowledged, it is delivered again
+        self.assertEqual(next(consumer.batches()), first)
+        self.assertEqual(consumer.lag(), 3)
+
+    def test_gap(self):
+        consumer = outbox.Consumer("billing", gap_timeout=30)
+        for pk in (1, 2, 4):
+            self.add_event(pk)
+        # id 3 may belong to a transaction still in flight
+        self.assertEqual([event.pk for event in consumer.poll()], [1, 2])
+        consumer.ack(consumer.poll())
+        self.assertEqual(consumer.poll(), [])
+        self.add_event(3)
+        self.assertEqual([event.pk for event in consumer.poll()], [3, 4])
+
+    def test_gap_timeout(self):
+        consumer = outbox.Consumer("billing", gap_timeout=30)
+        self.add_event(2, created_at=timezone.now() - timedelta(minutes=1))
+        self.add_event(3)
+        self.assertEqual([event.pk for event in consumer.poll()], [2, 3])
+
+    def test_late_commit(self):
+        consumer = outbox.Consumer("billing", gap_timeout=30)
+        for pk in (1, 2):
+            self.add_event(pk)
+        consumer.ack(consumer.poll())
+        self.add_event(4, created_at=timezone.now() - timedelta(minutes=1))
+        consumer.ack(consumer.poll())
+        self.assertEqual(list(consumer.get_pending()), [3])
+        self.assertEqual(outbox.prune(), 2)
+        # the transaction of id 3 commits after the cursor moved past it
+        self.add_event(3)
+        self.assertEqual(consumer.lag(), 1)
+        self.assertEqual([event.pk for event in consumer.poll()], [3])
+        consumer.ack(consumer.poll())
+        self.assertEqual(consumer.get_pending(), {})
+        self.assertEqual(consumer.get_position(), 4)
+
+    def test_give_up(self):
+        consumer = outbox.Consumer("billing", gap_timeout=30, reconcile_timeout=600)
+        self.add_event(1)
+        consumer.ack(consumer.poll())
+        self.add_event(3, created_at=timezone.now() - timedelta(minutes=1))
+        consumer.ack(consumer.poll())
+        PendingEvent.objects.update(skipped_at=timezone.now() - timedelta(minutes=20))
+        with self.assertLogs("coupons.outbox", "WARNING"):
+            self.assertEqual(consumer.poll(), [])
+        self.assertFalse(PendingEvent.objects.exists())
+        # a gap older than the reconciliation horizon is given up right away
+        self.add_event(5, created_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs("coupons.outbox", "WARNING"):
+            consumer.ack(consumer.poll())
+        self.assertFalse(PendingEvent.objects.exists())
+
+    def test_ack_does_not_move_back(self):
+        self.redeem(2)
+        consumer = outbox.Consumer("billing")
+        events = consumer.poll()
+        consumer.ack(events)
+        consumer.ack(events[:1])
+        self.assertEqual(consumer.get_position(), events[-1].pk)
+
+    def test_prune(self):
+        self.redeem(5)
+        self.assertEqual(outbox.prune(), 0)
+        billing, crm = outbox.Consumer("billing"), outbox.Consumer("crm", batch_size=2)
+        crm.register()
+        for batch in billing.batches():
+            pass
+        self.assertEqual(outbox.prune(batch_size=2), 0)
+        batches = crm.batches()
+        next(batches)
+        next(batches)
+        self.assertEqual(outbox.prune(batch_size=1), 2)
+        self.assertEqual(RedemptionEvent.objects.count(), 3)
+        self.assertEqual(crm.lag(), 3)
+
+    def test_invalid_name(self):
+        for name in ("", "a:b", "x" * 50):
+            with self.assertRaises(ValueError):
+                outbox.Consumer(name)
+
+    def test_command(self):
+        redemptions = self.redeem(3)
+        out, err = StringIO(), StringIO()
+        call_command("stream_redemption_events", "billing", "--batch-size", "2", "--prune", stdout=out, stderr=err)
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([event["redemption"] for event in events], [coupon_user.pk for coupon_user in redemptions])
+        self.assertIn("Streamed 3 events", err.getvalue())
+        self.assertFalse(RedemptionEvent.objects.exists())
+        out = StringIO()
+        call_command("stream_redemption_events", "billing", stdout=out, stderr=err)
+        self.assertEqual(out.getvalue(), "")
+        with self.assertRaises(CommandError):
+            call_command("stream_redemption_events", "a:b", stdout=out, stderr=err)
+
+
+@override_settings(DATABASE_ROUTERS=["coupons.sharding.ShardRouter"])
+@mock.patch("coupons.sharding.SHARDS", SHARDS)
+@mock.patch("coupons.models.OUTBOX_ENABLED", True)
+class ShardedOutboxTestCase(TransactionTestCase):
+    databases = {"default", "shard0", "shard1"}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="user")
+        for alias in SHARDS:
+            User.objects.using(alias).create(pk=self.user.pk, username="user")
+
+    def test_shards(self):
+        coupons = Coupon.objects.create_coupons(10, 'monetary', 'discount', 100)
+        for coupon in coupons:
+            coupon.redeem(self.user)
+        for alias in SHARDS:
+            self.assertEqual(
+                RedemptionEvent.objects.using(alias).count(),
+                Coupon.objects.using(alias).count(),
+            )
+        consumer = outbox.Consumer("billing")
+        codes = [event.code for batch in consumer.batches() for event in batch]
+        self.assertEqual(sorted(codes), sorted(coupon.code for coupon in coupons))
+        self.assertEqual(RollupCursor.objects.filter(name__startswith="outbox:shard").count(), 2)
+        self.assertEqual(outbox.prune(), 10)
@@ -0,0 +1,81 @@
+from io import StringIO
+from unittest import mock
+
+from coupons import cache
+from coupons.models import Campaign, CampaignStats, Coupon, CouponReservation, CouponUser
+from coupons.views import WalletView
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+@mock.patch("coupons.cache.LOOKUP_CACHE", "default")
+@mock.patch("coupons.wallet.WALLET_CACHE", "default")
+class DisableCampaignTestCase(TransactionTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.user = User.objects.create_user(username="user")
+        self.campaign = Campaign.objects.create(name="campaign")
+        self.coupons = Coupon.objects.create_coupons(3, 'monetary', 'discount', 100, campaign=self.campaign)
+        # room for the binding and the hold below
+        Coupon.objects.filter(campaign=self.campaign).update(user_limit=2)
+        self.other = Coupon.objects.create_coupon('monetary', 'discount', 100)
+        CouponUser.objects.create(coupon=self.coupons[0], user=self.user)
+
+    def get_wallet(self):
+        request = RequestFactory().get("/wallet")
+        request.user = self.user
+        return WalletView.as_view()(request)
+
+    def test_disable(self):
+        self.coupons[1].reserve()
+        cache.warm([coupon.normalized_code for coupon in self.coupons])
+        self.assertEqual(self.get_wallet().content.count(b'"code"'), 3)
+        with self.assertNumQueries(0):
+            self.get_wallet()
+        self.assertEqual(self.campaign.disable(), 3)
+        self.assertIsNotNone(Campaign.objects.get(pk=self.campaign.pk).disabled_at)
+        self.assertEqual(Coupon.objects.filter(campaign=self.campaign).expired().count(), 3)
+        self.assertTrue(Coupon.objects.get(pk=self.other.pk).is_active)
+        self.assertEqual(CouponReservation.objects.count(), 0)
+        self.assertEqual(CampaignStats.objects.get(campaign=self.campaign).expired, 3)
+        self.assertIsNone(caches["default"].get(cache.make_key(self.coupons[0].normalized_code)))
+        self.assertEqual(self.get_wallet().content.count(b'"code"'), 0)
+
+    def test_purge(self):
+        self.campaign.disable()
+        progress = []
+        with CaptureQueriesContext(connection) as queries:
+            count = Campaign.objects.purge(self.campaign, chunk_size=1, progress=lambda count, last: progress.append(count))  # noqa
+        self.assertEqual(count, 3)
+        self.assertEqual(progress, [1, 2, 3])
+        # coupons are never loaded as instances
+        self.assertFalse([query for query in queries if '"coupons_coupon"."code"' in query["sql"]])
+        self.assertFalse(Campaign.objects.filter(pk=self.campaign.pk).exists())
+        self.assertEqual(list(Coupon.objects.all()), [self.other])
+        self.assertEqual(CouponUser.objects.count(), 0)
+
+    def test_command(self):
+        Campaign.objects.create(name="kept")
+        self.campaign.disable()
+        out = StringIO()
+        call_command("purge_campaigns", "--chunk-size", "2", stdout=out)
+        self.assertIn("Deleted 3 coupons", out.getvalue())
+        self.assertEqual(list(Campaign.objects.values_list("name", flat=True)), ["kept"])
+
+    def test_admin_delete(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", "admin")
+        self.client.force_login(admin)
+        url = "/admin/coupons/campaign/{}/delete/".format(self.campaign.pk)
+        response = self.client.get(url)
+        self.assertContains(response, "Coupons: 3")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {"post": "yes"})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([query for query in queries if '"coupons_coupon"."code"' in query["sql"]])
+        self.assertFalse(Campaign.objects.filter(pk=self.campaign.pk).exists())
+        self.assertEqual(list(Coupon.objects.all()), [self.other])
@@ -0,0 +1,86 @@
+import json
+from unittest import mock
+
+from coupons import ratelimit
+from coupons.forms import CouponForm
+from coupons.models import Coupon
+from coupons.views import BatchCheckCouponView, CheckCouponView
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+
+class BackendTestCase(TestCase):
+    def assertSlidingWindow(self, backend):
+        with mock.patch("coupons.ratelimit.time.time", return_value=1000.0):
+            self.assertEqual([backend.hit("key", 3, 10)[0] for i in range(4)], [True, True, True, False])
+        # 80% of the previous window still overlaps the sliding one: 4 * 0.8 + 1 > 3
+        with mock.patch("coupons.ratelimit.time.time", return_value=1012.0):
+            self.assertEqual(backend.hit("key", 3, 10), (False, 8))
+        with mock.patch("coupons.ratelimit.time.time", return_value=1030.0):
+            self.assertEqual(backend.hit("key", 3, 10), (True, 0))
+
+    def test_local(self):
+        self.assertSlidingWindow(ratelimit.LocalBackend())
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_cache(self):
+        cache.clear()
+        self.assertSlidingWindow(ratelimit.CacheBackend())
+
+
+@mock.patch("coupons.ratelimit.RATELIMIT_USER", (2, 60))
+@mock.patch("coupons.ratelimit.RATELIMIT_IP", (3, 60))
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        ratelimit.set_backend(ratelimit.LocalBackend())
+        self.user = User.objects.create_user(username="user", password="password")
+        self.coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, user_limit=10)
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        ratelimit.set_backend(None)
+
+    def check(self, user, view=CheckCouponView, **data):
+        request = self.factory.post("/check", data or {"code": self.coupon.code})
+        request.user = user
+        return view.as_view()(request)
+
+    def test_view(self):
+        self.assertEqual([self.check(self.user).status_code for i in range(2)], [200, 200])
+        with self.assertNumQueries(0):
+            response = self.check(self.user)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(json.loads(response.content.decode("utf-8"))["status"], 429)
+        self.assertTrue(int(response["Retry-After"]) > 0)
+        # the ip limit is shared by every user behind it
+        other = User.objects.create_user(username="other")
+        self.assertEqual([self.check(other).status_code for i in range(2)], [200, 429])
+
+    def test_batch_cost(self):
+        self.assertEqual(self.check(self.user, BatchCheckCouponView, codes=["a", "b", "c"]).status_code, 429)
+
+    def test_form(self):
+        for i in range(2):
+            self.assertTrue(CouponForm(data={"code": self.coupon.code}, user=self.user).is_valid())
+        form = CouponForm(data={"code": self.coupon.code}, user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()["code"][0].code, "ratelimit")
+
+    def test_form_redeem(self):
+        # validating then redeeming is a single attempt
+        other = Coupon.objects.create_coupon('monetary', 'discount', 100)
+        for coupon in [self.coupon, other]:
+            form = CouponForm(data={"code": coupon.code}, user=self.user)
+            self.assertTrue(form.is_valid())
+            form.redeem()
+        self.assertEqual(other.users.get().user, self.user)
+        form = CouponForm(data={"code": self.coupon.code}, user=self.user)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()["code"][0].code, "ratelimit")
+
+    def test_manager_redeem(self):
+        for i in range(2):
+            Coupon.objects.redeem(self.coupon.code, self.user)
+        with self.assertRaises(Coupon.RateLimitError):
+            Coupon.objects.redeem(self.coupon.code, self.user)
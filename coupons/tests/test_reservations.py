@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from coupons.models import Coupon, CouponReservation
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+
+class ReservationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user")
+        self.coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, user_limit=2)
+
+    def test_holds_count_in_is_usable(self):
+        self.coupon.reserve(self.user)
+        self.assertTrue(Coupon.objects.get(pk=self.coupon.pk).is_usable)
+        self.coupon.reserve()
+        self.assertFalse(Coupon.objects.get(pk=self.coupon.pk).is_usable)
+        self.assertEqual(Coupon.objects.with_usage().get(pk=self.coupon.pk).held_count, 2)
+        with self.assertRaises(Coupon.IsUsableError):
+            self.coupon.reserve()
+        with self.assertRaises(Coupon.IsUsableError):
+            self.coupon.redeem(self.user)
+
+    def test_hold_then_redeem(self):
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, user_limit=1)
+        stale = Coupon.objects.with_usage().get(pk=coupon.pk)
+        coupon.reserve()
+        with self.assertRaises(Coupon.IsUsableError):
+            stale.redeem(self.user)
+        self.assertEqual(coupon.users.count(), 0)
+
+    def test_confirm(self):
+        reservation = self.coupon.reserve(self.user)
+        self.coupon.reserve()
+        coupon_user = reservation.confirm()
+        self.assertEqual(coupon_user.user, self.user)
+        self.assertEqual(CouponReservation.objects.count(), 1)
+        with self.assertRaises(Coupon.ExpiredError):
+            reservation.confirm()
+
+    def test_expired(self):
+        reservation = self.coupon.reserve(self.user, ttl=60)
+        self.coupon.reserve()
+        CouponReservation.objects.filter(pk=reservation.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        reservation.refresh_from_db()
+        self.assertTrue(Coupon.objects.get(pk=self.coupon.pk).is_usable)
+        with self.assertRaises(Coupon.ExpiredError):
+            reservation.confirm()
+
+    def test_release(self):
+        reservation = self.coupon.reserve()
+        self.coupon.reserve()
+        reservation.release()
+        self.assertTrue(Coupon.objects.get(pk=self.coupon.pk).is_usable)
+
+    def test_sweep(self):
+        for i in range(2):
+            self.coupon.reserve()
+        CouponReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.coupon.reserve()
+        out = StringIO()
+        call_command("sweep_reservations", "--batch-size", "1", stdout=out)
+        self.assertIn("Released 2", out.getvalue())
+        self.assertEqual(CouponReservation.objects.count(), 1)
+
+
+@skipUnless(connection.features.has_select_for_update, "row locks are not supported")
+class ReservationRaceTestCase(TransactionTestCase):
+    def attempt(self, pk, action):
+        try:
+            coupon = Coupon.objects.get(pk=pk)
+            if action == "reserve":
+                coupon.reserve()
+            else:
+                coupon.redeem()
+            return True
+        except Coupon.IsUsableError:
+            return False
+        finally:
+            connections.close_all()
+
+    def test_hold_and_redeem(self):
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, user_limit=1)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda action: self.attempt(coupon.pk, action), ["reserve", "redeem"] * 4))
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(coupon.users.count() + CouponReservation.objects.filter(coupon=coupon).count(), 1)
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from coupons.models import Campaign, Coupon, RedemptionRollup
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+User = get_user_model()
+
+
+class RedemptionRollupTestCase(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name="test")
+        self.start = datetime(2018, 3, 1, 10, 15, tzinfo=dt_timezone.utc)
+
+    def test_series(self):
+        RedemptionRollup.objects.append([
+            (self.start, self.campaign.pk, "monetary", "discount"),
+            (self.start + timedelta(minutes=10), self.campaign.pk, "monetary", "discount"),
+            (self.start + timedelta(hours=2), self.campaign.pk, "percentage", "discount"),
+            (self.start, None, "monetary", "discount"),
+        ])
+        hour = self.start.replace(minute=0)
+        self.assertEqual(
+            RedemptionRollup.objects.series(self.start, self.start + timedelta(hours=2), campaign=self.campaign),
+            [(hour, 2), (hour + timedelta(hours=1), 0), (hour + timedelta(hours=2), 1)],
+        )
+        self.assertEqual(
+            RedemptionRollup.objects.series(self.start, self.start, period="day", type="monetary"),
+            [(hour.replace(hour=0), 3)],
+        )
+
+    def test_roll_up(self):
+        user = User.objects.create_user(username="user1")
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign, user_limit=3)
+        Coupon.objects.create_coupon('monetary', 'discount', 100, users=[user])  # bound, not redeemed
+        coupon.redeem(user)
+        coupon.redeem()
+        call_command("rollup_redemptions", "--batch-size", "1", "--safety-margin", "0", stdout=StringIO())
+        coupon.redeem()
+        self.assertEqual(RedemptionRollup.objects.roll_up(), 0)  # within the safety margin
+        self.assertEqual(RedemptionRollup.objects.roll_up(safety_margin=0), 1)
+        redeemed_at = coupon.users.first().redeemed_at
+        series = RedemptionRollup.objects.series(redeemed_at, redeemed_at, period="day", campaign=self.campaign)
+        self.assertEqual(series[0][1], 3)
+
+    def test_roll_up_out_of_order(self):
+        user = User.objects.create_user(username="user1")
+        bound = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign, users=[user])
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign)
+        coupon.redeem()
+        self.assertEqual(RedemptionRollup.objects.roll_up(safety_margin=0), 1)
+        # the bound redemption has a lower primary key than the rolled up one
+        bound.users.update(redeemed_at=timezone.now())
+        self.assertEqual(RedemptionRollup.objects.roll_up(safety_margin=0), 1)
+        self.assertEqual(RedemptionRollup.objects.roll_up(safety_margin=0), 0)
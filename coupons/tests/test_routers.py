@@ -0,0 +1,69 @@
+import json
+from unittest import mock
+
+from coupons.forms import CouponForm
+from coupons import cache
+from coupons.models import Campaign, Coupon, CouponUser, RedemptionRollup
+from coupons.routers import ReplicaRouter, primary
+from coupons.views import CheckCouponView
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory, TransactionTestCase, override_settings
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    DATABASE_ROUTERS=["coupons.routers.ReplicaRouter"],
+)
+@mock.patch("coupons.routers.READ_REPLICAS", ["replica"])
+class ReplicaRouterTestCase(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        caches["default"].clear()
+        self.user = User.objects.create_user(username="user")
+        self.coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, user_limit=5)
+
+    def test_routing(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Coupon), "replica")
+        self.assertEqual(router.db_for_write(Coupon), "default")
+        self.assertIsNone(router.db_for_read(User))
+        with primary():
+            self.assertEqual(router.db_for_read(CouponUser), "default")
+        self.assertFalse(router.allow_migrate("replica", "coupons"))
+        self.assertEqual(Coupon.objects.get(pk=self.coupon.pk)._state.db, "replica")
+
+    def test_redeem_is_pinned(self):
+        coupon = Coupon.objects.get(pk=self.coupon.pk)
+        with self.assertNumQueries(0, using="replica"):
+            coupon_user = coupon.redeem(self.user)
+            Coupon.objects.redeem(self.coupon.code, self.user)
+        self.assertEqual(coupon_user._state.db, "default")
+
+    def check(self, user):
+        request = RequestFactory().post("/check", {"code": self.coupon.code})
+        request.user = user
+        response = CheckCouponView.as_view()(request)
+        return json.loads(response.content.decode("utf-8"))["status"]
+
+    def test_sticky_after_redeem(self):
+        other = User.objects.create_user(username="other")
+        with self.assertNumQueries(0, using="default"):
+            self.assertEqual(self.check(self.user), 200)
+        self.coupon.redeem(self.user)
+        with self.assertNumQueries(0, using="replica"):
+            self.assertEqual(self.check(self.user), 200)
+            CouponForm({"code": self.coupon.code}, user=self.user).is_valid()
+        with self.assertNumQueries(0, using="default"):
+            self.assertEqual(self.check(other), 200)
+
+    @mock.patch("coupons.cache.LOOKUP_CACHE", "default")
+    def test_primary_reads(self):
+        campaign = Campaign.objects.create(name="campaign")
+        Coupon.objects.filter(pk=self.coupon.pk).update(campaign=campaign)
+        self.coupon.redeem(self.user)
+        with self.assertNumQueries(0, using="replica"):
+            campaign.disable()
+            RedemptionRollup.objects.roll_up(safety_margin=0)
+            cache.warm([self.coupon.normalized_code])
@@ -0,0 +1,62 @@
+from datetime import timedelta
+from unittest import mock
+
+from coupons import cache
+from coupons.models import Coupon
+from coupons.scheduler import EVICT, WARM, Scheduler
+from coupons.views import CheckCouponView
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.utils import timezone
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+@mock.patch("coupons.cache.LOOKUP_CACHE", "default")
+class LookupCacheTestCase(TransactionTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        now = timezone.now()
+        self.coupon = Coupon.objects.create_coupon('monetary', 'discount', 100)
+        self.upcoming = Coupon.objects.create_coupon(
+            'monetary', 'discount', 100, valid_from=now + timedelta(seconds=30), valid_until=now + timedelta(hours=1),
+        )
+
+    def cached(self, coupon):
+        return caches["default"].get(cache.make_key(coupon.normalized_code))
+
+    def test_get_active(self):
+        self.assertEqual(cache.get_active(self.coupon.code), [self.coupon])
+        cache.warm([self.upcoming.normalized_code])
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_active(self.coupon.code.lower()), [self.coupon])
+            self.assertEqual(cache.get_active(self.upcoming.code), [])
+        self.coupon.save()
+        self.assertIsNone(self.cached(self.coupon))
+
+    def test_check_view(self):
+        cache.warm([self.coupon.normalized_code])
+        request = RequestFactory().post("/check", {"code": self.coupon.code})
+        request.user = User.objects.create_user(username="user")
+        # only the usage is read from the database
+        with self.assertNumQueries(1):
+            self.assertEqual(CheckCouponView.as_view()(request).status_code, 200)
+
+    def test_scheduler(self):
+        scheduler = Scheduler(lead=60, horizon=7200)
+        now = timezone.now()
+        scheduler.refresh(now)
+        self.assertEqual(sorted(kind for when, kind, instant in scheduler.heap), [EVICT, WARM])
+        scheduler.refresh(now)
+        self.assertEqual(len(scheduler.heap), 2)
+        self.assertEqual(scheduler.run_pending(now), 1)
+        self.assertEqual(self.cached(self.upcoming), [self.upcoming])
+        self.assertEqual(scheduler.run_pending(now + timedelta(hours=1)), 1)
+        self.assertIsNone(self.cached(self.upcoming))
+        self.assertEqual(scheduler.heap, [])
+
+    def test_run_once(self):
+        sleep = mock.Mock()
+        Scheduler(lead=60).run(once=True, sleep=sleep)
+        self.assertEqual(self.cached(self.upcoming), [self.upcoming])
+        sleep.assert_not_called()
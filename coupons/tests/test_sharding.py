@@ -0,0 +1,154 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from coupons import cache, sharding
+from coupons.exports import iter_coupons
+from coupons.imports import CouponImporter
+from coupons.models import Campaign, CampaignStats, Coupon, CouponUser, RedemptionRollup, RollupCursor
+from coupons.scheduler import EVICT, WARM, Scheduler
+from coupons.views import BatchCheckCouponView, CheckCouponView, RedemptionHistoryView, WalletView
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.utils import timezone
+
+SHARDS = ["shard0", "shard1"]
+
+
+@override_settings(DATABASE_ROUTERS=["coupons.sharding.ShardRouter"])
+@mock.patch("coupons.sharding.SHARDS", SHARDS)
+class ShardingTestCase(TransactionTestCase):
+    databases = {"default", "shard0", "shard1"}
+
+    def setUp(self):
+        # the rows referenced by coupons exist on every shard
+        self.user = User.objects.create_user(username="user")
+        self.campaign = Campaign.objects.create(name="campaign")
+        for alias in SHARDS:
+            User.objects.using(alias).create(pk=self.user.pk, username="user")
+            Campaign.objects.using(alias).create(pk=self.campaign.pk, name="campaign")
+
+    def count(self, alias):
+        return Coupon.objects.using(alias).count()
+
+    def post(self, view, user, data):
+        request = RequestFactory().post("/check", data)
+        request.user = user
+        return json.loads(view.as_view()(request).content.decode("utf-8"))
+
+    def test_placement(self):
+        coupons = Coupon.objects.create_coupons(20, 'monetary', 'discount', 100, campaign=self.campaign)
+        self.assertEqual(self.count("default"), 0)
+        self.assertTrue(self.count("shard0") and self.count("shard1"))
+        for coupon in coupons:
+            self.assertEqual(coupon._state.db, sharding.get_shard(coupon.code))
+            self.assertTrue(Coupon.objects.for_code(coupon.code).filter(pk=coupon.pk).exists())
+        self.assertEqual(len(list(iter_coupons(Coupon.objects.all(), chunk_size=3))), 20)
+
+    @mock.patch("coupons.sharding.SHARD_BY", "prefix")
+    @mock.patch("coupons.sharding.SHARD_PREFIXES", {"vip": "shard1"})
+    def test_prefix(self):
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, prefix="VIP")
+        self.assertEqual(coupon._state.db, "shard1")
+        self.assertEqual(sharding.get_shard(coupon.code.lower()), "shard1")
+
+    def test_redeem(self):
+        coupons = Coupon.objects.create_coupons(4, 'monetary', 'discount', 100, campaign=self.campaign)
+        coupon_user = Coupon.objects.redeem(coupons[0].code, self.user)
+        self.assertEqual(coupon_user._state.db, coupons[0]._state.db)
+        self.assertEqual(CouponUser.objects.using(coupon_user._state.db).count(), 1)
+        self.assertFalse(Coupon.objects.for_code(coupons[0].code).get(pk=coupons[0].pk).is_usable)
+        self.assertEqual(self.post(CheckCouponView, self.user, {"code": coupons[0].code})["status"], 409)
+        self.assertEqual(self.post(CheckCouponView, self.user, {"code": coupons[1].code})["status"], 200)
+        results = self.post(BatchCheckCouponView, self.user, {"codes": [coupon.code for coupon in coupons]})["data"]
+        self.assertEqual([results[coupon.code]["status"] for coupon in coupons], [409, 200, 200, 200])
+
+    def test_purge(self):
+        Coupon.objects.create_coupons(10, 'monetary', 'discount', 100, campaign=self.campaign)
+        self.assertEqual(Campaign.objects.purge(self.campaign, chunk_size=3), 10)
+        for alias in ["default"] + SHARDS:
+            self.assertFalse(Campaign.objects.using(alias).exists())
+            self.assertEqual(Coupon.objects.using(alias).count(), 0)
+
+    def test_campaign_stats(self):
+        coupons = Coupon.objects.create_coupons(10, 'monetary', 'discount', 100, campaign=self.campaign)
+        coupons[0].redeem(self.user)
+        coupons[1].redeem(self.user)
+        stats = CampaignStats.objects.compute([self.campaign])[self.campaign.pk]
+        self.assertEqual((stats["total"], stats["used"], stats["redeemed"]), (10, 2, 2))
+        self.assertIsNotNone(stats["last_redeemed_at"])
+
+    def test_stats_after_commit(self):
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign)
+        with self.assertRaises(ValueError):
+            with transaction.atomic(using=coupon._state.db):
+                coupon.redeem(self.user)
+                raise ValueError()
+        self.assertEqual(CampaignStats.objects.get(campaign=self.campaign).redeemed, 0)
+        coupon.redeem(self.user)
+        self.assertEqual(CampaignStats.objects.get(campaign=self.campaign).redeemed, 1)
+
+    def get(self, view, **params):
+        request = RequestFactory().get("/", params)
+        request.user = self.user
+        return json.loads(view.as_view()(request).content.decode("utf-8"))["data"]
+
+    def test_wallet(self):
+        coupons = Coupon.objects.create_coupons(6, 'monetary', 'discount', 100, campaign=self.campaign)
+        with mock.patch.object(WalletView, "per_page", 2):
+            pages = [self.get(WalletView)]
+            while pages[-1]["next"] is not None:
+                pages.append(self.get(WalletView, after=pages[-1]["next"]))
+        codes = [coupon["code"] for page in pages for coupon in page["results"]]
+        self.assertCountEqual(codes, [coupon.code for coupon in coupons])
+
+    def test_history(self):
+        coupons = Coupon.objects.create_coupons(6, 'monetary', 'discount', 100, campaign=self.campaign)
+        for coupon in coupons:
+            coupon.redeem(self.user)
+        with mock.patch.object(RedemptionHistoryView, "per_page", 4):
+            page = self.get(RedemptionHistoryView)
+            self.assertEqual(len(self.get(RedemptionHistoryView, after=page["next"])["results"]), 2)
+        self.assertEqual([redemption["code"] for redemption in page["results"]], [coupon.code for coupon in coupons[:1:-1]])  # noqa: E501
+
+    def test_roll_up(self):
+        coupons = Coupon.objects.create_coupons(6, 'monetary', 'discount', 100, campaign=self.campaign)
+        for coupon in coupons:
+            coupon.redeem(self.user)
+        self.assertEqual(RedemptionRollup.objects.roll_up(batch_size=2, safety_margin=0), 6)
+        self.assertEqual(RedemptionRollup.objects.roll_up(safety_margin=0), 0)
+        self.assertCountEqual(RollupCursor.objects.values_list("name", flat=True), ["redemptions:shard0", "redemptions:shard1"])  # noqa: E501
+
+    def test_allow_migrate(self):
+        router = sharding.ShardRouter()
+        self.assertTrue(router.allow_migrate("shard0", "coupons", "coupon"))
+        self.assertIsNone(router.allow_migrate("default", "coupons", "coupon"))
+
+    def test_import(self):
+        codes = ["IMPORT{}".format(i) for i in range(10)]
+        importer = CouponImporter('monetary', 'discount', 100, campaign=self.campaign, batch_size=4)
+        importer.run(enumerate(codes + codes[:2], start=1))
+        self.assertEqual((importer.imported, importer.skipped), (10, 2))
+        self.assertEqual(self.count("default"), 0)
+        for code in codes:
+            self.assertEqual(Coupon.objects.get_by_code(code)._state.db, sharding.get_shard(code))
+        self.assertEqual(self.post(CheckCouponView, self.user, {"code": codes[0]})["status"], 200)
+        self.assertEqual(CampaignStats.objects.get(campaign=self.campaign).total, 10)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    @mock.patch("coupons.cache.LOOKUP_CACHE", "default")
+    def test_scheduler(self):
+        caches["default"].clear()
+        now = timezone.now()
+        valid_from, valid_until = now + timedelta(seconds=30), now + timedelta(hours=1)
+        coupons = Coupon.objects.create_coupons(
+            6, 'monetary', 'discount', 100, valid_from=valid_from, valid_until=valid_until,
+        )
+        scheduler = Scheduler(lead=60, horizon=7200)
+        scheduler.refresh(now)
+        self.assertEqual(sorted(kind for when, kind, instant in scheduler.heap), [EVICT, WARM])
+        scheduler.run_pending(now)
+        for coupon in coupons:
+            self.assertIsNotNone(caches["default"].get(cache.make_key(coupon.normalized_code)))
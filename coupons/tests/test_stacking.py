@@ -0,0 +1,108 @@
+from unittest import mock
+
+from coupons import stacking
+from coupons.models import Campaign, Coupon, StackingRule
+from django.test import TestCase, TransactionTestCase
+
+
+class StackingTestCase(TestCase):
+    def setUp(self):
+        stacking.invalidate()
+        self.x = Campaign.objects.create(name="x")
+        self.y = Campaign.objects.create(name="y")
+        StackingRule.objects.create(name="one percentage", type="percentage", max_coupons=1)
+        StackingRule.objects.create(name="two discounts", action="discount", max_coupons=2)
+        StackingRule.objects.create(name="x excludes y", campaign=self.x).excluded_campaigns.add(self.y)
+
+    def tearDown(self):
+        stacking.invalidate()
+
+    def coupon(self, type="monetary", campaign=None):
+        return Coupon(type=type, action="discount", value=10, campaign=campaign)
+
+    def names(self, coupons):
+        return sorted(violation.rule.name for violation in stacking.compile_ruleset().check(coupons))
+
+    def test_limits(self):
+        self.assertEqual(self.names([self.coupon("percentage"), self.coupon()]), [])
+        self.assertEqual(self.names([self.coupon("percentage"), self.coupon("percentage")]), ["one percentage"])
+        self.assertEqual(self.names([self.coupon(), self.coupon(), self.coupon()]), ["two discounts"])
+
+    def test_exclusions(self):
+        self.assertEqual(self.names([self.coupon(campaign=self.x), self.coupon(campaign=self.x)]), [])
+        self.assertEqual(self.names([self.coupon(campaign=self.y), self.coupon(campaign=self.x)]), ["x excludes y"])
+        # only the rule of x excludes y, not the other way around
+        rule = StackingRule.objects.create(name="y only", campaign=self.y)
+        rule.excluded_campaigns.add(self.y)
+        self.assertEqual(self.names([self.coupon(campaign=self.y), self.coupon(campaign=self.y)]), ["y only", "y only"])
+
+    def test_no_queries(self):
+        ruleset = stacking.compile_ruleset()
+        coupons = [self.coupon(campaign=self.x), self.coupon("percentage", campaign=self.y)]
+        with self.assertNumQueries(0):
+            with self.assertRaises(Coupon.StackingError):
+                ruleset.validate(coupons)
+
+    def test_inactive(self):
+        StackingRule.objects.update(is_active=False)
+        self.assertEqual(self.names([self.coupon(campaign=self.y), self.coupon(campaign=self.x)]), [])
+
+
+class StackingCacheTestCase(TransactionTestCase):
+    def tearDown(self):
+        stacking.invalidate()
+
+    def test_invalidation(self):
+        stacking.invalidate()
+        coupons = [Coupon(type="monetary", action="discount", value=10) for i in range(2)]
+        self.assertEqual(stacking.check(coupons), [])
+        with self.assertNumQueries(0):
+            stacking.check(coupons)
+        rule = StackingRule.objects.create(name="one coupon", max_coupons=1)
+        self.assertEqual(len(stacking.check(coupons)), 1)
+        rule.delete()
+        self.assertEqual(stacking.check(coupons), [])
+
+    @mock.patch("coupons.stacking.STACKING_RULES_TTL", 0)
+    @mock.patch("coupons.stacking.STACKING_CACHE", "default")
+    def test_other_process(self):
+        stacking.invalidate()
+        coupons = [Coupon(type="monetary", action="discount", value=10) for i in range(2)]
+        self.assertEqual(stacking.check(coupons), [])
+        # a change made by another process only bumps the shared version
+        with mock.patch("coupons.stacking.invalidate"):
+            StackingRule.objects.create(name="one coupon", max_coupons=1)
+        self.assertEqual(stacking.check(coupons), [])
+        stacking.get_cache().incr(stacking.VERSION_KEY)
+        self.assertEqual(len(stacking.check(coupons)), 1)
+
+    def test_invalidation_signals(self):
+        x, y = Campaign.objects.create(name="x"), Campaign.objects.create(name="y")
+        rule = StackingRule.objects.create(name="x excludes y", campaign=x)
+        coupons = [Coupon(type="monetary", action="discount", value=10, campaign=campaign) for campaign in (x, y)]
+        self.assertEqual(stacking.check(coupons), [])
+        rule.excluded_campaigns.add(y)
+        self.assertEqual(len(stacking.check(coupons)), 1)
+        StackingRule.objects.update(is_active=False)
+        self.assertEqual(stacking.check(coupons), [])
+        StackingRule.objects.update(is_active=True)
+        self.assertEqual(len(stacking.check(coupons)), 1)
+        y.delete()
+        self.assertEqual(stacking.check(coupons[:1]), [])
+        StackingRule.objects.create(name="one", max_coupons=1)
+        self.assertEqual(len(stacking.check(coupons[:1] * 2)), 1)
+        x.delete()
+        self.assertFalse(StackingRule.objects.filter(name="x excludes y").exists())
+        StackingRule.objects.all().delete()
+        self.assertEqual(stacking.check(coupons[:1] * 2), [])
+
+    def test_ttl_without_cache(self):
+        self.assertIsNone(stacking.get_cache())
+        coupons = [Coupon(type="monetary", action="discount", value=10) for i in range(2)]
+        self.assertEqual(stacking.check(coupons), [])
+        with mock.patch("coupons.stacking.invalidate"):
+            StackingRule.objects.create(name="one coupon", max_coupons=1)
+        self.assertEqual(stacking.check(coupons), [])
+        # without a shared version the rules of another process are recompiled once the ttl expired
+        with mock.patch("coupons.stacking.STACKING_RULES_TTL", 0):
+            self.assertEqual(len(stacking.check(coupons)), 1)
@@ -0,0 +1,50 @@
+from datetime import timedelta
+from io import StringIO
+
+from coupons.models import Campaign, CampaignStats, Coupon
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+User = get_user_model()
+
+
+class CampaignStatsTestCase(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name="test")
+        self.user = User.objects.create_user(username="user1")
+
+    def test_create_coupons(self):
+        Coupon.objects.create_coupons(
+            quantity=10, type='monetary', action='discount', value=100, campaign=self.campaign,
+        )
+        Coupon.objects.create_coupon(type='monetary', action='discount', value=100, campaign=self.campaign)
+        self.assertEqual(CampaignStats.objects.get(campaign=self.campaign).total, 11)
+
+    def test_redeem(self):
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign, user_limit=2)
+        coupon.redeem(self.user)
+        redemption = coupon.redeem()
+        stats = CampaignStats.objects.get(campaign=self.campaign)
+        self.assertEqual(stats.used, 1)
+        self.assertEqual(stats.redeemed, 2)
+        self.assertEqual(stats.last_redeemed_at, redemption.redeemed_at)
+
+    def test_missing_row_is_rebuilt(self):
+        coupon = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign)
+        CampaignStats.objects.all().delete()
+        coupon.redeem(self.user)
+        stats = CampaignStats.objects.get(campaign=self.campaign)
+        self.assertEqual((stats.total, stats.used, stats.redeemed), (1, 1, 1))
+
+    def test_drift_and_rebuild(self):
+        Coupon.objects.create_coupons(quantity=3, type='monetary', action='discount', value=100, campaign=self.campaign)
+        Coupon.objects.create(type='monetary', value=100, campaign=self.campaign, valid_until=timezone.now() - timedelta(1))  # noqa
+        self.assertEqual(CampaignStats.objects.drift([self.campaign]), {self.campaign.pk: {"total": (3, 4)}})
+        with self.assertRaises(CommandError):
+            call_command("check_campaign_stats", stdout=StringIO())
+        call_command("rebuild_campaign_stats", "--chunk-size", "1", stdout=StringIO())
+        self.assertEqual(CampaignStats.objects.drift([self.campaign]), {})
+        stats = CampaignStats.objects.get(campaign=self.campaign)
+        self.assertEqual((stats.total, stats.expired), (4, 1))
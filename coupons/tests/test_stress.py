@@ -0,0 +1,15 @@
+import io
+
+from coupons.tests import stress
+from django.test import TransactionTestCase
+
+
+class StressTestCase(TransactionTestCase):
+    def test_run(self):
+        results = stress.run([1, 3], attempts=5, workers=1)
+        self.assertEqual([result["redeemed"] for result in results], [1, 3])
+        self.assertEqual([result["rejected"] for result in results], [4, 2])
+        self.assertEqual([result["over_redeemed"] for result in results], [0, 0])
+        out = io.StringIO()
+        stress.report(results, out=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
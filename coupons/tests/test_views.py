@@ -0,0 +1,48 @@
+import json
+from unittest import mock
+
+from coupons.models import Coupon
+from coupons.views import BatchCheckCouponView
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+
+class BatchCheckCouponViewTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", password="password")
+        self.client.force_login(self.user)
+        self.coupon = Coupon.objects.create_coupon('monetary', 'discount', 100)
+        self.redeemed = Coupon.objects.create_coupon('percentage', 'discount', 10)
+        self.redeemed.redeem(self.user)
+
+    def post(self, codes):
+        response = self.client.post(reverse("coupons-check-batch"), {"codes": codes})
+        return response.status_code, json.loads(response.content.decode("utf-8"))
+
+    def test_status_map(self):
+        status, content = self.post([self.coupon.code, self.redeemed.code, "missing", self.coupon.code])
+        self.assertEqual(status, 200)
+        data = content["data"]
+        self.assertEqual(list(data), [self.coupon.code, self.redeemed.code, "missing"])
+        self.assertEqual(data[self.coupon.code]["status"], 200)
+        self.assertEqual(data[self.coupon.code]["data"], {"value": 100, "code": self.coupon.code, "type": "monetary"})
+        self.assertEqual(data[self.redeemed.code]["status"], 409)
+        self.assertEqual(data["missing"]["status"], 404)
+
+    def test_single_check_agrees(self):
+        for code in [self.coupon.code, self.redeemed.code, "missing"]:
+            single = json.loads(self.client.post(reverse("coupons-check"), {"code": code}).content.decode("utf-8"))
+            status, content = self.post([code])
+            self.assertEqual(content["data"][code], single)
+
+    def test_empty_code(self):
+        for data in [{}, {"code": " - "}]:
+            response = self.client.post(reverse("coupons-check"), data)
+            self.assertEqual(response.status_code, 400)
+
+    def test_too_many_codes(self):
+        with mock.patch.object(BatchCheckCouponView, "max_codes", 1):
+            status, content = self.post(["a", "b"])
+        self.assertEqual(status, 400)
+        self.assertEqual(content["status"], 400)
@@ -0,0 +1,88 @@
+import json
+from unittest import mock
+
+from coupons.imports import CouponImporter
+from coupons.models import Campaign, Coupon, CouponUser
+from coupons.views import WalletView
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+
+class WalletTestMixin:
+    def setUp(self):
+        self.user = User.objects.create_user(username="user")
+        self.other = User.objects.create_user(username="other")
+        self.campaign = Campaign.objects.create(name="test")
+        # the binding is a use of the coupon
+        self.bound = Coupon.objects.create_coupon('monetary', 'discount', 100, users=[self.user], user_limit=2)
+        self.foreign = Coupon.objects.create_coupon('monetary', 'discount', 100, users=[self.other], user_limit=2)
+        self.open = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign, user_limit=2)
+        self.held = Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign, user_limit=3)
+        # not usable: redeem() rejects them, the wallet does not list them
+        Coupon.objects.create_coupon('monetary', 'discount', 100, users=[self.user])
+        Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign, user_limit=0)
+        # open coupons outside campaigns are not listed
+        Coupon.objects.create_coupon('monetary', 'discount', 100)
+
+    def get(self, user, **params):
+        request = RequestFactory().get("/wallet", params)
+        request.user = user
+        return json.loads(WalletView.as_view()(request).content.decode("utf-8"))["data"]
+
+
+class WalletTestCase(WalletTestMixin, TestCase):
+    def test_for_user(self):
+        with self.assertNumQueries(1):
+            coupons = list(Coupon.objects.for_user(self.user).order_by("pk"))
+        self.assertEqual(coupons, [self.bound, self.open, self.held])
+        self.assertEqual(list(Coupon.objects.for_user(AnonymousUser())), [])
+        self.assertEqual(list(Coupon.objects.for_user(self.user, campaigns=[])), [self.bound])
+
+    def test_redeemed(self):
+        self.open.redeem(self.user)
+        self.open.redeem(self.other)
+        CouponUser.objects.create(coupon=self.held, user=self.user, redeemed_at=timezone.now())
+        self.assertEqual(list(Coupon.objects.for_user(self.user)), [self.bound])
+        self.assertEqual(list(Coupon.objects.for_user(self.other)), [self.foreign])
+
+    def test_held(self):
+        self.held.reserve()
+        self.held.reserve()
+        self.assertEqual(list(Coupon.objects.for_user(self.user).order_by("pk")), [self.bound, self.open, self.held])
+        self.held.reserve()
+        self.assertEqual(list(Coupon.objects.for_user(self.user).order_by("pk")), [self.bound, self.open])
+
+    @mock.patch.object(WalletView, "per_page", 2)
+    def test_view(self):
+        page = self.get(self.user)
+        self.assertEqual([coupon["code"] for coupon in page["results"]], [self.bound.code, self.open.code])
+        page = self.get(self.user, after=page["next"])
+        self.assertEqual([coupon["code"] for coupon in page["results"]], [self.held.code])
+        self.assertIsNone(page["next"])
+
+
+class WalletCacheTestCase(WalletTestMixin, TransactionTestCase):
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    @mock.patch("coupons.wallet.WALLET_CACHE", "default")
+    def test_cache(self):
+        cache.clear()
+        self.assertEqual(len(self.get(self.user)["results"]), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.get(self.user)["results"]), 3)
+        self.open.redeem(self.user)
+        self.assertEqual(len(self.get(self.user)["results"]), 2)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    @mock.patch("coupons.wallet.WALLET_CACHE", "default")
+    def test_cache_created(self):
+        cache.clear()
+        self.assertEqual(len(self.get(self.other)["results"]), 3)
+        Coupon.objects.create_coupon('monetary', 'discount', 100, campaign=self.campaign)
+        self.assertEqual(len(self.get(self.other)["results"]), 4)
+        Coupon.objects.create_coupons(2, 'monetary', 'discount', 100, campaign=self.campaign)
+        self.assertEqual(len(self.get(self.other)["results"]), 6)
+        importer = CouponImporter('monetary', 'discount', 100, campaign=self.campaign)
+        importer.flush([(1, "WALLET1")])
+        self.assertEqual(len(self.get(self.other)["results"]), 7)
@@ -0,0 +1,11 @@
+try:
+    from django.urls import include, re_path as url
+except ImportError:
+    from django.conf.urls import include, url
+
+from django.contrib import admin
+
+urlpatterns = [
+    url(r"^admin/", admin.site.urls),
+    url(r"^coupons/", include("coupons.urls")),
+]
@@ -7,4 +7,8 @@ from . import views
 
 urlpatterns = [
     url(r"^check$", views.CheckCouponView.as_view(), name="coupons-check"),
+    url(r"^check/batch$", views.BatchCheckCouponView.as_view(), name="coupons-check-batch"),
+    url(r"^wallet$", views.WalletView.as_view(), name="coupons-wallet"),
+    url(r"^history$", views.RedemptionHistoryView.as_view(), name="coupons-history"),
+    url(r"^metrics$", views.MetricsView.as_view(), name="coupons-metrics"),
 ]
@@ -26,28 +26,37 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import csv
+import io
+import tempfile
+from itertools import chain
 
-from django.core.exceptions import PermissionDenied
-from django.http import Http404, StreamingHttpResponse
+from django.conf import settings
+from django.contrib.admin.utils import display_for_field, display_for_value, flatten_fieldsets, lookup_field
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied, SuspiciousOperation, ValidationError
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.translation import gettext, gettext_lazy as _
 from django.views import View
 from django.views.generic.base import TemplateView
 from fluo.http import JsonResponse
 
-from .forms import CouponGenerationForm
-from .models import Coupon
-
-
-class Echo:
-    def write(self, value):
-        return value
+from . import cache, exports, metrics, ratelimit, routers, sharding, wallet
+from .exports import Echo  # noqa: F401
+from .forms import CouponGenerationForm, CouponImportForm
+from .imports import CouponImporter, read_codes
+from .models import Campaign, Coupon, CouponUser
+from .pagination import decode_cursor, encode_cursor
+from .settings import BATCH_CHECK_MAX_CODES, HISTORY_PER_PAGE, WALLET_PER_PAGE
 
 
 class GenerateCouponsAdminView(TemplateView):
     form = CouponGenerationForm
     template_name = "admin/coupons/generate_coupons.html"
 
+    def dispatch(self, request, *args, **kwargs):
+        with metrics.timer("coupons_generate_seconds", method=request.method.lower()):
+            return super().dispatch(request, *args, **kwargs)
+
     def get(self, request, *args, **kwargs):
         context = self.get_context_data(**kwargs)
         context["form"] = self.form()
@@ -55,21 +64,13 @@ class GenerateCouponsAdminView(TemplateView):
 
     def get_elements_as_csv(self, coupons):
         count = 0
-        yield [_("Count"), _("ID"), _("Code"), _("Value"), _("Start Date"), _("Expiration Date"), _("Campaign")]
+        yield exports.get_csv_header()
         for item in coupons:
             count += 1
             yield self.to_csv(count, item)
 
     def to_csv(self, count, coupon):
-        return [
-            count,
-            coupon.pk,
-            coupon.code,
-            coupon.value,
-            coupon.valid_from.strftime("%Y-%m-%d %H:%M:%S") if coupon.valid_from else "",
-            coupon.valid_until.strftime("%Y-%m-%d %H:%M:%S") if coupon.valid_until else "",
-            coupon.campaign if coupon.campaign else "",
-        ]
+        return exports.to_csv(count, coupon)
 
     def post(self, request, *args, **kwargs):
         context = self.get_context_data(**kwargs)
@@ -101,45 +102,171 @@ class GenerateCouponsAdminView(TemplateView):
         return self.render_to_response(context)
 
 
+class ImportCouponsAdminView(TemplateView):
+    form = CouponImportForm
+    template_name = "admin/coupons/import_coupons.html"
+
+    def get(self, request, *args, **kwargs):
+        context = self.get_context_data(**kwargs)
+        context["form"] = self.form()
+        return self.render_to_response(context)
+
+    def post(self, request, *args, **kwargs):
+        context = self.get_context_data(**kwargs)
+        form = self.form(self.request.POST, self.request.FILES)
+        if form.is_valid():
+            # the report of rejected rows is spooled to disk when it grows, and returned as download
+            report = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            text = io.TextIOWrapper(report, encoding="utf-8", newline="")
+            rejected = csv.writer(text)
+            rejected.writerow(["line", "code", "reason"])
+            importer = CouponImporter(
+                type=form.cleaned_data["type"],
+                action=form.cleaned_data["action"],
+                value=form.cleaned_data["value"],
+                campaign=form.cleaned_data["campaign"],
+                user_limit=form.cleaned_data["user_limit"],
+                valid_from=form.cleaned_data["valid_from"],
+                valid_until=form.cleaned_data["valid_until"],
+                rejected=rejected,
+            )
+            upload = io.TextIOWrapper(form.cleaned_data["file"].file, encoding="utf-8-sig", newline="")
+            importer.run(read_codes(upload))
+            rejected.writerow([])
+            rejected.writerow(["read", "imported", "rejected"])
+            rejected.writerow([importer.read, importer.imported, importer.skipped])
+            text.flush()
+            text.detach()
+            report.seek(0)
+            response = FileResponse(report, content_type="text/csv")
+            response["Content-Disposition"] = "attachment; filename=coupons-import{}.csv".format(
+                timezone.now().strftime("-%Y%m%d-%H%M%S"),
+            )
+            return response
+        context["form"] = form
+        return self.render_to_response(context)
+
+
+class InlinePageAdminView(View):
+    """ Returns, as json, the rows of a paginated inline following the ``after`` primary key. """
+    inline = None
+
+    def get_row(self, obj, fields):
+        row = []
+        for name in fields:
+            field, attr, value = lookup_field(name, obj, self.inline)
+            if field is None:
+                row.append(str(display_for_value(value, self.inline.get_empty_value_display())))
+            elif field.is_relation:
+                row.append(str(value) if value is not None else self.inline.get_empty_value_display())
+            else:
+                row.append(str(display_for_field(value, field, self.inline.get_empty_value_display())))
+        return {"original": str(obj), "fields": row}
+
+    def get_fk(self):
+        """ Returns the foreign key of the inline model to the parent model. """
+        inline = self.inline
+        if inline.fk_name:
+            return inline.model._meta.get_field(inline.fk_name)
+        for field in inline.model._meta.get_fields():
+            if field.many_to_one and field.related_model is inline.parent_model:
+                return field
+        raise ImproperlyConfigured("{} has no foreign key to {}.".format(inline.model, inline.parent_model))
+
+    def get(self, request, object_id):
+        inline = self.inline
+        if not inline.has_change_permission(request):
+            raise PermissionDenied
+        fk = self.get_fk()
+        try:
+            object_id = inline.parent_model._meta.pk.to_python(object_id)
+        except ValidationError:
+            raise Http404
+        queryset = inline.get_queryset(request).filter(**{fk.name: object_id})
+        queryset = queryset.select_related(*inline.list_select_related).order_by("pk")
+        after = request.GET.get("after")
+        if after:
+            try:
+                after = int(after)
+            except ValueError:
+                return HttpResponseBadRequest()
+            queryset = queryset.filter(pk__gt=after)
+        objects = list(queryset[:inline.per_page + 1])
+        fields = [name for name in flatten_fieldsets(inline.get_fieldsets(request)) if name != fk.name]
+        data = {
+            "results": [self.get_row(obj, fields) for obj in objects[:inline.per_page]],
+            "next": None,
+        }
+        if len(objects) > inline.per_page:
+            data["next"] = "{}?after={}".format(request.path, objects[inline.per_page - 1].pk)
+        return JsonResponse(data)
+
+
 class CheckCouponView(View):
     def handle(self, request, coupon):
         return True
 
     def get_queryset(self):
         code = self.request.POST.get("code")
-        return Coupon.objects.active().filter(code=code)
+        return Coupon.objects.filter_code(code).active()
 
     def get_object(self):
-        queryset = self.get_queryset()
+        code = self.request.POST.get("code")
+        if not Coupon.normalize_code(code):
+            # an empty normalized code would match the coupons not normalized yet
+            raise SuspiciousOperation("Empty code.")
+        candidates = cache.get_active(code)
+        if candidates is None:
+            candidates = self.get_queryset()
         try:
-            return queryset.get()
+            coupon = Coupon.match_code(code, candidates)
         except Coupon.DoesNotExist:
+            metrics.incr("coupons_lookups_total", source="check", outcome="missing")
             raise Http404
+        metrics.incr("coupons_lookups_total", source="check", outcome="found")
+        return coupon
 
-    def handle_exception(self, request, exc, *args, **kwargs):
+    def get_status(self, exc):
         if isinstance(exc, Http404):
-            status, message = 404, _("Not found")
+            return 404, _("Not found")
         elif isinstance(exc, PermissionDenied):
-            status, message = 403, _("Permission denied.")
+            return 403, _("Permission denied.")
+        elif isinstance(exc, SuspiciousOperation):
+            return 400, _("Bad request.")
+        elif isinstance(exc, Coupon.RateLimitError):
+            return 429, _("Too many requests.")
         elif isinstance(exc, (Coupon.ExpiredError, Coupon.IsUsableError)):
-            status, message = 409, _("Coupon expired.")
-        else:
-            status, message = 500, str(exc)
+            return 409, _("Coupon expired.")
+        return 500, str(exc)
+
+    def handle_exception(self, request, exc, *args, **kwargs):
+        status, message = self.get_status(exc)
+        metrics.incr("coupons_checks_total", status=status)
         data = {'detail': message}
-        return JsonResponse({"status": status, "message": message, "data": data}, status=status)
+        response = JsonResponse({"status": status, "message": message, "data": data}, status=status)
+        if getattr(exc, "retry_after", None):
+            response["Retry-After"] = str(exc.retry_after)
+        return response
 
-    def post(self, request):
-        coupon = self.get_object()
+    def get_ratelimit_cost(self):
+        return 1
+
+    def check(self, request, coupon):
         if not coupon.is_usable:
             raise Coupon.IsUsableError()
         if coupon.is_expired:
             raise Coupon.ExpiredError()
         self.handle(request, coupon)
-        status, message, data = 200, gettext("ok"), {
+        return {
             "value": coupon.value,
             "code": coupon.code,
             "type": coupon.type,
         }
+
+    def post(self, request):
+        coupon = self.get_object()
+        status, message, data = 200, gettext("ok"), self.check(request, coupon)
+        metrics.incr("coupons_checks_total", status=status)
         return JsonResponse({"status": status, "message": message, "data": data}, status=status)
 
     def dispatch(self, request, *args, **kwargs):
@@ -149,9 +276,198 @@ class CheckCouponView(View):
         self.kwargs = kwargs
         self.request = request
 
+        with metrics.timer("coupons_check_seconds"):
+            try:
+                ratelimit.check_request(request, "check", cost=self.get_ratelimit_cost())
+                with routers.sticky(request.user):
+                    response = super().dispatch(request, *args, **kwargs)
+            except Exception as exc:
+                response = self.handle_exception(request, exc, *args, **kwargs)
+
+        return response
+
+
+class BatchCheckCouponView(CheckCouponView):
+    """
+    Checks every ``codes`` value of the POST in a single query, the response ``data`` maps each code to the same
+    status, message and data envelope returned by ``CheckCouponView`` for that code alone.
+    """
+    max_codes = BATCH_CHECK_MAX_CODES
+
+    def get_codes(self):
+        codes = []
+        for code in self.request.POST.getlist("codes"):
+            if code and code not in codes:
+                codes.append(code)
+        if len(codes) > self.max_codes:
+            raise SuspiciousOperation("Too many codes.")
+        return codes
+
+    def get_ratelimit_cost(self):
+        # every code is a guess
+        return max(1, len(self.request.POST.getlist("codes")))
+
+    def get_queryset(self):
+        return Coupon.objects.active().with_usage()
+
+    def get_coupons(self, codes):
+        """ Returns the candidates of ``codes``, fetched in parallel from the shards holding them when sharded. """
+        queryset = self.get_queryset()
+        groups = sharding.group(codes)
+
+        def fetch(alias):
+            return list(queryset.using(alias).filter_codes(groups[alias]))
+
+        return [coupon for coupons in sharding.fan_out(fetch, shards=list(groups)) for coupon in coupons]
+
+    def get_coupon(self, code, candidates):
         try:
-            response = super().dispatch(request, *args, **kwargs)
+            return Coupon.match_code(code, candidates.get(Coupon.normalize_code(code), []))
+        except Coupon.DoesNotExist:
+            return None
+
+    def check_code(self, request, coupon):
+        try:
+            if coupon is None:
+                metrics.incr("coupons_lookups_total", source="batch_check", outcome="missing")
+                raise Http404
+            metrics.incr("coupons_lookups_total", source="batch_check", outcome="found")
+            status, message, data = 200, gettext("ok"), self.check(request, coupon)
         except Exception as exc:
-            response = self.handle_exception(request, exc, *args, **kwargs)
+            status, message = self.get_status(exc)
+            data = {'detail': message}
+        metrics.incr("coupons_checks_total", status=status)
+        return {"status": status, "message": message, "data": data}
 
-        return response
+    def post(self, request):
+        codes = self.get_codes()
+        candidates = {}
+        for coupon in self.get_coupons(codes):
+            candidates.setdefault(coupon.normalized_code, []).append(coupon)
+        results = {code: self.check_code(request, self.get_coupon(code, candidates)) for code in codes}
+        status, message = 200, gettext("ok")
+        return JsonResponse({"status": status, "message": message, "data": results}, status=status)
+
+
+class WalletView(View):
+    """
+    Lists the coupons the user can still redeem, ``WALLET_PER_PAGE`` at a time. Pages are keyset paginated: ``next``
+    is the ``after`` parameter of the following page, ``null`` on the last one.
+    """
+    per_page = WALLET_PER_PAGE
+
+    def get_queryset(self):
+        return Coupon.objects.for_user(self.request.user).select_related("campaign").order_by("pk")
+
+    def to_json(self, coupon):
+        return exports.to_json(coupon)
+
+    def get_page(self, after):
+        def get_shard_page(alias):
+            queryset = self.get_queryset().using(alias)
+            if after is not None:
+                queryset = queryset.filter(pk__gt=after)
+            return list(queryset[:self.per_page + 1])
+
+        coupons = sorted(chain.from_iterable(sharding.fan_out(get_shard_page)), key=lambda coupon: coupon.pk)
+        page, rest = coupons[:self.per_page], coupons[self.per_page:]
+        # primary keys are allocated per shard, a page ends after every coupon sharing its last one
+        while rest and rest[0].pk == page[-1].pk:
+            page.append(rest.pop(0))
+        return {
+            "results": [self.to_json(coupon) for coupon in page],
+            "next": page[-1].pk if rest else None,
+        }
+
+    def get(self, request):
+        if not (request.user and request.user.is_authenticated):
+            raise PermissionDenied()
+        try:
+            after = int(request.GET["after"]) if request.GET.get("after") else None
+        except ValueError:
+            raise Http404
+        key = "{}:{}".format(self.per_page, after)
+        data = wallet.get_cached(request.user.pk, key)
+        if data is None:
+            # the page is cached, a lagging replica would keep serving coupons already redeemed or disabled
+            with routers.primary():
+                data = self.get_page(after)
+            wallet.set_cached(request.user.pk, key, data)
+        status, message = 200, gettext("ok")
+        return JsonResponse({"status": status, "message": message, "data": data}, status=status)
+
+
+class RedemptionHistoryView(View):
+    """
+    Lists the redemptions of the user, or of a ``campaign`` for staff users, newest first. Pages are keyset paginated
+    on ``(redeemed_at, id)``: ``next`` is the ``after`` parameter of the following page, ``null`` on the last one.
+    With ``format=csv`` or ``format=ndjson`` the whole history is streamed instead.
+    """
+    per_page = HISTORY_PER_PAGE
+
+    def get_queryset(self):
+        campaign = self.request.GET.get("campaign")
+        if campaign:
+            if not self.request.user.is_staff:
+                raise PermissionDenied()
+            try:
+                campaign = Campaign.objects.get(pk=campaign)
+            except (Campaign.DoesNotExist, ValueError):
+                raise Http404
+            return CouponUser.objects.history(campaign=campaign)
+        return CouponUser.objects.history(user=self.request.user)
+
+    def get_page(self, queryset, after):
+        if after:
+            try:
+                queryset = queryset.before(*decode_cursor(after))
+            except ValueError:
+                raise Http404
+        redemptions = chain.from_iterable(sharding.fan_out(
+            lambda alias: list(queryset.using(alias).with_sources()[:self.per_page + 1])
+        ))
+        redemptions = sorted(redemptions, key=lambda redemption: (redemption.redeemed_at, redemption.pk), reverse=True)
+        has_more = len(redemptions) > self.per_page
+        redemptions = redemptions[:self.per_page]
+        last = redemptions[-1] if has_more else None
+        return {
+            "results": [exports.redemption_to_json(redemption) for redemption in redemptions],
+            "next": encode_cursor(last.redeemed_at, last.pk) if last else None,
+        }
+
+    def get(self, request):
+        if not (request.user and request.user.is_authenticated):
+            raise PermissionDenied()
+        queryset = self.get_queryset()
+        format = request.GET.get("format")
+        if format:
+            if format not in exports.REDEMPTION_FORMATS:
+                raise Http404
+            content_type, chunks = exports.export_redemptions(queryset, format=format)
+            response = StreamingHttpResponse(chunks, content_type=content_type)
+            response["Content-Disposition"] = "attachment; filename=redemptions-{}.{}".format(
+                timezone.now().strftime("%Y%m%d-%H%M%S"), format,
+            )
+            return response
+        status, message = 200, gettext("ok")
+        with routers.sticky(request.user):
+            data = self.get_page(queryset, request.GET.get("after"))
+        return JsonResponse({"status": status, "message": message, "data": data}, status=status)
+
+
+class MetricsView(View):
+    """ Exposes the in-process metrics registry in the Prometheus text format. """
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def has_permission(self, request):
+        if request.user and request.user.is_active and request.user.is_staff:
+            return True
+        return request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+
+    def get(self, request):
+        if not self.has_permission(request):
+            raise PermissionDenied()
+        sink = metrics.get_sink()
+        if not isinstance(sink, metrics.RegistrySink):
+            raise Http404
+        return HttpResponse(sink.prometheus(), content_type=self.content_type)
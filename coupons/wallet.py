@@ -0,0 +1,81 @@
+# Copyright (C) 2016-2018, Raffaele Salmaso <raffaele@salmaso.org>
+# Copyright (C) 2013, byteweaver
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#     * Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of django-coupons nor the names of its contributors may
+#       be used to endorse or promote products derived from this software without
+#       specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from django.core.cache import caches
+
+from . import metrics
+from .settings import WALLET_CACHE, WALLET_CACHE_TIMEOUT
+
+
+def get_cache():
+    return caches[WALLET_CACHE] if WALLET_CACHE else None
+
+
+def make_key(cache, user_id, key):
+    """ Returns the cache key of the wallet page ``key``, under the current global and user generations. """
+    generations = cache.get_many(["coupons:wallet", "coupons:wallet:{}".format(user_id)])
+    return "coupons:wallet:{}:{}:{}:{}".format(
+        user_id, generations.get("coupons:wallet", 0), generations.get("coupons:wallet:{}".format(user_id), 0), key,
+    )
+
+
+def get_cached(user_id, key):
+    """ Returns the cached wallet page ``key`` of the user, ``None`` on a miss or without a cache. """
+    cache = get_cache()
+    if cache is None:
+        return None
+    value = cache.get(make_key(cache, user_id, key))
+    metrics.incr("coupons_cache_total", cache="wallet", outcome="miss" if value is None else "hit")
+    return value
+
+
+def set_cached(user_id, key, value):
+    cache = get_cache()
+    if cache is not None:
+        cache.set(make_key(cache, user_id, key), value, WALLET_CACHE_TIMEOUT)
+
+
+def bump(cache, key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate(user_id):
+    """ Moves the user to a new cache generation, the pages cached so far are never read again and expire. """
+    cache = get_cache()
+    if cache is not None and user_id is not None:
+        bump(cache, "coupons:wallet:{}".format(user_id))
+
+
+def invalidate_all():
+    """ Moves every user to a new cache generation, for changes to the open coupons listed in all wallets. """
+    cache = get_cache()
+    if cache is not None:
+        bump(cache, "coupons:wallet")
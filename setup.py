@@ -19,18 +19,17 @@ setup(
     url="https://bitbucket.org/rsalmaso/django-fluo-coupons",
     include_package_data=True,
     packages=find_packages(),
-    install_require=["django-fluo"],
-    python_requires='>=3.4',
+    install_require=["django>=2.1", "django-fluo"],
+    extras_require={"numpy": ["numpy"]},
+    python_requires='>=3.5',
     classifiers=[
         "Framework :: Django",
-        "Framework :: Django :: 1.10",
-        "Framework :: Django :: 1.11",
-        "Framework :: Django :: 2.0",
+        "Framework :: Django :: 2.1",
+        "Framework :: Django :: 2.2",
         "Intended Audience :: Developers",
         "License :: OSI Approved :: BSD License",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.4",
         "Programming Language :: Python :: 3.5",
         "Programming Language :: Python :: 3.6",
     ]